@@ -11,15 +11,8 @@ export const Scroll = (props) => {
     );
 }
 
-function SearchList({ students, searchStr, setSelectedStud}) {
-    const filtered = students.filter((item) => {
-        return item.user.first_name?.includes(searchStr) ||
-            item.user.last_name?.includes(searchStr) ||
-            item.user.patronymic?.includes(searchStr) ||
-            item.user.username?.includes(searchStr) ||
-            item.user.email?.includes(searchStr) ||
-            item.record_book_number?.includes(searchStr)
-    }).map((i, idx) => {
+function SearchList({ students, setSelectedStud}) {
+    const filtered = students.map((i, idx) => {
         return (
             <li className="list-group-item list-group-item-action" key={idx} onClick={(event => {setSelectedStud(i)})}>
                 {shortName(i.user)}
@@ -42,11 +35,16 @@ const StudMarks = () => {
     const [selectedStud, setSelectedStud] = useState(null)
 
     useEffect(() => {
-        (async () => {
+        if (!searchStr.trim()) {
+            setStudents([])
+            return
+        }
+        const timeout = setTimeout(async () => {
             try {
                 const {data} = await
-                    axios.get(`/api/v1/auth/users/students`,
+                    axios.get(`/api/v1/auth/users/students/search/`,
                         {
+                            params: {q: searchStr, limit: 20},
                             headers:
                                 {
                                     'Content-Type': 'application/json',
@@ -57,8 +55,9 @@ const StudMarks = () => {
             } catch (e) {
                 console.log('not working', e)
             }
-        })()
-    }, [])
+        }, 250)
+        return () => clearTimeout(timeout)
+    }, [searchStr])
 
     const handleSearchChange = (e) => {
         setSearchStr(e.target.value)
@@ -85,7 +84,7 @@ const StudMarks = () => {
                     />
 
                     <Scroll>
-                        <SearchList students={students} searchStr={searchStr} setSelectedStud={setSelectedStud}/>
+                        <SearchList students={students} setSelectedStud={setSelectedStud}/>
                     </Scroll>
                 </>
 
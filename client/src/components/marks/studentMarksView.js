@@ -15,13 +15,6 @@ export const REPORTING_LEVEL = {
     'e': "Экзамен"
 }
 
-const countMean = ({att1, att2, att3, mark_group}) => {
-    if (mark_group.reporting_level === "t") {
-        return "—"
-    }
-    return att1 && att2 && att3 && Math.round((att1 + att2 + att3) / 3)
-}
-
 const MarkComponent = ({children, isTotal=false}) => {
     let style = {backgroundColor: "rgba(0, 0, 0, 0)"};
 
@@ -45,27 +38,11 @@ const MarkComponent = ({children, isTotal=false}) => {
     return (<td style={style}>{children}</td>)
 }
 
-const countAll = ({att1, att2, att3, additional, exam, mark_group}) => {
-    if (!(att1 && att2 && att3)) {
-        return null
-    }
-
-    if (mark_group.reporting_level === "t") {
-        return Math.round((att1 + att2 + att3) / 3) * 2
-    }
-    else if (mark_group.reporting_level === "d") {
-        return (Math.round((att1 + att2 + att3) / 3) + additional)  * 2
-    }
-    else if (mark_group.reporting_level === "e") {
-        return Math.round((att1 + att2 + att3) / 3) + exam + additional
-    }
-}
-
 export const StudentView = ({studentId}) => {
     const [marksInfo, setMarksInfo] = useState([])
 
     useEffect(() => {
-        (async () => {
+        const loadMarks = async () => {
             try {
                 const {data} = await
                     axios.get(`/api/v1/marks/${studentId}`,
@@ -80,8 +57,68 @@ export const StudentView = ({studentId}) => {
             } catch (e) {
                 console.log('not working', e)
             }
-        })()
-    }, [])
+        }
+        loadMarks()
+
+        // With live updates the server pushes an event when a mark of this student changes; reload only then.
+        // Streams are opened with a short-lived token and end periodically: reopen with a new one.
+        // Otherwise poll: the ETag makes an unchanged transcript a cheap 304.
+        let events = null
+        let retry = null
+        let poll = null
+        let closed = false
+        const openEvents = async () => {
+            try {
+                const {data} = await axios.post('/api/v1/marks/events/token', null, {
+                    headers: {'Authorization': `Bearer ${localStorage.getItem('access_token')}`}
+                })
+                if (closed) {
+                    return
+                }
+                events = new EventSource(
+                    `/api/v1/marks/${studentId}/events?stream_token=${encodeURIComponent(data.token)}`)
+                events.addEventListener('mark', loadMarks)
+                events.addEventListener('resync', loadMarks)
+                events.onerror = () => {
+                    // Catch up on what changed while the stream was down.
+                    events.close()
+                    retry = setTimeout(() => openEvents().then(loadMarks), 5000)
+                }
+            } catch (e) {
+                retry = setTimeout(openEvents, 30000)
+            }
+        }
+        const startUpdates = async () => {
+            let live = false
+            let pollInterval = 60
+            try {
+                const {data} = await axios.get('/api/v1/marks/events/token', {
+                    headers: {'Authorization': `Bearer ${localStorage.getItem('access_token')}`}
+                })
+                live = data.live
+                pollInterval = data.poll_interval
+            } catch (e) {
+                console.log('not working', e)
+            }
+            if (closed) {
+                return
+            }
+            if (live) {
+                openEvents()
+            } else {
+                poll = setInterval(loadMarks, pollInterval * 1000)
+            }
+        }
+        startUpdates()
+        return () => {
+            closed = true
+            clearTimeout(retry)
+            clearInterval(poll)
+            if (events !== null) {
+                events.close()
+            }
+        }
+    }, [studentId])
 
     const currStudent = marksInfo.length && marksInfo[0].student
 
@@ -148,10 +185,10 @@ export const StudentView = ({studentId}) => {
                             <MarkComponent>{markSection.att1}</MarkComponent>
                             <MarkComponent>{markSection.att2}</MarkComponent>
                             <MarkComponent>{markSection.att3}</MarkComponent>
-                            <MarkComponent>{countMean(markSection)}</MarkComponent>
+                            <MarkComponent>{markSection.mark_group.reporting_level === "t" ? "—" : markSection.mean}</MarkComponent>
                             <MarkComponent>{["t", "d"].includes(markSection.mark_group.reporting_level) ? "—" : markSection.exam}</MarkComponent>
                             <td>{markSection.mark_group.reporting_level === "t" ? "—" : markSection.additional || 0}</td>
-                            <MarkComponent isTotal={true}>{countAll(markSection)}</MarkComponent>
+                            <MarkComponent isTotal={true}>{markSection.total}</MarkComponent>
                         </tr>
                     )
                 })
@@ -0,0 +1,113 @@
+"""Distribution statistics over columnar extracts of StudentMark rows."""
+import numpy as np
+
+from api.scoring import MARK_BANDS, TOTAL_BANDS
+
+COLUMNS = ("att1", "att2", "att3", "exam", "total")
+PERCENTILES = {"p10": 0.1, "median": 0.5, "p90": 0.9}
+CHUNK_SIZE = 20000
+
+
+def band_labels(bands):
+    bounds = (0, *bands)
+    return [f"{lo}-{hi}" for lo, hi in zip(bounds, bounds[1:])]
+
+
+def extract(queryset, keys=()):
+    """Pull `keys` and the mark columns out of the database as one float matrix (NULL becomes NaN)."""
+    fields = (*keys, *COLUMNS)
+    chunks, chunk = [], []
+    for row in queryset.values_list(*fields).iterator(chunk_size=CHUNK_SIZE):
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            chunks.append(np.array(chunk, dtype=float))
+            chunk = []
+    chunks.append(np.array(chunk, dtype=float).reshape(-1, len(fields)))
+    return np.concatenate(chunks)
+
+
+def grouped_stats(groups, n_groups, values, bands):
+    """Statistics of `values` for every group id in `groups` (0..n_groups-1), without a per-group loop."""
+    valid = ~np.isnan(values)
+    groups, values = groups[valid], values[valid]
+
+    count = np.bincount(groups, minlength=n_groups)
+    safe_count = np.maximum(count, 1)
+    mean = np.bincount(groups, weights=values, minlength=n_groups) / safe_count
+    sq_dev = (values - mean[groups]) ** 2
+    std = np.sqrt(np.bincount(groups, weights=sq_dev, minlength=n_groups) / safe_count)
+
+    # Sort by (group, value): each group's values become a contiguous ascending run,
+    # so every percentile is a linear interpolation between two positions of that run.
+    order = np.lexsort((values, groups))
+    ordered = values[order]
+    starts = np.concatenate(([0], np.cumsum(count)[:-1]))
+    quantiles = {}
+    for name, q in PERCENTILES.items():
+        pos = starts + q * np.maximum(count - 1, 0)
+        lo = np.floor(pos).astype(int)
+        hi = np.ceil(pos).astype(int)
+        if len(ordered):
+            lo, hi = np.minimum(lo, len(ordered) - 1), np.minimum(hi, len(ordered) - 1)
+            quantiles[name] = ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+        else:
+            quantiles[name] = np.zeros(n_groups)
+
+    band = np.digitize(values, bands[:-1])
+    histogram = np.bincount(groups * len(bands) + band, minlength=n_groups * len(bands)).reshape(n_groups, -1)
+
+    return {"count": count, "mean": mean, "std": std, **quantiles, "histogram": histogram}
+
+
+def _as_json(stats, idx, labels):
+    if not stats["count"][idx]:
+        return {"count": 0, "mean": None, "median": None, "p10": None, "p90": None, "std": None,
+                "histogram": dict.fromkeys(labels, 0)}
+    res = {"count": int(stats["count"][idx])}
+    for name in ("mean", "median", "p10", "p90", "std"):
+        res[name] = round(float(stats[name][idx]), 2)
+    res["histogram"] = dict(zip(labels, stats["histogram"][idx].tolist()))
+    return res
+
+
+def _columns_stats(matrix, groups, n_groups):
+    mark_labels, total_labels = band_labels(MARK_BANDS), band_labels(TOTAL_BANDS)
+    offset = matrix.shape[1] - len(COLUMNS)
+    per_column = {}
+    for i, column in enumerate(COLUMNS):
+        is_total = column == "total"
+        stats = grouped_stats(groups, n_groups, matrix[:, offset + i], TOTAL_BANDS if is_total else MARK_BANDS)
+        per_column[column] = (stats, total_labels if is_total else mark_labels)
+    return [
+        {column: _as_json(stats, idx, labels) for column, (stats, labels) in per_column.items()}
+        for idx in range(n_groups)
+    ]
+
+
+def sheet_statistics(queryset):
+    matrix = extract(queryset)
+    groups = np.zeros(len(matrix), dtype=int)
+    return {"count": len(matrix), "columns": _columns_stats(matrix, groups, 1)[0]}
+
+
+FACULTY_KEYS = ("mark_group__subject", "mark_group__subject__directions", "mark_group__semester")
+
+
+def faculty_statistics(queryset):
+    """Statistics grouped by (subject, direction, semester); subjects outside any direction get direction None."""
+    matrix = extract(queryset, FACULTY_KEYS)
+    keys = np.nan_to_num(matrix[:, :len(FACULTY_KEYS)], nan=-1).astype(np.int64)
+    unique_keys, groups = np.unique(keys, axis=0, return_inverse=True)
+    groups = groups.reshape(-1)
+    counts = np.bincount(groups, minlength=len(unique_keys))
+    columns = _columns_stats(matrix, groups, len(unique_keys))
+    return [
+        {
+            "subject": int(subject),
+            "direction": None if direction < 0 else int(direction),
+            "semester": int(semester),
+            "count": int(count),
+            "columns": stats,
+        }
+        for (subject, direction, semester), count, stats in zip(unique_keys.tolist(), counts, columns)
+    ]
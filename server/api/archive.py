@@ -0,0 +1,86 @@
+"""Archive of closed periods: mark sheets moved out of the live GroupMark/StudentMark tables.
+
+GroupMark.semester is a programme semester, so a period is closed per group: only semesters
+before the one a group is studying now can be archived (see `current_semester`).
+
+Sheets keep their ids and rows in ArchivedGroupMark/ArchivedStudentMark, so queries on
+current data scan only the live tables. Archived sheets are frozen: professors no longer
+list or edit them, while transcripts, exports, semester summaries and the change feed
+read both tables. A move is announced like any mark write, with `deleted=False`: the
+rows still exist, and readers find them in the archive.
+"""
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from api.changes import record_group_mark_change
+from api.models import GroupMark, StudentMark, ArchivedGroupMark, ArchivedStudentMark, CourseGroup
+from api.ranking import rankings
+from api.sheets import marks_changed
+
+SHEET_FIELDS = tuple(field.attname for field in GroupMark._meta.concrete_fields)
+MARK_FIELDS = tuple(field.attname for field in StudentMark._meta.concrete_fields)
+
+
+def current_semester(group, today=None):
+    """Programme semester the group is studying: odd from September to January, even from February."""
+    month = (today or timezone.localdate()).month
+    return 2 * group.course_number - (1 if month >= 9 or month == 1 else 0)
+
+
+def open_groups(through_semester, groups=None, today=None):
+    """Groups (of `groups` or all) still studying semester `through_semester` or an earlier one."""
+    course_groups = CourseGroup.objects.filter(pk__in=groups) if groups else CourseGroup.objects.all()
+    return [group for group in course_groups.order_by("pk") if current_semester(group, today) <= through_semester]
+
+
+def closed_sheets(through_semester, groups=None, archived=False, today=None):
+    """Sheets of semesters up to `through_semester`, of some groups or all of them.
+
+    Live sheets are limited to the semesters each group has finished; archived ones are not.
+    """
+    if archived:
+        sheets = ArchivedGroupMark.objects.filter(semester__lte=through_semester)
+        return (sheets.filter(group__in=groups) if groups else sheets).order_by("pk")
+    course_groups = CourseGroup.objects.filter(pk__in=groups) if groups else CourseGroup.objects.all()
+    # One condition per distinct limit, not per group.
+    limits = {}
+    for group in course_groups.only("pk", "course_number"):
+        limit = min(through_semester, current_semester(group, today) - 1)
+        if limit >= 1:
+            limits.setdefault(limit, []).append(group.pk)
+    closed = Q(pk__in=[])
+    for limit, pks in limits.items():
+        closed |= Q(group__in=pks, semester__lte=limit)
+    return GroupMark.objects.filter(closed).order_by("pk")
+
+
+def _move(sheet_pks, sheet_models, mark_models, **extra):
+    (sheets_from, sheets_to), (marks_from, marks_to) = sheet_models, mark_models
+    with transaction.atomic():
+        sheets = list(sheets_from.objects.filter(pk__in=sheet_pks).order_by("pk").values(*SHEET_FIELDS))
+        sheet_pks = [sheet["id"] for sheet in sheets]
+        marks = list(marks_from.objects.filter(mark_group__in=sheet_pks).order_by("pk").values(*MARK_FIELDS))
+        sheets = sheets_to.objects.bulk_create([sheets_to(**sheet, **extra) for sheet in sheets], batch_size=500)
+        marks = marks_to.objects.bulk_create([marks_to(**mark) for mark in marks], batch_size=500)
+        # No per-row delete signals: the move is announced once, below.
+        marks_from.objects.filter(mark_group__in=sheet_pks)._raw_delete(marks_from.objects.db)
+        sheets_from.objects.filter(pk__in=sheet_pks)._raw_delete(sheets_from.objects.db)
+
+        for sheet in sheets:
+            record_group_mark_change(sheet)
+        marks_changed.send(sender=StudentMark, marks=marks, deleted=False)
+        # Archived marks leave the rankings, restored ones come back.
+        transaction.on_commit(rankings.clear)
+    return len(sheets), len(marks)
+
+
+def archive_sheets(sheet_pks):
+    """Move these GroupMark rows and their marks to the archive in one transaction; returns (sheets, marks)."""
+    return _move(sheet_pks, (GroupMark, ArchivedGroupMark), (StudentMark, ArchivedStudentMark),
+                 archived_at=timezone.now())
+
+
+def restore_sheets(sheet_pks):
+    """Move archived sheets and their marks back to the live tables; returns (sheets, marks)."""
+    return _move(sheet_pks, (ArchivedGroupMark, GroupMark), (ArchivedStudentMark, StudentMark))
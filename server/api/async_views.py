@@ -0,0 +1,152 @@
+"""Async versions of the read-heavy views, served instead of the sync ones under ASGI (ASYNC_READ_VIEWS).
+
+A request waiting on the database or on a slow client holds a coroutine, not a worker
+thread. Authentication, permissions, renderers and replica routing are the sync views'
+own; only the handlers differ, reading through the async ORM and the values_list fast path.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings as django_settings
+from django.db.models import F
+from drf_spectacular.utils import extend_schema
+from rest_framework import status
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+from api.cache import transcripts
+from api.conditional import conditional, transcript_state, professor_groups_state, sheet_state, current_user_state
+from api.events import aevent_stream
+from api.fastpath import aserialize_rows
+from api.models import User, Student, Professor, StudentMark, GroupMark
+from api.serializers import StudentMarksSerializer, GroupMarkSerializer, StudentSerializer, ProfessorSerializer, \
+    MyUserSerializer
+from api import views
+
+
+async def aserialize_marks(request, marks):
+    """serialize_marks() with the async ORM; the compact and serializer formats run in a worker thread."""
+    if views.wants_compact(request) or not getattr(django_settings, "FAST_MARKS_SERIALIZATION", True):
+        return await sync_to_async(views.serialize_marks)(request, marks)
+    return await aserialize_rows(StudentMarksSerializer, marks)
+
+
+async def aserialize_transcript(request, stud_id):
+    """serialize_transcript() with the async ORM, in the same way."""
+    if views.wants_compact(request) or not getattr(django_settings, "FAST_MARKS_SERIALIZATION", True):
+        return await sync_to_async(views.serialize_transcript)(request, stud_id)
+    marks, archived = views.transcript_marks(stud_id)
+    return await aserialize_rows(StudentMarksSerializer, marks, [archived])
+
+
+class AsyncAPIView:
+    """Async dispatch for an APIView whose handlers are coroutines."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authenticators may load the user; the rest of initial() does not touch the database.
+            await sync_to_async(self.perform_authentication)(request)
+            self.initial(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class StudentMarksView(AsyncAPIView, views.StudentMarksView):
+    @extend_schema(request=None, responses={
+        status.HTTP_200_OK: StudentMarksSerializer(many=True)
+    })
+    @conditional(transcript_state)
+    async def get(self, request, stud_id, *args, **kwargs):
+        variant = views.transcript_variant(request)
+        if variant is None:
+            data, cache_status = await aserialize_transcript(request, stud_id), "BYPASS"
+        else:
+            key = await transcripts.akey(stud_id, variant=variant)
+            data = await transcripts.aget(key)
+            cache_status = "HIT"
+            if data is None:
+                cache_status = "MISS"
+                data = await aserialize_transcript(request, stud_id)
+                await transcripts.aset(key, data)
+
+        response = Response(data, status=status.HTTP_200_OK)
+        response["X-Cache"] = cache_status
+        return response
+
+
+class ProfessorMarkGroups(AsyncAPIView, views.ProfessorMarkGroups):
+    @extend_schema(request=None, responses={
+        status.HTTP_200_OK: GroupMarkSerializer(many=True)
+    })
+    @conditional(professor_groups_state)
+    async def get(self, request, *args, **kwargs):
+        gms = GroupMark.objects.filter(professor__user=request.user.pk).order_by("pk")
+        return Response(await aserialize_rows(GroupMarkSerializer, gms), status=status.HTTP_200_OK)
+
+
+class GroupMarksView(AsyncAPIView, views.GroupMarksView):
+    @extend_schema(request=None, responses={
+        status.HTTP_200_OK: StudentMarksSerializer(many=True)
+    })
+    @conditional(sheet_state)
+    async def get(self, request, mark_group_id, *args, **kwargs):
+        sms = StudentMark.objects.filter(mark_group=mark_group_id, student__group=F("mark_group__group")) \
+            .order_by("student")
+        data = await aserialize_marks(request, sms)
+
+        rows = data["marks"] if views.wants_compact(request) else data
+        if not rows and not await GroupMark.objects.filter(pk=mark_group_id).aexists():
+            return Response({}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response(data, status=status.HTTP_200_OK)
+
+    async def put(self, request, mark_group_id, *args, **kwargs):
+        return await sync_to_async(super().put)(request, mark_group_id, *args, **kwargs)
+
+
+class CurrentUserView(AsyncAPIView, views.CurrentUserView):
+    @conditional(current_user_state)
+    async def get(self, request, *args, **kwargs):
+        user = request.user
+        data = None
+        if user.get_role() == "student":
+            data = await aserialize_rows(StudentSerializer, Student.objects.filter(user=user.pk))
+        elif user.get_role() == "professor":
+            data = await aserialize_rows(ProfessorSerializer, Professor.objects.filter(user=user.pk))
+        elif user.get_role() == "admin":
+            data = [{"id": -1, "user": row} for row in
+                    await aserialize_rows(MyUserSerializer, User.objects.filter(pk=user.pk))]
+
+        if not data:
+            raise NotFound()
+        return Response(data[0], status=status.HTTP_200_OK)
+
+
+class MarkEventsView(AsyncAPIView):
+    async def get(self, request, *args, **kwargs):
+        channels = await sync_to_async(self.channels)(request, *args, **kwargs)
+        return views.event_stream_response(aevent_stream(channels))
+
+
+class StudentMarkEventsView(MarkEventsView, views.StudentMarkEventsView):
+    pass
+
+
+class GroupMarkEventsView(MarkEventsView, views.GroupMarkEventsView):
+    pass
@@ -0,0 +1,186 @@
+"""Stateless JWT mode: request.user is built from access token claims instead of a User query.
+
+Tokens carry the role, the student/professor id and the staff flags. Claims become stale
+when a user is deactivated or their role, flags or password change; such users are kept in
+a small in-memory set of "tokens issued before T are invalid", reloaded periodically.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication, JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from api.models import User, Student, Professor
+
+
+def user_claims(user):
+    return {
+        "role": user.get_role(),
+        "student_pk": Student.objects.filter(user=user.pk).values_list("pk", flat=True).first(),
+        "professor_pk": Professor.objects.filter(user=user.pk).values_list("pk", flat=True).first(),
+        "is_staff": user.is_staff,
+        "is_superuser": user.is_superuser,
+    }
+
+
+def _valid_after(user):
+    # Token "iat" has a one second resolution; tokens issued within the second of a change stay valid.
+    return int(user.tokens_valid_after.timestamp()) if user.tokens_valid_after else None
+
+
+class ClaimsUser(TokenUser):
+    @cached_property
+    def id(self):
+        # simplejwt stores the id as a string; compare equal to model primary keys.
+        return User._meta.pk.to_python(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def role(self):
+        return self.token.get("role", "not set")
+
+    def get_role(self):
+        return self.role
+
+
+class RevocationSet:
+    """User id -> epoch second before which the user's tokens are rejected (inf for inactive users)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._valid_after = {}
+        self._loaded_at = None
+
+    @property
+    def interval(self):
+        return getattr(settings, "TOKEN_REVOCATION_REFRESH", 30)
+
+    def load(self):
+        # Revocations older than the access token lifetime cannot match a live token.
+        horizon = timezone.now() - api_settings.ACCESS_TOKEN_LIFETIME
+        rows = User.objects.filter(Q(is_active=False) | Q(tokens_valid_after__gt=horizon)) \
+            .values_list("pk", "is_active", "tokens_valid_after")
+        self._valid_after = {
+            pk: int(valid_after.timestamp()) if is_active else float("inf")
+            for pk, is_active, valid_after in rows
+        }
+        self._loaded_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.interval:
+            with self._lock:
+                if self._loaded_at is None or time.monotonic() - self._loaded_at > self.interval:
+                    self.load()
+
+    def is_revoked(self, user_id, issued_at):
+        self._ensure_fresh()
+        valid_after = self._valid_after.get(user_id)
+        return valid_after is not None and issued_at < valid_after
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def __len__(self):
+        return len(self._valid_after)
+
+
+revocations = RevocationSet()
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    def get_user(self, validated_token):
+        if "role" not in validated_token:
+            # Issued before claims were added: fall back to loading the user.
+            return JWTAuthentication.get_user(self, validated_token)
+        user = super().get_user(validated_token)
+        if revocations.is_revoked(user.pk, validated_token.get("iat", 0)):
+            raise AuthenticationFailed("Токен отозван.", code="token_revoked")
+        return user
+
+
+CLAIMS = ("role", "student_pk", "professor_pk", "is_staff", "is_superuser")
+
+
+class StreamToken(AccessToken):
+    """A short-lived token that only opens event streams; it is the one passed in URLs."""
+    token_type = "stream"
+
+    @property
+    def lifetime(self):
+        return getattr(settings, "MARK_EVENTS_TOKEN_LIFETIME", timedelta(seconds=60))
+
+
+def stream_token_for(request):
+    """A StreamToken for the user of an authenticated request, with the claims of their access token."""
+    token = StreamToken.for_user(request.user)
+    claims = request.auth if request.auth is not None and "role" in request.auth else user_claims(request.user)
+    for claim in CLAIMS:
+        token[claim] = claims[claim]
+    return token
+
+
+class QueryTokenMixin:
+    """Reads a StreamToken from ?stream_token=, for clients such as EventSource that cannot send headers.
+
+    URLs end up in access logs, so access tokens are not accepted there.
+    """
+
+    def authenticate(self, request):
+        raw_token = request.query_params.get("stream_token")
+        if not raw_token:
+            return None
+        validated_token = self.get_validated_token(raw_token.encode())
+        return self.get_user(validated_token), validated_token
+
+    def get_validated_token(self, raw_token):
+        try:
+            return StreamToken(raw_token)
+        except TokenError as e:
+            raise InvalidToken({"detail": str(e)})
+
+
+class QueryTokenAuthentication(QueryTokenMixin, JWTAuthentication):
+    pass
+
+
+class QueryTokenStatelessAuthentication(QueryTokenMixin, StatelessJWTAuthentication):
+    pass
+
+
+def query_token_authentication():
+    return QueryTokenStatelessAuthentication if getattr(settings, "STATELESS_JWT", False) else QueryTokenAuthentication
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for claim, value in user_claims(user).items():
+            token[claim] = value
+        return token
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Re-issues the access token with the user's current claims instead of copying stale ones."""
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        refresh = RefreshToken(attrs["refresh"], verify=False)
+        user = User.objects.filter(pk=refresh[api_settings.USER_ID_CLAIM]).first()
+        valid_after = _valid_after(user) if user is not None else None
+        if user is None or valid_after is not None and refresh.get("iat", 0) < valid_after:
+            raise AuthenticationFailed("Токен отозван.", code="token_revoked")
+
+        access = refresh.access_token
+        for claim, value in user_claims(user).items():
+            access[claim] = value
+        data["access"] = str(access)
+        return data
@@ -0,0 +1,108 @@
+"""Versioned cache of serialized student transcripts.
+
+Entries are keyed by two versions: one per student and one global version for
+data shared by many transcripts (group marks, professors, subjects, groups).
+Bumping a version makes the old entries unreachable; they simply expire.
+
+Versions are random tokens, not counters: the cache may evict a version like any other
+entry, and the fresh token that replaces it can never address an entry stored before.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+GLOBAL = "all"
+
+
+class TranscriptCache:
+    def __init__(self, alias):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _version_key(self, scope):
+        return f"transcript:version:{scope}"
+
+    @staticmethod
+    def _new_version():
+        return uuid.uuid4().hex
+
+    def key(self, student_pk, variant="full"):
+        version_keys = [self._version_key(student_pk), self._version_key(GLOBAL)]
+        versions = self.cache.get_many(version_keys)
+        missing = [key for key in version_keys if key not in versions]
+        if missing:
+            fresh = {key: self._new_version() for key in missing}
+            for key, version in fresh.items():
+                self.cache.add(key, version, None)
+            # Another process may have added its own token first.
+            versions = {**fresh, **versions, **self.cache.get_many(missing)}
+        own, shared = (versions[key] for key in version_keys)
+        return f"transcript:{student_pk}:{own}:{shared}:{variant}"
+
+    async def akey(self, student_pk, variant="full"):
+        version_keys = [self._version_key(student_pk), self._version_key(GLOBAL)]
+        versions = await self.cache.aget_many(version_keys)
+        missing = [key for key in version_keys if key not in versions]
+        if missing:
+            fresh = {key: self._new_version() for key in missing}
+            for key, version in fresh.items():
+                await self.cache.aadd(key, version, None)
+            versions = {**fresh, **versions, **await self.cache.aget_many(missing)}
+        own, shared = (versions[key] for key in version_keys)
+        return f"transcript:{student_pk}:{own}:{shared}:{variant}"
+
+    def get(self, key):
+        data = self.cache.get(key)
+        self._count("hits" if data is not None else "misses")
+        return data
+
+    async def aget(self, key):
+        data = await self.cache.aget(key)
+        await self._acount("hits" if data is not None else "misses")
+        return data
+
+    def set(self, key, data):
+        self.cache.set(key, data, getattr(settings, "TRANSCRIPT_CACHE_TIMEOUT", None))
+
+    async def aset(self, key, data):
+        await self.cache.aset(key, data, getattr(settings, "TRANSCRIPT_CACHE_TIMEOUT", None))
+
+    def bump_students(self, student_pks):
+        self.cache.set_many({self._version_key(pk): self._new_version() for pk in set(student_pks)}, None)
+
+    def bump_all(self):
+        self.cache.set(self._version_key(GLOBAL), self._new_version(), None)
+
+    def _count(self, counter):
+        key = f"transcript:stats:{counter}"
+        if not self.cache.add(key, 1, None):
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                pass
+
+    async def _acount(self, counter):
+        key = f"transcript:stats:{counter}"
+        if not await self.cache.aadd(key, 1, None):
+            try:
+                await self.cache.aincr(key)
+            except ValueError:
+                pass
+
+    def stats(self):
+        counters = self.cache.get_many(["transcript:stats:hits", "transcript:stats:misses"])
+        hits = counters.get("transcript:stats:hits", 0)
+        misses = counters.get("transcript:stats:misses", 0)
+        return {
+            "backend": self.cache.__class__.__name__,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+
+
+transcripts = TranscriptCache(getattr(settings, "TRANSCRIPT_CACHE_ALIAS", "transcripts"))
@@ -0,0 +1,117 @@
+"""Change feed of marks: rows written since a cursor, in proportion to the changes, not the data.
+
+Every StudentMark/GroupMark write appends a MarkChange in the writer's transaction; the
+entry id is the cursor. SQLite runs one write transaction at a time, so ids become
+visible in order and a reader never skips an entry committed after a later id.
+Compaction drops old entries superseded by a newer one for the same row; a client
+behind the compaction point still receives the latest state of every row. Rows moved to
+the archive are read from there.
+"""
+from datetime import timedelta
+
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from api.fastpath import serialize_rows
+from api.models import MarkChange, Professor, Student, StudentMark, GroupMark, ArchivedStudentMark, ArchivedGroupMark
+from api.serializers import CompactStudentMarksSerializer, CompactGroupMarkSerializer, \
+    CompactArchivedStudentMarksSerializer, CompactArchivedGroupMarkSerializer
+
+# kind -> the live (model, serializer) and the archived one.
+KINDS = {
+    "student_mark": ((StudentMark, CompactStudentMarksSerializer),
+                     (ArchivedStudentMark, CompactArchivedStudentMarksSerializer)),
+    "group_mark": ((GroupMark, CompactGroupMarkSerializer),
+                   (ArchivedGroupMark, CompactArchivedGroupMarkSerializer)),
+}
+MAX_LIMIT = 5000
+
+
+def _sheet_professors(mark_group_pks):
+    # Marks are logged before their sheet is deleted, and after it is moved to the archive.
+    professors = dict(GroupMark.objects.filter(pk__in=mark_group_pks).values_list("pk", "professor"))
+    missing = set(mark_group_pks) - professors.keys()
+    if missing:
+        professors.update(ArchivedGroupMark.objects.filter(pk__in=missing).values_list("pk", "professor"))
+    return professors
+
+
+def record_mark_changes(marks, deleted=False):
+    marks = [sm for sm in marks if sm.pk is not None]
+    professors = _sheet_professors({sm.mark_group_id for sm in marks}) if marks else {}
+    MarkChange.objects.bulk_create(
+        [MarkChange(kind="student_mark", object_id=sm.pk, deleted=deleted, student_pk=sm.student_id,
+                    mark_group_pk=sm.mark_group_id, professor_pk=professors.get(sm.mark_group_id))
+         for sm in marks],
+        batch_size=500,
+    )
+
+
+def record_group_mark_change(group_mark, deleted=False):
+    MarkChange.objects.create(kind="group_mark", object_id=group_mark.pk, deleted=deleted,
+                              mark_group_pk=group_mark.pk, professor_pk=group_mark.professor_id)
+
+
+def visible_changes(user):
+    """The entries `user` may read: everything for staff, their own sheets or transcript otherwise.
+
+    Visibility is decided by the ids stored in the entries, so tombstones of deleted sheets
+    and marks stay visible to the professor and the students they belonged to.
+    """
+    changes = MarkChange.objects.all()
+    if user.is_staff:
+        return changes
+    role = user.get_role()
+    if role == "professor":
+        return changes.filter(professor_pk__in=Professor.objects.filter(user=user.pk).values("pk"))
+    if role == "student":
+        students = Student.objects.filter(user=user.pk).values("pk")
+        sheets = MarkChange.objects.filter(kind="student_mark", student_pk__in=students).values("mark_group_pk")
+        return changes.filter(Q(kind="student_mark", student_pk__in=students)
+                              | Q(kind="group_mark", mark_group_pk__in=sheets))
+    return changes.none()
+
+
+def changes_since(changes, cursor, limit):
+    """A batch of at most `limit` log entries after `cursor`, folded into the current rows.
+
+    Returns {"cursor", "has_more", "student_marks", "group_marks", "deleted"}: pass the
+    returned cursor back to continue; rows changed several times in the batch appear once.
+    """
+    entries = list(changes.filter(pk__gt=cursor).order_by("pk")
+                   .values_list("pk", "kind", "object_id", "deleted")[:limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    latest = {}
+    for _, kind, object_id, deleted in entries:
+        latest[kind, object_id] = deleted
+    result = {"cursor": entries[-1][0] if entries else cursor, "has_more": has_more}
+    deleted_ids = {}
+    for kind, ((model, serializer_class), (archived_model, archived_serializer_class)) in KINDS.items():
+        saved = [object_id for (entry_kind, object_id), deleted in latest.items()
+                 if entry_kind == kind and not deleted]
+        rows = serialize_rows(serializer_class, model.objects.filter(pk__in=saved).order_by("pk")) if saved else []
+        found = {row["id"] for row in rows}
+        archived = [object_id for object_id in saved if object_id not in found]
+        if archived:
+            rows += serialize_rows(archived_serializer_class,
+                                   archived_model.objects.filter(pk__in=archived).order_by("pk"))
+            rows.sort(key=lambda row: row["id"])
+            found = {row["id"] for row in rows}
+        # A row saved in this batch and deleted after it was logged is reported as deleted.
+        deleted_ids[f"{kind}s"] = sorted(
+            object_id for (entry_kind, object_id), deleted in latest.items()
+            if entry_kind == kind and (deleted or object_id not in found)
+        )
+        result[f"{kind}s"] = rows
+    result["deleted"] = deleted_ids
+    return result
+
+
+def compact_changes(older_than=timedelta(days=30)):
+    """Delete entries older than `older_than` that have a newer entry for the same row; returns the count."""
+    newer = MarkChange.objects.filter(kind=OuterRef("kind"), object_id=OuterRef("object_id"), pk__gt=OuterRef("pk"))
+    superseded = MarkChange.objects.filter(created_at__lt=timezone.now() - older_than).filter(Exists(newer))
+    deleted, _ = superseded.delete()
+    return deleted
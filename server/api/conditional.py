@@ -0,0 +1,125 @@
+"""ETag / Last-Modified support for read endpoints, answered before any serializer runs."""
+import asyncio
+import hashlib
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+
+from django.db.models import Count, F, Max, Value
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from api.models import StudentMark, GroupMark, User, ArchivedStudentMark
+
+
+def conditional(state_func):
+    """Decorate an APIView handler with validators computed by `state_func(request, *args, **kwargs)`.
+
+    `state_func` returns a tuple of change markers (counts and timestamps); its hash is
+    the ETag and its newest timestamp the Last-Modified date. Async handlers get an async
+    wrapper that runs `state_func` off the event loop.
+    """
+
+    def validators(request, state):
+        digest = hashlib.md5(repr((state, request.GET.urlencode())).encode()).hexdigest()
+        timestamps = [value for value in state if hasattr(value, "timestamp")]
+        return quote_etag(digest), int(max(timestamps).timestamp()) if timestamps else None
+
+    def finish(response, etag, last_modified):
+        if response.status_code in (200, 304):
+            response.headers.setdefault("ETag", etag)
+            if last_modified is not None:
+                response.headers.setdefault("Last-Modified", http_date(last_modified))
+            # Let browsers keep the body but revalidate it on every request.
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ("Authorization",))
+        return response
+
+    def decorator(handler):
+        if asyncio.iscoroutinefunction(handler):
+            @wraps(handler)
+            async def async_inner(self, request, *args, **kwargs):
+                state = await sync_to_async(state_func)(request, *args, **kwargs)
+                etag, last_modified = validators(request, state)
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is None:
+                    response = await handler(self, request, *args, **kwargs)
+                return finish(response, etag, last_modified)
+
+            return async_inner
+
+        @wraps(handler)
+        def inner(self, request, *args, **kwargs):
+            state = state_func(request, *args, **kwargs)
+            etag, last_modified = validators(request, state)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = handler(self, request, *args, **kwargs)
+            return finish(response, etag, last_modified)
+
+        return inner
+
+    return decorator
+
+
+def _aggregate(queryset, *others, **timestamps):
+    """Row count and newest timestamps of `queryset`, then of each of `others`, in a single query."""
+    maxima = {f"{name}_updated": Max(field) for name, field in timestamps.items()}
+    if not others:
+        res = queryset.aggregate(count=Count("pk"), **maxima)
+        return (res.pop("count"), *res.values())
+    # Without a GROUP BY, every part yields exactly one row, empty or not.
+    parts = [
+        qs.order_by().values(part=Value(i)).annotate(count=Count("pk"), **maxima).values_list("part", "count", *maxima)
+        for i, qs in enumerate((queryset, *others))
+    ]
+    rows = parts[0].union(*parts[1:], all=True).order_by("part")
+    return tuple(value for _, *values in rows for value in values)
+
+
+def transcript_state(request, stud_id, *args, **kwargs):
+    return _aggregate(
+        StudentMark.objects.filter(student=stud_id),
+        ArchivedStudentMark.objects.filter(student=stud_id),
+        marks="updated_at",
+        groups="mark_group__updated_at",
+        subjects="mark_group__subject__updated_at",
+        course_groups="mark_group__group__updated_at",
+        professors="mark_group__professor__updated_at",
+        professor_users="mark_group__professor__user__updated_at",
+        student="student__updated_at",
+        student_group="student__group__updated_at",
+        user="student__user__updated_at",
+    )
+
+
+def professor_groups_state(request, *args, **kwargs):
+    return _aggregate(
+        GroupMark.objects.filter(professor__user=request.user.pk),
+        groups="updated_at",
+        professor="professor__updated_at",
+        user="professor__user__updated_at",
+    )
+
+
+def sheet_state(request, mark_group_id, *args, **kwargs):
+    return _aggregate(
+        StudentMark.objects.filter(mark_group=mark_group_id, student__group=F("mark_group__group")),
+        marks="updated_at",
+        group="mark_group__updated_at",
+        subject="mark_group__subject__updated_at",
+        course_group="mark_group__group__updated_at",
+        professor="mark_group__professor__updated_at",
+        professor_user="mark_group__professor__user__updated_at",
+        students="student__updated_at",
+        users="student__user__updated_at",
+    )
+
+
+def current_user_state(request, *args, **kwargs):
+    return tuple(
+        User.objects.filter(pk=request.user.pk)
+        .values_list("pk", "is_superuser", "updated_at", "student__updated_at", "student__group__updated_at",
+                     "professor__updated_at")
+        .first() or ()
+    )
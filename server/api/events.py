@@ -0,0 +1,238 @@
+"""Mark change events for the server-sent event streams.
+
+After a commit, every changed StudentMark is published to the channels "student:<pk>"
+and "mark_group:<pk>". The broker (MARK_EVENTS_BROKER) fans events out to the open
+streams. LocalBroker keeps subscribers in process memory, so a deployment with several
+server processes has to plug in a shared backend with the same publish/subscribe methods.
+
+Clients open streams only when `live_updates()` says so, and poll the (conditional) marks
+endpoints otherwise: under WSGI every stream holds a worker thread, and with LocalBroker
+and several processes a stream misses the writes of the other processes.
+"""
+import asyncio
+import json
+import queue
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core import checks
+from django.utils.module_loading import import_string
+
+# Events a slow stream may fall behind by; past that they are replaced with a single "resync".
+MAX_PENDING = 100
+RESYNC = {"event": "resync", "data": {}}
+
+
+def student_channel(student_pk):
+    return f"student:{student_pk}"
+
+
+def mark_group_channel(mark_group_pk):
+    return f"mark_group:{mark_group_pk}"
+
+
+def mark_events(marks, deleted=False):
+    """(channel, event) pairs for changed marks: one per mark for students, one per sheet for professors."""
+    events = []
+    sheets = {}
+    for sm in marks:
+        events.append((student_channel(sm.student_id), {"event": "mark", "data": {
+            "id": sm.pk, "mark_group": sm.mark_group_id, "total": sm.total, "deleted": deleted,
+        }}))
+        sheets.setdefault(sm.mark_group_id, []).append(sm.pk)
+    for mark_group, ids in sheets.items():
+        events.append((mark_group_channel(mark_group), {"event": "sheet", "data": {
+            "mark_group": mark_group, "marks": ids, "deleted": deleted,
+        }}))
+    return events
+
+
+class Subscription:
+    """Events of some channels for one stream, read with get() from a thread."""
+
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = tuple(channels)
+        self._queue = queue.Queue(MAX_PENDING)
+
+    def deliver(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._overflow()
+
+    def _overflow(self):
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        self._queue.put_nowait(RESYNC)
+
+    def get(self, timeout):
+        """The next event, or None after `timeout` seconds without one."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class AsyncSubscription(Subscription):
+    """Events of some channels for one stream, read with aget() on the event loop that subscribed."""
+
+    def __init__(self, broker, channels):
+        super().__init__(broker, channels)
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(MAX_PENDING)
+
+    def deliver(self, event):
+        # Publishers run in request threads; the queue belongs to the event loop.
+        self._loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._overflow()
+
+    def _overflow(self):
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(RESYNC)
+
+    async def aget(self, timeout):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class LocalBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, channels, asynchronous=False):
+        subscription = (AsyncSubscription if asynchronous else Subscription)(self, channels)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel, set())
+                subscribers.discard(subscription)
+                if not subscribers:
+                    self._subscribers.pop(channel, None)
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.deliver(event)
+            except RuntimeError:
+                # The subscriber's event loop has been closed.
+                self.unsubscribe(subscription)
+
+    def stats(self):
+        with self._lock:
+            return {"channels": len(self._subscribers),
+                    "subscriptions": len(set().union(*self._subscribers.values()))}
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(getattr(settings, "MARK_EVENTS_BROKER", "api.events.LocalBroker"))()
+
+
+def live_updates():
+    """Whether clients should use the event streams (MARK_EVENTS_LIVE: "1", "0" or "auto")."""
+    live = getattr(settings, "MARK_EVENTS_LIVE", "auto")
+    if live != "auto":
+        return live == "1"
+    return getattr(settings, "ASYNC_READ_VIEWS", False) and not isinstance(get_broker(), LocalBroker)
+
+
+@checks.register()
+def check_live_updates(app_configs, **kwargs):
+    if getattr(settings, "MARK_EVENTS_LIVE", "auto") != "1":
+        return []
+    messages = []
+    if not getattr(settings, "ASYNC_READ_VIEWS", False):
+        messages.append(checks.Warning(
+            "MARK_EVENTS_LIVE=1 without ASYNC_READ_VIEWS: every open event stream holds a worker thread.",
+            hint="Serve the project with ASGI (config/asgi.py) or let clients poll (MARK_EVENTS_LIVE=auto).",
+            id="api.W003",
+        ))
+    if isinstance(get_broker(), LocalBroker):
+        messages.append(checks.Warning(
+            "MARK_EVENTS_LIVE=1 with LocalBroker: streams only see the writes of their own process.",
+            hint="Run a single server process or set MARK_EVENTS_BROKER to a broker shared by the processes.",
+            id="api.W004",
+        ))
+    return messages
+
+
+def publish(events):
+    broker = get_broker()
+    for channel, event in events:
+        broker.publish(channel, event)
+
+
+def _heartbeat():
+    return getattr(settings, "MARK_EVENTS_HEARTBEAT", 15)
+
+
+def _deadline():
+    # The server does not notice a client that went away while the stream is idle: every
+    # stream ends after MARK_EVENTS_MAX_AGE seconds, and live clients reconnect.
+    return time.monotonic() + getattr(settings, "MARK_EVENTS_MAX_AGE", 300)
+
+
+def _timeouts(deadline):
+    """Seconds to wait for each next event until the deadline."""
+    while (remaining := deadline - time.monotonic()) > 0:
+        yield min(_heartbeat(), remaining)
+
+
+def format_event(event):
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+# Sent first: how long the browser waits before reconnecting, and something to flush the headers with.
+PREAMBLE = "retry: 5000\n: connected\n\n"
+KEEPALIVE = ": keepalive\n\n"
+
+
+def event_stream(channels):
+    """SSE body for a sync (WSGI) response; holds a thread for as long as the client listens."""
+    deadline = _deadline()
+    subscription = get_broker().subscribe(channels)
+    try:
+        yield PREAMBLE
+        for timeout in _timeouts(deadline):
+            event = subscription.get(timeout)
+            yield KEEPALIVE if event is None else format_event(event)
+    finally:
+        subscription.close()
+
+
+async def aevent_stream(channels):
+    """SSE body for an ASGI response: an idle stream is a parked coroutine."""
+    deadline = _deadline()
+    subscription = get_broker().subscribe(channels, asynchronous=True)
+    try:
+        yield PREAMBLE
+        for timeout in _timeouts(deadline):
+            event = await subscription.aget(timeout)
+            yield KEEPALIVE if event is None else format_event(event)
+    finally:
+        subscription.close()
@@ -0,0 +1,92 @@
+"""Streaming CSV exports of marks.
+
+Rows are read with a chunked values_list() iterator and written to the response as they
+come, so memory stays flat however many rows are exported. Under ASGI the body is an async
+iterator: Django would read a sync one to the end in a thread before sending a byte.
+The headers match the ones `api.imports` accepts, so an exported sheet can be edited and
+imported back.
+"""
+import csv
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+from api.fastpath import union_values_list
+from api.routers import use_replica
+
+COLUMNS = (
+    ("Номер зачетной книжки", "student__record_book_number"),
+    ("Фамилия", "student__user__last_name"),
+    ("Имя", "student__user__first_name"),
+    ("Отчество", "student__user__patronymic"),
+    ("Группа", "student__group__group_number"),
+    ("Дисциплина", "mark_group__subject__name"),
+    ("Семестр", "mark_group__semester"),
+    ("Отчетность", "mark_group__reporting_level"),
+    ("Аттестация 1", "att1"),
+    ("Аттестация 2", "att2"),
+    ("Аттестация 3", "att3"),
+    ("Экзамен", "exam"),
+    ("Дополнительные баллы", "additional"),
+    ("Взвешенный балл", "mean"),
+    ("Итоговый балл", "total"),
+)
+CHUNK_SIZE = 1000
+
+
+class Echo:
+    """File-like object whose write() returns the line instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def is_asgi(request):
+    return isinstance(getattr(request, "_request", request), ASGIRequest)
+
+
+def _header(writer):
+    # BOM so that Excel opens the file as UTF-8; the header goes out before the query runs.
+    return "\ufeff" + writer.writerow([header for header, _ in COLUMNS])
+
+
+def _rows(marks, archived):
+    return union_values_list(marks, [archived] if archived is not None else (), [lookup for _, lookup in COLUMNS])
+
+
+def iter_csv(marks, replica=False, archived=None):
+    """CSV lines of the StudentMark queryset `marks`, merged with the ArchivedStudentMark queryset `archived`."""
+    writer = csv.writer(Echo())
+    yield _header(writer)
+    with use_replica(replica):
+        batch = []
+        for row in _rows(marks, archived).iterator(chunk_size=CHUNK_SIZE):
+            # Rows may end with the ordering columns of a union.
+            batch.append(writer.writerow(row[:len(COLUMNS)]))
+            if len(batch) == CHUNK_SIZE:
+                yield "".join(batch)
+                batch = []
+        if batch:
+            yield "".join(batch)
+
+
+async def aiter_csv(marks, replica=False, archived=None):
+    """iter_csv() for ASGI responses: each chunk of rows is fetched in a thread."""
+    writer = csv.writer(Echo())
+    yield _header(writer)
+    with use_replica(replica):
+        # QuerySet.aiterator() runs the query of a union on the event loop, so chunk by hand.
+        rows = _rows(marks, archived).iterator(chunk_size=CHUNK_SIZE)
+        fetch = sync_to_async(lambda: list(islice(rows, CHUNK_SIZE)))
+        while chunk := await fetch():
+            yield "".join(writer.writerow(row[:len(COLUMNS)]) for row in chunk)
+
+
+def csv_response(marks, filename, replica=False, archived=None, asynchronous=False):
+    rows = (aiter_csv if asynchronous else iter_csv)(marks, replica, archived)
+    response = StreamingHttpResponse(rows, content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
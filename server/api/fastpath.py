@@ -0,0 +1,139 @@
+"""Read-only serialization from values_list() rows, producing the same data as the DRF serializers.
+
+A serializer class is compiled once into a tree of row getters: nested serializers
+become column ranges of a single joined query, many-to-many id lists come from one
+query on the through table. No model or serializer instance is created per row.
+"""
+from functools import lru_cache
+
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - the stdlib encoder is used instead
+    orjson = None
+
+
+# SerializerMethodField name -> (columns relative to the serializer's model, function of their values).
+METHOD_FIELDS = {
+    "find_role": (("role",), lambda role: role),
+}
+
+# Fields whose to_representation() is the identity on the values the database returns.
+PASSTHROUGH_FIELDS = (serializers.IntegerField, serializers.CharField, serializers.ReadOnlyField,
+                      PrimaryKeyRelatedField)
+
+
+def union_values_list(queryset, others, lookups):
+    """queryset.values_list(*lookups), with the rows of the querysets `others` added by UNION ALL.
+
+    A compound statement has a single ORDER BY, on selected columns: ordering lookups of
+    `queryset` that are not in `lookups` are selected after them.
+    """
+    if not others:
+        return queryset.values_list(*lookups)
+    ordering = queryset.query.order_by
+    lookups = [*lookups, *(field.lstrip("-") for field in ordering if field.lstrip("-") not in lookups)]
+    parts = [other.order_by().values_list(*lookups) for other in others]
+    return queryset.order_by().values_list(*lookups).union(*parts, all=True).order_by(*ordering)
+
+
+class RowMapper:
+    def __init__(self, serializer_class):
+        self.lookups = []
+        self.many_to_many = []
+        self.build = self._compile(serializer_class(), serializer_class.Meta.model, "")
+
+    def _column(self, lookup):
+        self.lookups.append(lookup)
+        return len(self.lookups) - 1
+
+    def _compile(self, serializer, model, prefix):
+        pk_index = self._column(prefix + model._meta.pk.name)
+        getters = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            source = model._meta.pk.name if field.source == "pk" else field.source
+            if isinstance(field, serializers.BaseSerializer):
+                related_model = model._meta.get_field(source).related_model
+                getters.append((name, self._compile(field, related_model, f"{prefix}{source}__")))
+            elif isinstance(field, ManyRelatedField):
+                key = len(self.many_to_many)
+                self.many_to_many.append((pk_index, model._meta.get_field(source)))
+                getters.append((name, lambda row, ids, key=key, i=pk_index: ids[key].get(row[i], [])))
+            elif isinstance(field, serializers.SerializerMethodField):
+                lookups, func = METHOD_FIELDS[field.method_name]
+                indexes = [self._column(prefix + lookup) for lookup in lookups]
+                getters.append((name, lambda row, ids, idx=indexes, func=func: func(*(row[i] for i in idx))))
+            elif type(field) in PASSTHROUGH_FIELDS:
+                getters.append((name, lambda row, ids, i=self._column(prefix + source): row[i]))
+            else:
+                getters.append((name, lambda row, ids, i=self._column(prefix + source),
+                                conv=field.to_representation: None if row[i] is None else conv(row[i])))
+
+        def build(row, ids):
+            if row[pk_index] is None:
+                return None
+            return {name: getter(row, ids) for name, getter in getters}
+
+        return build
+
+    def _through_queries(self, rows):
+        for pk_index, field in self.many_to_many:
+            owners = {row[pk_index] for row in rows} - {None}
+            owner, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+            yield field.remote_field.through.objects \
+                .filter(**{f"{owner}__in": owners}).order_by(owner, target) \
+                .values_list(owner, target)
+
+    @staticmethod
+    def _group_ids(pairs):
+        ids = {}
+        for owner_pk, target_pk in pairs:
+            ids.setdefault(owner_pk, []).append(target_pk)
+        return ids
+
+    def serialize(self, queryset, others=()):
+        rows = list(union_values_list(queryset, others, self.lookups))
+        ids = [self._group_ids(query) for query in self._through_queries(rows)]
+        return [self.build(row, ids) for row in rows]
+
+    async def aserialize(self, queryset, others=()):
+        rows = [row async for row in union_values_list(queryset, others, self.lookups)]
+        ids = [self._group_ids([pair async for pair in query]) for query in self._through_queries(rows)]
+        return [self.build(row, ids) for row in rows]
+
+
+@lru_cache(maxsize=None)
+def row_mapper(serializer_class):
+    return RowMapper(serializer_class)
+
+
+def serialize_rows(serializer_class, queryset, others=()):
+    """Equivalent of `serializer_class(queryset, many=True).data` for read-only, model-backed serializers.
+
+    Querysets in `others`, of models with the same fields (the archive), are read in the
+    same query with UNION ALL and ordered as `queryset`.
+    """
+    return row_mapper(serializer_class).serialize(queryset, others)
+
+
+async def aserialize_rows(serializer_class, queryset, others=()):
+    """serialize_rows() with the async ORM."""
+    return await row_mapper(serializer_class).aserialize(queryset, others)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer using orjson when it is installed; the output bytes are the same."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace("\u2028".encode(), b"\\u2028").replace("\u2029".encode(), b"\\u2029")
@@ -0,0 +1,140 @@
+"""Import of a mark sheet from a CSV/XLSX file, matched to students by record book number.
+
+The file is read as a stream; memory is bounded by the size of the sheet, not of the file.
+Nothing is written unless every row is valid, then the changed rows are saved in chunks.
+"""
+from django.db.models import F
+from rest_framework import serializers
+
+from api.models import StudentMark
+from api.sheets import MARK_FIELDS, save_marks
+from api.tabular import iter_rows
+
+# Accepted header names (compared case-insensitively) for each column.
+COLUMNS = {
+    "record_book_number": ("record_book_number", "номер зачетной книжки", "номер зачётной книжки", "зачетная книжка",
+                           "зачётная книжка"),
+    "att1": ("att1", "аттестация 1"),
+    "att2": ("att2", "аттестация 2"),
+    "att3": ("att3", "аттестация 3"),
+    "exam": ("exam", "экзамен"),
+    "additional": ("additional", "дополнительные баллы", "доп. баллы"),
+}
+MAX_REPORTED_ERRORS = 1000
+
+
+class MarkImportRowSerializer(serializers.Serializer):
+    record_book_number = serializers.CharField(max_length=20)
+    att1 = serializers.IntegerField(min_value=0, max_value=50, allow_null=True, required=False)
+    att2 = serializers.IntegerField(min_value=0, max_value=50, allow_null=True, required=False)
+    att3 = serializers.IntegerField(min_value=0, max_value=50, allow_null=True, required=False)
+    exam = serializers.IntegerField(min_value=0, max_value=50, allow_null=True, required=False)
+    additional = serializers.IntegerField(min_value=0, max_value=50, allow_null=True, required=False)
+
+
+def _column_names(header):
+    names = {}
+    for column, aliases in COLUMNS.items():
+        for alias in aliases:
+            if alias in header:
+                names[column] = alias
+                break
+    return names
+
+
+class MarkImport:
+    def __init__(self, group_mark, chunk_size=500):
+        self.group_mark = group_mark
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self.errors = []
+        self.error_count = 0
+        self.changes = []
+        self.fields = ()
+        self.applied = False
+        self._pending = {}
+
+    def error(self, line, record_book_number, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "record_book_number": record_book_number, "errors": errors})
+
+    def _sheet(self):
+        marks = StudentMark.objects.filter(mark_group=self.group_mark, student__group=F("mark_group__group")) \
+            .select_related("student")
+        return {sm.student.record_book_number: sm for sm in marks.iterator(chunk_size=2000)}
+
+    def read(self, fileobj, filename):
+        sheet = self._sheet()
+        seen = {}
+        names = None
+        for line, row in iter_rows(fileobj, filename):
+            if names is None:
+                names = _column_names(row.keys())
+                if "record_book_number" not in names:
+                    self.error(1, None, {"record_book_number": ["Нет столбца с номером зачетной книжки."]})
+                    return self
+                self.fields = tuple(field for field in MARK_FIELDS if field in names)
+            self.rows += 1
+            self._read_row(line, {column: row[name] for column, name in names.items()}, sheet, seen)
+        return self
+
+    def _read_row(self, line, data, sheet, seen):
+        number = data["record_book_number"]
+        if isinstance(number, float) and number.is_integer():
+            number = int(number)  # spreadsheets store numeric record book numbers as floats
+        data["record_book_number"] = None if number is None else str(number)
+        serializer = MarkImportRowSerializer(data=data)
+        if not serializer.is_valid():
+            self.error(line, data["record_book_number"], serializer.errors)
+            return
+        values = serializer.validated_data
+        number = values.pop("record_book_number")
+        if number in seen:
+            self.error(line, number, {"record_book_number": [f"Повторяет строку {seen[number]}."]})
+            return
+        seen[number] = line
+        mark = sheet.get(number)
+        if mark is None:
+            self.error(line, number, {"record_book_number": ["Студента нет в этой ведомости."]})
+            return
+
+        changed = {field: [getattr(mark, field), value] for field, value in values.items()
+                   if getattr(mark, field) != value}
+        if changed:
+            for field, (_, value) in changed.items():
+                setattr(mark, field, value)
+            self._pending[mark.pk] = mark
+            self.changes.append({"line": line, "record_book_number": number, "id": mark.pk, "changes": changed})
+
+    def apply(self):
+        """Save the changed rows in chunks; does nothing if any row was rejected."""
+        if self.error_count or not self._pending:
+            return []
+        marks = list(self._pending.values())
+        for mark in marks:
+            mark.mark_group = self.group_mark
+        for start in range(0, len(marks), self.chunk_size):
+            save_marks(marks[start:start + self.chunk_size], fields=self.fields)
+        self.applied = True
+        return marks
+
+    def report(self, dry_run):
+        return {
+            "mark_group": self.group_mark.pk,
+            "dry_run": dry_run,
+            "rows": self.rows,
+            "changed": len(self.changes),
+            "applied": self.applied,
+            "error_count": self.error_count,
+            "errors": self.errors,
+            "changes": self.changes,
+        }
+
+
+def import_marks(group_mark, fileobj, filename, dry_run=False, chunk_size=500):
+    """Read the file and, unless `dry_run` or some rows are invalid, save it; returns the report."""
+    result = MarkImport(group_mark, chunk_size).read(fileobj, filename)
+    if not dry_run:
+        result.apply()
+    return result.report(dry_run)
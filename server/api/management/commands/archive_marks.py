@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.archive import closed_sheets, archive_sheets, restore_sheets, open_groups
+from api.models import StudentMark, ArchivedStudentMark
+
+
+class Command(BaseCommand):
+    help = ("Move the mark sheets of a closed period (programme semesters up to --through-semester that the "
+            "group has finished) and their marks to the archive tables, --chunk-size sheets per transaction.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--through-semester", type=int, required=True)
+        parser.add_argument("--group", type=int, action="append", dest="groups",
+                            help="CourseGroup id; may be repeated (default: all groups)")
+        parser.add_argument("--chunk-size", type=int, default=100)
+        parser.add_argument("--dry-run", action="store_true", help="only count the sheets and marks to move")
+        parser.add_argument("--restore", action="store_true", help="move archived sheets back to the live tables")
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive")
+        restore = options["restore"]
+        if options["groups"] and not restore:
+            studying = open_groups(options["through_semester"], options["groups"])
+            if studying:
+                pks = ", ".join(str(group.pk) for group in studying)
+                raise CommandError(f"Groups {pks} have not finished semester {options['through_semester']} yet")
+        sheets = closed_sheets(options["through_semester"], options["groups"], archived=restore)
+        if options["dry_run"]:
+            marks = (ArchivedStudentMark if restore else StudentMark).objects.filter(mark_group__in=sheets)
+            self.stdout.write(f"{sheets.count()} sheets and {marks.count()} marks would be "
+                              f"{'restored' if restore else 'archived'}")
+            return
+
+        sheet_pks = list(sheets.values_list("pk", flat=True))
+        move = restore_sheets if restore else archive_sheets
+        start = time.perf_counter()
+        sheets = marks = 0
+        for i in range(0, len(sheet_pks), options["chunk_size"]):
+            moved_sheets, moved_marks = move(sheet_pks[i:i + options["chunk_size"]])
+            sheets += moved_sheets
+            marks += moved_marks
+        self.stdout.write(f"{sheets} sheets and {marks} marks {'restored' if restore else 'archived'} "
+                          f"in {time.perf_counter() - start:.2f} s")
@@ -0,0 +1,128 @@
+import asyncio
+import io
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.urls import path
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api import async_views, views
+from api.models import Student, GroupMark
+
+ENDPOINTS = ("StudentMarksView", "ProfessorMarkGroups", "GroupMarksView", "CurrentUserView")
+URL = "/benchmark/"
+
+
+def urlconf(view, kwargs):
+    class URLConf:
+        urlpatterns = [path(URL.strip("/") + "/", view.as_view(), kwargs)]
+
+    return URLConf
+
+
+class Command(BaseCommand):
+    help = ("Compare the sync views on a pool of worker threads (WSGI) with the async views on one event loop "
+            "(ASGI) for many concurrent slow clients, on the current database. Requests go through the full "
+            "Django handler and middleware of each server type.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--endpoint", choices=ENDPOINTS, default="StudentMarksView")
+        parser.add_argument("--requests", type=int, default=400)
+        parser.add_argument("--concurrency", type=int, default=200, help="clients connected at the same time")
+        parser.add_argument("--threads", type=int, default=8, help="worker threads of the WSGI server")
+        parser.add_argument("--latency", type=float, default=0.2,
+                            help="seconds a slow client keeps the connection (and a WSGI thread) busy")
+
+    def handle(self, *args, **options):
+        gm = GroupMark.objects.select_related("professor__user").first()
+        student = Student.objects.select_related("user").filter(group=gm.group_id).first() if gm else None
+        if student is None:
+            raise CommandError("The database has no mark sheet with students to read.")
+        endpoint = options["endpoint"]
+        user, kwargs = {
+            "StudentMarksView": (student.user, {"stud_id": student.pk}),
+            "ProfessorMarkGroups": (gm.professor.user, {}),
+            "GroupMarksView": (gm.professor.user, {"mark_group_id": gm.pk}),
+            "CurrentUserView": (student.user, {}),
+        }[endpoint]
+        token = f"Bearer {AccessToken.for_user(user)}"
+        latency = options["latency"]
+        wsgi_handler, asgi_handler = WSGIHandler(), ASGIHandler()
+
+        def wsgi_call():
+            environ = {
+                "REQUEST_METHOD": "GET", "PATH_INFO": URL, "QUERY_STRING": "", "SERVER_NAME": "benchmark",
+                "SERVER_PORT": "80", "SERVER_PROTOCOL": "HTTP/1.1", "HTTP_AUTHORIZATION": token,
+                "wsgi.input": io.BytesIO(), "wsgi.url_scheme": "http",
+            }
+            statuses = []
+            response = wsgi_handler(environ, lambda status, headers: statuses.append(int(status.split()[0])))
+            try:
+                b"".join(response)
+            finally:
+                response.close()
+            return statuses[0]
+
+        async def asgi_call():
+            scope = {
+                "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+                "path": URL, "raw_path": URL.encode(), "query_string": b"", "root_path": "",
+                "headers": [(b"host", b"benchmark"), (b"authorization", token.encode())],
+                "client": ("127.0.0.1", 0), "server": ("benchmark", 80),
+            }
+            messages = []
+
+            async def receive():
+                return {"type": "http.request", "body": b"", "more_body": False}
+
+            async def send(message):
+                messages.append(message)
+
+            await asgi_handler(scope, receive, send)
+            return messages[0]["status"]
+
+        # Latencies are counted from the moment the whole batch arrives, so a request
+        # queued for a free WSGI thread or connection slot includes its wait.
+        def wsgi_request(arrived):
+            status_code = wsgi_call()
+            time.sleep(latency)
+            return status_code, time.perf_counter() - arrived
+
+        async def asgi_request(slots, arrived):
+            async with slots:
+                status_code = await asgi_call()
+                await asyncio.sleep(latency)
+                return status_code, time.perf_counter() - arrived
+
+        async def asgi_run(arrived):
+            slots = asyncio.Semaphore(options["concurrency"])
+            return await asyncio.gather(*(asgi_request(slots, arrived) for _ in range(options["requests"])))
+
+        with override_settings(ROOT_URLCONF=urlconf(getattr(views, endpoint), kwargs)):
+            # Warm up caches and connections.
+            wsgi_request(time.perf_counter())
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options["threads"]) as pool:
+                wsgi = list(pool.map(wsgi_request, [start] * options["requests"]))
+            self.report("WSGI", wsgi, time.perf_counter() - start)
+
+        with override_settings(ROOT_URLCONF=urlconf(getattr(async_views, endpoint), kwargs)):
+            asyncio.run(asgi_call())
+            start = time.perf_counter()
+            asgi = asyncio.run(asgi_run(start))
+            self.report("ASGI", asgi, time.perf_counter() - start)
+
+    def report(self, name, results, elapsed):
+        statuses = {status for status, _ in results}
+        if statuses != {200}:
+            raise CommandError(f"{name}: unexpected statuses {sorted(statuses)}")
+        times = sorted(seconds for _, seconds in results)
+        p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+        self.stdout.write(f"{name}: {len(results) / elapsed:8.1f} req/s  "
+                          f"median {statistics.median(times) * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms  "
+                          f"total {elapsed:.2f} s")
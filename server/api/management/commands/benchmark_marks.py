@@ -0,0 +1,93 @@
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from api.fastpath import FastJSONRenderer, serialize_rows
+from api.models import User, Student, Professor, Subject, CourseGroup, GroupMark, StudentMark
+from api.serializers import StudentMarksSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compare the DRF and the value-row serialization of marks on generated data (rolled back afterwards)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--groups", type=int, default=20)
+        parser.add_argument("--students", type=int, default=25, help="students per group")
+        parser.add_argument("--subjects", type=int, default=40)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.generate(options["groups"], options["students"], options["subjects"])
+                self.run(options["repeat"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def generate(self, groups_count, students_count, subjects_count):
+        password = make_password(None)
+        subjects = Subject.objects.bulk_create(Subject(name=f"Бенчмарк {i}") for i in range(subjects_count))
+        prof_user = User.objects.create(username="bench-prof", email="bench-prof@example.com", password=password,
+                                        first_name="Имя", last_name="Фамилия", patronymic="Отчество")
+        professor = Professor.objects.create(user=prof_user)
+        professor.subjects.set(subjects)
+
+        groups = CourseGroup.objects.bulk_create(
+            CourseGroup(course_number=1, group_number=f"b-{i}", higher_education_level="b")
+            for i in range(groups_count))
+        users = User.objects.bulk_create(
+            User(username=f"bench-{g}-{i}", email=f"bench-{g}-{i}@example.com", password=password,
+                 first_name="Имя", last_name=f"Студент {i}", patronymic="Отчество")
+            for g in range(groups_count) for i in range(students_count))
+        students = Student.objects.bulk_create(
+            Student(user=user, group=groups[n // students_count], year_of_enrollment="2023",
+                    record_book_number=f"B{n:06d}", search_text=user.last_name.casefold())
+            for n, user in enumerate(users))
+        sheets = GroupMark.objects.bulk_create(
+            GroupMark(subject=subject, professor=professor, group=group, semester=i % 8 + 1, reporting_level="e")
+            for group in groups for i, subject in enumerate(subjects))
+
+        marks = []
+        for gm in sheets:
+            for student in students:
+                if student.group_id == gm.group_id:
+                    sm = StudentMark(mark_group=gm, student=student, att1=30, att2=35, att3=40, exam=30,
+                                     additional=student.pk % 10)
+                    sm.refresh_scores()
+                    marks.append(sm)
+        StudentMark.objects.bulk_create(marks, batch_size=2000)
+        self.stdout.write(f"{len(students)} students, {len(sheets)} sheets, {len(marks)} marks")
+        self.sample_student, self.sample_sheet = students[0], sheets[0]
+
+    def timed(self, func, repeat):
+        best, result = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def run(self, repeat):
+        cases = {
+            "transcript": StudentMark.objects.filter(student=self.sample_student).order_by("-mark_group__semester"),
+            "sheet": StudentMark.objects.filter(mark_group=self.sample_sheet).order_by("student"),
+            "all marks": StudentMark.objects.order_by("pk"),
+        }
+        for name, marks in cases.items():
+            drf_time, expected = self.timed(
+                lambda: JSONRenderer().render(StudentMarksSerializer(marks.with_related(), many=True).data), repeat)
+            fast_time, actual = self.timed(
+                lambda: FastJSONRenderer().render(serialize_rows(StudentMarksSerializer, marks)), repeat)
+            if actual != expected:
+                raise CommandError(f"{name}: the fast path output differs from the serializers")
+            self.stdout.write(f"{name:>10}: {len(expected):>10} bytes  serializers {drf_time * 1000:9.1f} ms  "
+                              f"fast path {fast_time * 1000:8.1f} ms  x{drf_time / fast_time:.1f}")
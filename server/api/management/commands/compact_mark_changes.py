@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from api.changes import compact_changes
+from api.models import MarkChange
+
+
+class Command(BaseCommand):
+    help = "Drop change log entries older than --days that a newer entry for the same row supersedes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30)
+
+    def handle(self, *args, **options):
+        deleted = compact_changes(timedelta(days=options["days"]))
+        self.stdout.write(f"{deleted} entries removed, {MarkChange.objects.count()} left")
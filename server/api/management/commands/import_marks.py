@@ -0,0 +1,41 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.imports import import_marks
+from api.models import GroupMark
+from api.tabular import TabularError
+
+
+class Command(BaseCommand):
+    help = "Import the marks of a GroupMark from a CSV or XLSX file, matching students by record book number."
+
+    def add_arguments(self, parser):
+        parser.add_argument("group_mark", type=int)
+        parser.add_argument("path")
+        parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            gm = GroupMark.objects.get(pk=options["group_mark"])
+        except GroupMark.DoesNotExist:
+            raise CommandError(f"GroupMark {options['group_mark']} does not exist.")
+
+        try:
+            with open(options["path"], "rb") as fileobj:
+                report = import_marks(gm, fileobj, options["path"], dry_run=options["dry_run"],
+                                      chunk_size=options["chunk_size"])
+        except (OSError, TabularError) as e:
+            raise CommandError(str(e))
+
+        for change in report["changes"]:
+            diff = ", ".join(f"{field}: {old} -> {new}" for field, (old, new) in change["changes"].items())
+            self.stdout.write(f"line {change['line']} {change['record_book_number']}: {diff}")
+        for error in report["errors"]:
+            self.stderr.write(f"line {error['line']} {error['record_book_number']}: "
+                              f"{json.dumps(error['errors'], ensure_ascii=False)}")
+        self.stdout.write(f"{report['rows']} rows, {report['changed']} changed, {report['error_count']} errors, "
+                          f"{'applied' if report['applied'] else 'nothing written'}")
+        if report["error_count"]:
+            raise CommandError("The file has invalid rows; nothing was imported.")
@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.provisioning import provision_users, ROLES
+from api.tabular import TabularError
+
+
+class Command(BaseCommand):
+    help = "Create student or professor accounts from a CSV or XLSX roster, hashing passwords in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument("role", choices=ROLES)
+        parser.add_argument("path")
+        parser.add_argument("--dry-run", action="store_true", help="only validate the roster")
+        parser.add_argument("--workers", type=int, default=None,
+                            help="password hashing processes (default: PROVISIONING_WORKERS or one per CPU)")
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["path"], "rb") as fileobj:
+                report = provision_users(options["role"], fileobj, options["path"], dry_run=options["dry_run"],
+                                         workers=options["workers"], chunk_size=options["chunk_size"])
+        except (OSError, TabularError) as e:
+            raise CommandError(str(e))
+
+        for error in report["errors"]:
+            self.stderr.write(f"line {error['line']} {error['username']}: "
+                              f"{json.dumps(error['errors'], ensure_ascii=False)}")
+        timings = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in report["timings"].items())
+        self.stdout.write(f"{report['rows']} rows, {report['created']} created, {report['error_count']} errors "
+                          f"({timings})")
+        if report["users_per_second"]:
+            self.stdout.write(f"{report['users_per_second']} users/s")
+        if report["error_count"]:
+            raise CommandError("The roster has invalid rows; no accounts were created.")
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.summaries import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = "Recompute the semester summaries of every student from the marks, --chunk-size students per transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive")
+        start = time.perf_counter()
+        students, summaries = rebuild_summaries(options["chunk_size"])
+        self.stdout.write(f"{summaries} summaries of {students} students rebuilt in {time.perf_counter() - start:.2f} s")
@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.routers import replica_alias, backup_sqlite, bump_replica_version
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database into the replica file, once or every --interval seconds."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=0,
+                            help="seconds between copies; 0 copies once and exits")
+
+    def handle(self, *args, **options):
+        alias = replica_alias()
+        if alias is None:
+            raise CommandError("No replica database is configured (set REPLICA_DATABASE).")
+        source, target = settings.DATABASES["default"], settings.DATABASES[alias]
+        if "sqlite3" not in source["ENGINE"] or "sqlite3" not in target["ENGINE"]:
+            raise CommandError("sync_replica copies SQLite files; use the database's own replication otherwise.")
+
+        while True:
+            start = time.perf_counter()
+            backup_sqlite(str(source["NAME"]), str(target["NAME"]))
+            bump_replica_version()
+            self.stdout.write(f"{target['NAME']} refreshed in {(time.perf_counter() - start) * 1000:.0f} ms")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+def provision_mark_sheets(apps, schema_editor):
+    GroupMark = apps.get_model("api", "GroupMark")
+    Student = apps.get_model("api", "Student")
+    StudentMark = apps.get_model("api", "StudentMark")
+
+    existing = set(StudentMark.objects.values_list("mark_group_id", "student_id"))
+    students = {}
+    for st_pk, group_id in Student.objects.exclude(group=None).values_list("pk", "group_id"):
+        students.setdefault(group_id, []).append(st_pk)
+
+    missing = (
+        StudentMark(mark_group_id=gm_pk, student_id=st_pk)
+        for gm_pk, group_id in GroupMark.objects.values_list("pk", "group_id")
+        for st_pk in students.get(group_id, ())
+        if (gm_pk, st_pk) not in existing
+    )
+    StudentMark.objects.bulk_create(missing, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_alter_studentmark_additional_alter_studentmark_att1_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(provision_mark_sheets, migrations.RunPython.noop),
+    ]
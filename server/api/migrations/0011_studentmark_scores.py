@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:07
+
+from django.db import migrations, models
+
+from api.scoring import count_mean, count_total
+
+
+def compute_scores(apps, schema_editor):
+    StudentMark = apps.get_model("api", "StudentMark")
+    marks = []
+    for sm in StudentMark.objects.select_related("mark_group").iterator(chunk_size=2000):
+        level = sm.mark_group.reporting_level
+        sm.mean = count_mean(level, sm.att1, sm.att2, sm.att3)
+        sm.total = count_total(level, sm.att1, sm.att2, sm.att3, sm.exam, sm.additional)
+        marks.append(sm)
+    StudentMark.objects.bulk_update(marks, ["mean", "total"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_provision_mark_sheets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentmark',
+            name='mean',
+            field=models.IntegerField(blank=True, editable=False, null=True, verbose_name='Взвешенный балл'),
+        ),
+        migrations.AddField(
+            model_name='studentmark',
+            name='total',
+            field=models.IntegerField(blank=True, editable=False, null=True, verbose_name='Итоговый балл'),
+        ),
+        migrations.AddIndex(
+            model_name='studentmark',
+            index=models.Index(fields=['total'], name='studentmark_total_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentmark',
+            index=models.Index(fields=['mark_group', 'total'], name='studentmark_group_total_idx'),
+        ),
+        migrations.RunPython(compute_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:13
+
+from django.db import migrations, models
+
+from api.search import ensure_search_index, drop_search_index
+
+
+def fill_search_text(apps, schema_editor):
+    Student = apps.get_model("api", "Student")
+    students = []
+    for student in Student.objects.select_related("user").iterator(chunk_size=2000):
+        user = student.user
+        text = f"{user.last_name} {user.first_name} {user.patronymic} {student.record_book_number}"
+        student.search_text = " ".join(text.casefold().replace("ё", "е").split())[:100]
+        students.append(student)
+    Student.objects.bulk_update(students, ["search_text"], batch_size=500)
+
+
+def create_search_index(apps, schema_editor):
+    ensure_search_index(schema_editor.connection.alias)
+
+
+def remove_search_index(apps, schema_editor):
+    drop_search_index(schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='search_text',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100, verbose_name='Строка поиска'),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, remove_search_index),
+    ]
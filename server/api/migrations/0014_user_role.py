@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+def fill_roles(apps, schema_editor):
+    User = apps.get_model("api", "User")
+    User.objects.filter(is_superuser=True).update(role="admin")
+    User.objects.filter(student__isnull=False).update(role="student")
+    User.objects.filter(professor__isnull=False).update(role="professor")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_student_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='role',
+            field=models.CharField(choices=[('professor', 'professor'), ('student', 'student'), ('admin', 'admin'), ('not set', 'not set')], db_index=True, default='not set', editable=False, max_length=10, verbose_name='Роль'),
+        ),
+        migrations.RunPython(fill_roles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:25
+
+from django.db import migrations, models
+from django.db.models import Count
+
+MARK_FIELDS = ("att1", "att2", "att3", "exam", "additional")
+
+
+def remove_duplicate_rows(apps, schema_editor):
+    """Keep one row per (mark_group, student): the graded one, most recently updated, oldest on ties."""
+    StudentMark = apps.get_model("api", "StudentMark")
+    duplicates = StudentMark.objects.values("mark_group", "student").annotate(rows=Count("pk")).filter(rows__gt=1)
+    doomed = []
+    for pair in duplicates:
+        rows = sorted(
+            StudentMark.objects.filter(mark_group=pair["mark_group"], student=pair["student"]),
+            key=lambda sm: (any(getattr(sm, f) is not None for f in MARK_FIELDS), sm.updated_at, -sm.pk),
+            reverse=True,
+        )
+        doomed += [sm.pk for sm in rows[1:]]
+    StudentMark.objects.filter(pk__in=doomed).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_user_tokens_valid_after'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='groupmark',
+            index=models.Index(fields=['group', 'semester'], name='groupmark_group_semester_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='groupmark',
+            index=models.Index(fields=['subject', 'semester'], name='groupmark_subject_semester_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='studentmark',
+            constraint=models.UniqueConstraint(fields=('mark_group', 'student'), name='studentmark_unique_row'),
+        ),
+    ]
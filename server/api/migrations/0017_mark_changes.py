@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:43
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def seed_change_log(apps, schema_editor):
+    """Log every existing row once, so that a feed read from cursor 0 covers all current data."""
+    GroupMark = apps.get_model("api", "GroupMark")
+    StudentMark = apps.get_model("api", "StudentMark")
+    MarkChange = apps.get_model("api", "MarkChange")
+    MarkChange.objects.bulk_create(
+        (MarkChange(kind="group_mark", object_id=pk, mark_group_pk=pk)
+         for pk in GroupMark.objects.order_by("pk").values_list("pk", flat=True).iterator()),
+        batch_size=2000,
+    )
+    MarkChange.objects.bulk_create(
+        (MarkChange(kind="student_mark", object_id=pk, student_pk=student, mark_group_pk=mark_group)
+         for pk, student, mark_group in StudentMark.objects.order_by("pk")
+         .values_list("pk", "student", "mark_group").iterator()),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_mark_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarkChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('student_mark', 'student mark'), ('group_mark', 'group mark')], max_length=12, verbose_name='Тип записи')),
+                ('object_id', models.BigIntegerField(verbose_name='Идентификатор записи')),
+                ('deleted', models.BooleanField(default=False, verbose_name='Удалена')),
+                ('student_pk', models.BigIntegerField(blank=True, null=True, verbose_name='Студент')),
+                ('mark_group_pk', models.BigIntegerField(verbose_name='Группа оценок')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Изменение оценок',
+                'verbose_name_plural': 'Изменения оценок',
+                'indexes': [models.Index(fields=['kind', 'object_id', 'id'], name='markchange_object_idx'), models.Index(fields=['student_pk', 'id'], name='markchange_student_idx'), models.Index(fields=['mark_group_pk', 'id'], name='markchange_group_idx')],
+            },
+        ),
+        migrations.RunPython(seed_change_log, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Avg, Count, Q
+from django.utils import timezone
+
+PASS_TOTAL = 50  # api.scoring.PASS_TOTAL when this migration was written
+
+
+def seed_semester_summaries(apps, schema_editor):
+    """Compute the summaries of the existing marks; later writes keep them up to date."""
+    StudentMark = apps.get_model("api", "StudentMark")
+    SemesterSummary = apps.get_model("api", "SemesterSummary")
+    rows = StudentMark.objects.order_by().values("student", "mark_group__semester").annotate(
+        subjects=Count("pk"),
+        passed=Count("pk", filter=Q(total__gte=PASS_TOTAL)),
+        failed=Count("pk", filter=Q(total__lt=PASS_TOTAL)),
+        average_total=Avg("total"),
+    )
+    now = timezone.now()
+    SemesterSummary.objects.bulk_create(
+        (SemesterSummary(student_id=row["student"], semester=row["mark_group__semester"], subjects=row["subjects"],
+                         passed=row["passed"], failed=row["failed"], debts=row["subjects"] - row["passed"],
+                         average_total=None if row["average_total"] is None else round(row["average_total"], 2),
+                         updated_at=now)
+         for row in rows.iterator()),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_mark_changes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SemesterSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('semester', models.IntegerField(verbose_name='Номер семестра')),
+                ('subjects', models.IntegerField(default=0, verbose_name='Дисциплин')),
+                ('passed', models.IntegerField(default=0, verbose_name='Сдано')),
+                ('failed', models.IntegerField(default=0, verbose_name='Не сдано')),
+                ('debts', models.IntegerField(default=0, verbose_name='Задолженностей')),
+                ('average_total', models.FloatField(blank=True, null=True, verbose_name='Средний итоговый балл')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='semester_summaries', to='api.student')),
+            ],
+            options={
+                'verbose_name': 'Итоги семестра',
+                'verbose_name_plural': 'Итоги семестров',
+                'indexes': [models.Index(fields=['semester', 'debts'], name='semestersummary_debts_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='semestersummary',
+            constraint=models.UniqueConstraint(fields=('student', 'semester'), name='semestersummary_unique_row'),
+        ),
+        migrations.RunPython(seed_semester_summaries, migrations.RunPython.noop),
+    ]
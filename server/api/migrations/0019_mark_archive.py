@@ -0,0 +1,56 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_semester_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedGroupMark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('semester', models.IntegerField(verbose_name='Номер семестра')),
+                ('reporting_level', models.CharField(choices=[('t', 'test'), ('d', 'differentiated test'), ('e', 'exam')], max_length=1, verbose_name='Отчетность дисциплины')),
+                ('updated_at', models.DateTimeField(verbose_name='Дата изменения')),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата архивации')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='api.coursegroup')),
+                ('professor', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='api.professor')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='api.subject')),
+            ],
+            options={
+                'verbose_name': 'Архивная группа оценок',
+                'verbose_name_plural': 'Архивные группы оценок',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedStudentMark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('att1', models.IntegerField(blank=True, null=True, verbose_name='Оценка за аттестацию 1')),
+                ('att2', models.IntegerField(blank=True, null=True, verbose_name='Оценка за аттестацию 2')),
+                ('att3', models.IntegerField(blank=True, null=True, verbose_name='Оценка за аттестацию 3')),
+                ('exam', models.IntegerField(blank=True, null=True, verbose_name='Оценка за экзамен')),
+                ('additional', models.IntegerField(blank=True, null=True, verbose_name='Дополнительные баллы')),
+                ('mean', models.IntegerField(blank=True, editable=False, null=True, verbose_name='Взвешенный балл')),
+                ('total', models.IntegerField(blank=True, editable=False, null=True, verbose_name='Итоговый балл')),
+                ('updated_at', models.DateTimeField(verbose_name='Дата изменения')),
+                ('mark_group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.archivedgroupmark')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='api.student')),
+            ],
+            options={
+                'verbose_name': 'Архивные оценки студента',
+                'verbose_name_plural': 'Архивные оценки студентов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='archivedstudentmark',
+            constraint=models.UniqueConstraint(fields=('mark_group', 'student'), name='archivedstudentmark_unique_row'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:08
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_professors(apps, schema_editor):
+    """Owners of the existing entries, from the sheets that still exist."""
+    MarkChange = apps.get_model("api", "MarkChange")
+    for model_name in ("GroupMark", "ArchivedGroupMark"):
+        sheets = apps.get_model("api", model_name).objects.filter(pk=OuterRef("mark_group_pk"))
+        MarkChange.objects.filter(professor_pk__isnull=True) \
+            .update(professor_pk=Subquery(sheets.values("professor")[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_mark_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='markchange',
+            name='professor_pk',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='Преподаватель'),
+        ),
+        migrations.AddIndex(
+            model_name='markchange',
+            index=models.Index(fields=['professor_pk', 'id'], name='markchange_professor_idx'),
+        ),
+        migrations.RunPython(fill_professors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:21
+
+from django.db import migrations, models
+
+
+def fill_sort_names(apps, schema_editor):
+    Professor = apps.get_model("api", "Professor")
+    professors = []
+    for professor in Professor.objects.select_related("user").iterator(chunk_size=2000):
+        user = professor.user
+        text = f"{user.last_name} {user.first_name} {user.patronymic}"
+        professor.sort_name = " ".join(text.casefold().replace("ё", "е").split())[:100]
+        professors.append(professor)
+    Professor.objects.bulk_update(professors, ["sort_name"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_subject_group_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='professor',
+            name='sort_name',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100, verbose_name='Ключ сортировки'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['record_book_number', 'id'], name='student_record_book_idx'),
+        ),
+        migrations.RunPython(fill_sort_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:49
+
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def recount_debts(apps, schema_editor):
+    """Debts become failed subjects plus ungraded ones of archived sheets; the rest is split out as ungraded."""
+    SemesterSummary = apps.get_model("api", "SemesterSummary")
+    ArchivedStudentMark = apps.get_model("api", "ArchivedStudentMark")
+    SemesterSummary.objects.update(ungraded=F("subjects") - F("passed") - F("failed"), debts=F("failed"))
+    rows = ArchivedStudentMark.objects.filter(total__isnull=True).order_by() \
+        .values_list("student", "mark_group__semester").annotate(ungraded=Count("pk"))
+    for student, semester, ungraded in rows.iterator():
+        SemesterSummary.objects.filter(student=student, semester=semester).update(debts=F("debts") + ungraded)
+
+
+def restore_debts(apps, schema_editor):
+    SemesterSummary = apps.get_model("api", "SemesterSummary")
+    SemesterSummary.objects.update(debts=F("subjects") - F("passed"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_keyset_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='semestersummary',
+            name='ungraded',
+            field=models.IntegerField(default=0, verbose_name='Без оценки'),
+        ),
+        migrations.RunPython(recount_debts, restore_debts),
+    ]
@@ -5,11 +5,17 @@ from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import PermissionsMixin, AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
+from django.utils import timezone
 
+from api.scoring import count_mean, count_total, PASS_TOTAL
 from api.validators import CustomUnicodeUsernameValidator
 from django.utils.translation import gettext_lazy as _
 
 
+def normalize_search_text(value):
+    return " ".join(value.casefold().replace("ё", "е").split())
+
+
 class UserManager(BaseUserManager):
     use_in_migrations = True
 
@@ -101,6 +107,21 @@ class User(AbstractUser):
             'Unselect this instead of deleting accounts.'
         )
     )
+    updated_at = models.DateTimeField(_('Дата изменения'), auto_now=True)
+
+    ROLES = [
+        ("professor", "professor"),
+        ("student", "student"),
+        ("admin", "admin"),
+        ("not set", "not set"),
+    ]
+    role = models.CharField(_('Роль'), max_length=10, choices=ROLES, default="not set",
+                            editable=False, db_index=True)
+    tokens_valid_after = models.DateTimeField(_('Токены действительны после'), null=True, blank=True,
+                                              editable=False)
+
+    # Fields copied into access token claims (or guarding them): changing one revokes issued tokens.
+    TOKEN_FIELDS = ("is_active", "is_staff", "is_superuser", "role", "password")
 
     objects = UserManager()
 
@@ -116,15 +137,40 @@ class User(AbstractUser):
         verbose_name_plural = 'Пользователи'
 
     def get_role(self) -> str:
-        if hasattr(self, "professor"):
+        return self.role
+
+    def resolve_role(self) -> str:
+        if self.pk is not None and Professor.objects.filter(user=self.pk).exists():
             return "professor"
-        elif hasattr(self, "student"):
+        elif self.pk is not None and Student.objects.filter(user=self.pk).exists():
             return "student"
         elif self.is_superuser:
             return "admin"
         else:
             return "not set"
 
+    def refresh_role(self):
+        role = self.resolve_role()
+        if role != self.role:
+            self.role = role
+            self.tokens_valid_after = timezone.now()
+            User.objects.filter(pk=self.pk).update(role=role, tokens_valid_after=self.tokens_valid_after)
+
+    def save(self, *args, **kwargs):
+        # Professor and student roles are set by their own signals; here only is_superuser can change the role.
+        update_fields = kwargs.get("update_fields")
+        if self.role in ("admin", "not set") and (update_fields is None or "is_superuser" in update_fields):
+            self.role = self.resolve_role()
+            if update_fields is not None:
+                kwargs["update_fields"] = update_fields = {*update_fields, "role"}
+        if self.pk is not None and (update_fields is None or set(self.TOKEN_FIELDS) & set(update_fields)):
+            stored = User.objects.filter(pk=self.pk).values_list(*self.TOKEN_FIELDS).first()
+            if stored is not None and stored != tuple(getattr(self, field) for field in self.TOKEN_FIELDS):
+                self.tokens_valid_after = timezone.now()
+                if update_fields is not None:
+                    kwargs["update_fields"] = {*update_fields, "tokens_valid_after"}
+        super().save(*args, **kwargs)
+
 
 class Student(models.Model):
     year_of_enrollment = models.CharField(_('Год поступления'), max_length=4, blank=False)
@@ -140,6 +186,8 @@ class Student(models.Model):
         on_delete=models.DO_NOTHING,
         related_name='student_group',
         blank=True, null=True)
+    updated_at = models.DateTimeField(_('Дата изменения'), auto_now=True)
+    search_text = models.CharField(_('Строка поиска'), max_length=100, blank=True, editable=False, db_index=True)
 
     def __str__(self):
         return str(self.user)
@@ -147,6 +195,23 @@ class Student(models.Model):
     class Meta:
         verbose_name = 'Студент'
         verbose_name_plural = 'Студенты'
+        indexes = [
+            # Keyset pages of the students list sorted by record book number.
+            models.Index(fields=["record_book_number", "id"], name="student_record_book_idx"),
+        ]
+
+    @staticmethod
+    def build_search_text(user, record_book_number):
+        return normalize_search_text(
+            f"{user.last_name} {user.first_name} {user.patronymic} {record_book_number}"
+        )[:100]
+
+    def save(self, *args, **kwargs):
+        self.search_text = self.build_search_text(self.user, self.record_book_number)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "search_text"}
+        super().save(*args, **kwargs)
 
 
 class Professor(models.Model):
@@ -157,6 +222,8 @@ class Professor(models.Model):
         on_delete=models.CASCADE,
         related_name='professor',
         blank=False, null=False)
+    updated_at = models.DateTimeField(_('Дата изменения'), auto_now=True)
+    sort_name = models.CharField(_('Ключ сортировки'), max_length=100, blank=True, editable=False, db_index=True)
 
     def __str__(self):
         return str(self.user)
@@ -165,6 +232,17 @@ class Professor(models.Model):
         verbose_name = 'Преподаватель'
         verbose_name_plural = 'Преподаватели'
 
+    @staticmethod
+    def build_sort_name(user):
+        return normalize_search_text(f"{user.last_name} {user.first_name} {user.patronymic}")[:100]
+
+    def save(self, *args, **kwargs):
+        self.sort_name = self.build_sort_name(self.user)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "sort_name"}
+        super().save(*args, **kwargs)
+
 
 class Direction(models.Model):
     name = models.CharField(_('Название направления'), max_length=50, blank=False)
@@ -180,6 +258,7 @@ class Direction(models.Model):
 
 class Subject(models.Model):
     name = models.CharField(_('Навзвание предмета'), max_length=150, blank=False)
+    updated_at = models.DateTimeField(_('Дата изменения'), auto_now=True)
 
     def __str__(self):
         return self.name
@@ -208,6 +287,7 @@ class CourseGroup(models.Model):
     higher_education_level = models.CharField(
         _('Ступень высшего образования'),
         max_length=1, choices=EDUCATION_LEVELS, blank=True)
+    updated_at = models.DateTimeField(_('Дата изменения'), auto_now=True)
 
     def __str__(self):
         return f"{self.course_number} курс {self.group_number} группа {self.EDUCATION_LEVELS_RU[self.higher_education_level]}"
@@ -217,7 +297,20 @@ class CourseGroup(models.Model):
         verbose_name_plural = 'Курсы-группы'
 
 
-class GroupMark(models.Model):
+def _subjects_by_pk(lookup):
+    # A fixed order keeps serialized subject lists stable between requests.
+    return models.Prefetch(lookup, queryset=Subject.objects.order_by("pk"))
+
+
+class GroupMarkQuerySet(models.QuerySet):
+    def with_related(self):
+        return self.select_related(
+            "subject", "group", "professor__user",
+        ).prefetch_related(_subjects_by_pk("professor__subjects"))
+
+
+class AbstractGroupMark(models.Model):
+    """Fields of a mark sheet, shared by the live GroupMark table and its archive."""
     subject = models.ForeignKey("Subject", on_delete=models.DO_NOTHING)
     professor = models.ForeignKey("Professor", on_delete=models.DO_NOTHING)
     group = models.ForeignKey("CourseGroup", on_delete=models.DO_NOTHING)
@@ -231,16 +324,55 @@ class GroupMark(models.Model):
     reporting_level = models.CharField(
         _('Отчетность дисциплины'),
         max_length=1, choices=REPORTING_LEVELS, blank=False)
+    updated_at = models.DateTimeField(_('Дата изменения'), auto_now=True)
+
+    objects = GroupMarkQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.subject} Профессор: {self.professor} Группа: {self.group} {self.semester} семестр"
 
+    class Meta:
+        abstract = True
+
+
+class GroupMark(AbstractGroupMark):
     class Meta:
         verbose_name = "Группа оценок"
         verbose_name_plural = 'Группы оценок'
+        # professor_id is covered by its foreign key index.
+        indexes = [
+            models.Index(fields=["group", "semester"], name="groupmark_group_semester_idx"),
+            models.Index(fields=["subject", "semester"], name="groupmark_subject_semester_idx"),
+        ]
+
+
+class ArchivedGroupMark(AbstractGroupMark):
+    """A GroupMark of a closed period, moved here by api.archive with its id and its rows."""
+    # Kept as it was when the sheet was archived.
+    updated_at = models.DateTimeField(_('Дата изменения'))
+    archived_at = models.DateTimeField(_('Дата архивации'), default=timezone.now)
+
+    class Meta:
+        verbose_name = "Архивная группа оценок"
+        verbose_name_plural = 'Архивные группы оценок'
+
+
+class StudentMarkQuerySet(models.QuerySet):
+    def with_related(self):
+        return self.select_related(
+            "mark_group__subject", "mark_group__group", "mark_group__professor__user",
+            "student__group", "student__user",
+        ).prefetch_related(_subjects_by_pk("mark_group__professor__subjects"))
 
+    def failing(self):
+        return self.filter(total__lt=PASS_TOTAL)
 
-class StudentMark(models.Model):
+    def ranked(self):
+        return self.filter(total__isnull=False).order_by("-total")
+
+
+class AbstractStudentMark(models.Model):
+    """Fields of a mark sheet row, shared by the live StudentMark table and its archive."""
     mark_group = models.ForeignKey("GroupMark", on_delete=models.CASCADE)
     student = models.ForeignKey("Student", on_delete=models.DO_NOTHING)
     att1 = models.IntegerField("Оценка за аттестацию 1", null=True, blank=True)
@@ -248,10 +380,111 @@ class StudentMark(models.Model):
     att3 = models.IntegerField("Оценка за аттестацию 3", null=True, blank=True)
     exam = models.IntegerField("Оценка за экзамен", null=True, blank=True)
     additional = models.IntegerField("Дополнительные баллы", null=True, blank=True)
+    mean = models.IntegerField("Взвешенный балл", null=True, blank=True, editable=False)
+    total = models.IntegerField("Итоговый балл", null=True, blank=True, editable=False)
+    updated_at = models.DateTimeField("Дата изменения", auto_now=True)
+
+    objects = StudentMarkQuerySet.as_manager()
+
+    SCORE_FIELDS = ("mean", "total")
 
     class Meta:
-        verbose_name = 'Оценкки студента'
-        verbose_name_plural = 'Оценки студентов'
+        abstract = True
 
     def __str__(self):
         return f"{self.mark_group} Студента: {self.student}"
+
+
+class StudentMark(AbstractStudentMark):
+    class Meta:
+        verbose_name = 'Оценкки студента'
+        verbose_name_plural = 'Оценки студентов'
+        indexes = [
+            models.Index(fields=["total"], name="studentmark_total_idx"),
+            models.Index(fields=["mark_group", "total"], name="studentmark_group_total_idx"),
+        ]
+        constraints = [
+            # One row per student and sheet; its index also serves the sheet lookups.
+            models.UniqueConstraint(fields=["mark_group", "student"], name="studentmark_unique_row"),
+        ]
+
+    def refresh_scores(self):
+        """Recompute mean and total; returns True if either of them changed."""
+        level = self.mark_group.reporting_level
+        scores = (
+            count_mean(level, self.att1, self.att2, self.att3),
+            count_total(level, self.att1, self.att2, self.att3, self.exam, self.additional),
+        )
+        changed = scores != (self.mean, self.total)
+        self.mean, self.total = scores
+        return changed
+
+    def save(self, *args, **kwargs):
+        self.refresh_scores()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, *self.SCORE_FIELDS}
+        super().save(*args, **kwargs)
+
+
+class ArchivedStudentMark(AbstractStudentMark):
+    """A frozen StudentMark of an archived sheet; transcripts read both tables."""
+    mark_group = models.ForeignKey("ArchivedGroupMark", on_delete=models.CASCADE)
+    updated_at = models.DateTimeField("Дата изменения")
+
+    class Meta:
+        verbose_name = 'Архивные оценки студента'
+        verbose_name_plural = 'Архивные оценки студентов'
+        constraints = [
+            models.UniqueConstraint(fields=["mark_group", "student"], name="archivedstudentmark_unique_row"),
+        ]
+
+
+class SemesterSummary(models.Model):
+    """Per student and semester aggregates of StudentMark rows, kept up to date by api.summaries."""
+    student = models.ForeignKey("Student", on_delete=models.CASCADE, related_name="semester_summaries")
+    semester = models.IntegerField(_("Номер семестра"))
+    subjects = models.IntegerField(_("Дисциплин"), default=0)
+    passed = models.IntegerField(_("Сдано"), default=0)
+    failed = models.IntegerField(_("Не сдано"), default=0)
+    ungraded = models.IntegerField(_("Без оценки"), default=0)
+    debts = models.IntegerField(_("Задолженностей"), default=0)
+    average_total = models.FloatField(_("Средний итоговый балл"), null=True, blank=True)
+    updated_at = models.DateTimeField(_('Дата изменения'), auto_now=True)
+
+    class Meta:
+        verbose_name = 'Итоги семестра'
+        verbose_name_plural = 'Итоги семестров'
+        constraints = [
+            models.UniqueConstraint(fields=["student", "semester"], name="semestersummary_unique_row"),
+        ]
+        indexes = [
+            models.Index(fields=["semester", "debts"], name="semestersummary_debts_idx"),
+        ]
+
+
+class MarkChange(models.Model):
+    """Append-only log of StudentMark and GroupMark writes; the id is the cursor of the change feed."""
+    KINDS = [
+        ("student_mark", "student mark"),
+        ("group_mark", "group mark"),
+    ]
+    kind = models.CharField(_('Тип записи'), max_length=12, choices=KINDS)
+    object_id = models.BigIntegerField(_('Идентификатор записи'))
+    deleted = models.BooleanField(_('Удалена'), default=False)
+    # Plain ids rather than foreign keys: entries outlive the rows they describe.
+    student_pk = models.BigIntegerField(_('Студент'), null=True, blank=True)
+    mark_group_pk = models.BigIntegerField(_('Группа оценок'))
+    # Owner of the sheet when the entry was written: tombstones stay visible to them.
+    professor_pk = models.BigIntegerField(_('Преподаватель'), null=True, blank=True)
+    created_at = models.DateTimeField(_('Дата изменения'), default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Изменение оценок'
+        verbose_name_plural = 'Изменения оценок'
+        indexes = [
+            models.Index(fields=["kind", "object_id", "id"], name="markchange_object_idx"),
+            models.Index(fields=["student_pk", "id"], name="markchange_student_idx"),
+            models.Index(fields=["mark_group_pk", "id"], name="markchange_group_idx"),
+            models.Index(fields=["professor_pk", "id"], name="markchange_professor_idx"),
+        ]
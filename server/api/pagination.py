@@ -0,0 +1,112 @@
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination on (sort key, pk): every page is an index range scan, however deep it is.
+
+    Views list the allowed sort keys in `keyset_ordering_fields` ({"name": "orm__lookup"});
+    clients pick one with ?ordering=name or ?ordering=-name, the default is pk.
+    """
+    cursor_query_param = "cursor"
+    ordering_query_param = "ordering"
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+    @property
+    def page_size(self):
+        return getattr(settings, "KEYSET_PAGE_SIZE", 50)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_ordering(self, request, view):
+        requested = request.query_params.get(self.ordering_query_param, "pk")
+        descending = requested.startswith("-")
+        fields = getattr(view, "keyset_ordering_fields", {})
+        field = fields.get(requested.lstrip("-"), "pk")
+        return field, descending
+
+    def encode_cursor(self, values):
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            return value, int(pk)
+        except (TypeError, ValueError):
+            raise NotFound("Неверный курсор.")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        field, descending = self.get_ordering(request, view)
+        page_size = self.get_page_size(request)
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            value, pk = cursor
+            after = "lt" if descending else "gt"
+            if field == "pk":
+                queryset = queryset.filter(**{f"pk__{after}": pk})
+            else:
+                queryset = queryset.filter(
+                    Q(**{f"{field}__{after}": value}) | Q(**{field: value, f"pk__{after}": pk})
+                )
+
+        prefix = "-" if descending else ""
+        ordering = [f"{prefix}pk"] if field == "pk" else [f"{prefix}{field}", f"{prefix}pk"]
+        page = list(queryset.order_by(*ordering)[:page_size + 1])
+
+        self.next_cursor = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            last = page[-1]
+            value = last.pk if field == "pk" else self._value(last, field)
+            self.next_cursor = self.encode_cursor([value, last.pk])
+        return page
+
+    @staticmethod
+    def _value(obj, lookup):
+        for attr in lookup.split("__"):
+            obj = getattr(obj, attr)
+        return obj
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {"name": self.cursor_query_param, "required": False, "in": "query", "schema": {"type": "string"}},
+            {"name": self.page_size_query_param, "required": False, "in": "query", "schema": {"type": "integer"}},
+            {"name": self.ordering_query_param, "required": False, "in": "query", "schema": {"type": "string"}},
+        ]
@@ -0,0 +1,284 @@
+"""Bulk creation of student and professor accounts from a roster file.
+
+Passwords go through AUTH_PASSWORD_VALIDATORS, are hashed (across a process pool for the
+management command: PBKDF2 is CPU-bound and holds the GIL), then users and their profiles
+are inserted with bulk_create in chunks, in one transaction. Nothing is written unless
+every row is valid.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from rest_framework import serializers
+
+from api.models import User, Student, Professor, CourseGroup
+from api.ranking import rankings
+from api.sheets import provision_students
+from api.tabular import iter_rows
+from api.validators import CustomUnicodeUsernameValidator
+
+ROLES = ("student", "professor")
+
+# Accepted header names (compared case-insensitively) for each column.
+COLUMNS = {
+    "username": ("username", "логин"),
+    "email": ("email", "e-mail", "почта", "адрес электронной почты"),
+    "password": ("password", "пароль"),
+    "last_name": ("last_name", "фамилия"),
+    "first_name": ("first_name", "имя"),
+    "patronymic": ("patronymic", "отчество"),
+    "record_book_number": ("record_book_number", "номер зачетной книжки", "номер зачётной книжки"),
+    "year_of_enrollment": ("year_of_enrollment", "год поступления"),
+    "group": ("group", "группа", "номер группы"),
+    # Group numbers repeat across courses and levels; these tell such groups apart.
+    "course": ("course", "курс", "номер курса"),
+    "level": ("level", "ступень", "ступень высшего образования"),
+}
+# Education levels by code, English and Russian name.
+LEVELS = {
+    **{code: code for code, _ in CourseGroup.EDUCATION_LEVELS},
+    **{name: code for code, name in CourseGroup.EDUCATION_LEVELS},
+    **{name: code for code, name in CourseGroup.EDUCATION_LEVELS_RU.items()},
+}
+MAX_REPORTED_ERRORS = 1000
+LOOKUP_CHUNK_SIZE = 500
+
+
+class ProfessorRowSerializer(serializers.Serializer):
+    username = serializers.CharField(max_length=50, validators=[CustomUnicodeUsernameValidator()])
+    email = serializers.EmailField()
+    password = serializers.CharField(required=False, allow_null=True)
+    last_name = serializers.CharField(max_length=20)
+    first_name = serializers.CharField(max_length=20)
+    patronymic = serializers.CharField(max_length=20, required=False, allow_null=True)
+
+    def validate(self, attrs):
+        if attrs.get("password") is not None:
+            user = User(username=attrs["username"], email=attrs["email"],
+                        first_name=attrs["first_name"], last_name=attrs["last_name"])
+            try:
+                validate_password(attrs["password"], user)
+            except ValidationError as e:
+                raise serializers.ValidationError({"password": e.messages})
+        return attrs
+
+
+class StudentRowSerializer(ProfessorRowSerializer):
+    record_book_number = serializers.CharField(max_length=20, required=False, allow_null=True)
+    year_of_enrollment = serializers.RegexField(r"^\d{4}$")
+    group = serializers.CharField(max_length=10, required=False, allow_null=True)
+    course = serializers.IntegerField(min_value=1, max_value=5, required=False, allow_null=True)
+    level = serializers.CharField(required=False, allow_null=True)
+
+    def validate_level(self, value):
+        if value is None:
+            return None
+        if value.casefold() not in LEVELS:
+            levels = ", ".join(CourseGroup.EDUCATION_LEVELS_RU.values())
+            raise serializers.ValidationError(f"Допустимые значения: {levels}.")
+        return LEVELS[value.casefold()]
+
+
+ROW_SERIALIZERS = {"student": StudentRowSerializer, "professor": ProfessorRowSerializer}
+
+
+def _column_names(header):
+    names = {}
+    for column, aliases in COLUMNS.items():
+        for alias in aliases:
+            if alias in header:
+                names[column] = alias
+                break
+    return names
+
+
+def _cell(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # spreadsheets store numbers (record books, years) as floats
+    return None if value is None else str(value)
+
+
+def _existing(field, values):
+    found = set()
+    values = list(values)
+    for start in range(0, len(values), LOOKUP_CHUNK_SIZE):
+        found.update(User.objects.filter(**{f"{field}__in": values[start:start + LOOKUP_CHUNK_SIZE]})
+                     .values_list(field, flat=True))
+    return found
+
+
+def hash_passwords(passwords, workers=None):
+    """make_password() for each password, spread over `workers` processes (PROVISIONING_WORKERS by default).
+
+    workers=1 hashes in the calling process; web requests use it rather than fork the server worker.
+    """
+    passwords = list(passwords)
+    workers = workers or getattr(settings, "PROVISIONING_WORKERS", None) or os.cpu_count() or 1
+    workers = min(workers, len(passwords))
+    if workers <= 1:
+        return [make_password(password) for password in passwords]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+class Provisioning:
+    def __init__(self, role, workers=None, chunk_size=500):
+        if role not in ROLES:
+            raise ValueError(f"Unknown role {role!r}.")
+        self.role = role
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self.errors = []
+        self.error_count = 0
+        self.created = []
+        self.timings = {}
+        self._valid = []
+
+    def error(self, line, username, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "username": username, "errors": errors})
+
+    def read(self, fileobj, filename):
+        started = time.perf_counter()
+        serializer_class = ROW_SERIALIZERS[self.role]
+        names = None
+        for line, row in iter_rows(fileobj, filename):
+            if names is None:
+                names = _column_names(row.keys())
+            self.rows += 1
+            data = {column: _cell(row[name]) for column, name in names.items()}
+            serializer = serializer_class(data=data)
+            if serializer.is_valid():
+                values = serializer.validated_data
+                values["email"] = User.objects.normalize_email(values["email"])
+                self._valid.append((line, values))
+            else:
+                self.error(line, data.get("username"), serializer.errors)
+        self._check_unique()
+        if self.role == "student":
+            self._resolve_groups()
+        self.timings["validate"] = time.perf_counter() - started
+        return self
+
+    def _check_unique(self):
+        rows = self._valid
+        taken = {
+            "username": _existing("username", {values["username"] for _, values in rows}),
+            "email": _existing("email", {values["email"] for _, values in rows}),
+        }
+        seen = {"username": {}, "email": {}}
+        self._valid = []
+        for line, values in rows:
+            errors = {}
+            for field in ("username", "email"):
+                value = values[field]
+                if value in taken[field]:
+                    errors[field] = ["Пользователь с таким значением уже существует."]
+                elif value in seen[field]:
+                    errors[field] = [f"Повторяет строку {seen[field][value]}."]
+                else:
+                    seen[field][value] = line
+            if errors:
+                self.error(line, values["username"], errors)
+            else:
+                self._valid.append((line, values))
+
+    def _resolve_groups(self):
+        numbers = {values["group"] for _, values in self._valid if values.get("group")}
+        groups = {}
+        for group in CourseGroup.objects.filter(group_number__in=numbers):
+            groups.setdefault(group.group_number, []).append(group)
+        rows = self._valid
+        self._valid = []
+        for line, values in rows:
+            number, course, level = values.get("group"), values.pop("course", None), values.pop("level", None)
+            matches = [group for group in groups.get(number, ())
+                       if course in (None, group.course_number) and level in (None, group.higher_education_level)]
+            if number and not matches:
+                self.error(line, values["username"], {"group": [f"Группа {number} не найдена."]})
+                continue
+            if len(matches) > 1:
+                self.error(line, values["username"], {"group": [
+                    f"Группа {number} есть на нескольких курсах или ступенях: укажите курс и ступень."]})
+                continue
+            values["group"] = matches[0] if matches else None
+            self._valid.append((line, values))
+
+    def apply(self):
+        """Hash the passwords and insert the accounts; does nothing if any row was rejected."""
+        if self.error_count or not self._valid:
+            return []
+        started = time.perf_counter()
+        hashes = hash_passwords((values.get("password") for _, values in self._valid), self.workers)
+        self.timings["hash"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            for start in range(0, len(self._valid), self.chunk_size):
+                chunk = self._valid[start:start + self.chunk_size]
+                self.created.extend(self._insert(chunk, hashes[start:start + self.chunk_size]))
+        self.timings["insert"] = time.perf_counter() - started
+        return self.created
+
+    def _insert(self, rows, hashes):
+        users = User.objects.bulk_create(
+            User(username=values["username"], email=values["email"],
+                 password=password, first_name=values["first_name"], last_name=values["last_name"],
+                 patronymic=values.get("patronymic") or "", role=self.role)
+            for (_, values), password in zip(rows, hashes)
+        )
+        if any(user.pk is None for user in users):
+            # Backends that cannot return ids from a bulk insert.
+            pks = dict(User.objects.filter(username__in=[user.username for user in users])
+                       .values_list("username", "pk"))
+            for user in users:
+                user.pk = pks[user.username]
+
+        if self.role == "professor":
+            return Professor.objects.bulk_create(Professor(user=user, sort_name=Professor.build_sort_name(user))
+                                             for user in users)
+
+        students = Student.objects.bulk_create(
+            Student(user=user, group=values["group"], year_of_enrollment=values["year_of_enrollment"],
+                    record_book_number=values.get("record_book_number") or "",
+                    search_text=Student.build_search_text(user, values.get("record_book_number") or ""))
+            for (_, values), user in zip(rows, users)
+        )
+        if any(student.pk is None for student in students):
+            pks = dict(Student.objects.filter(user__in=users).values_list("user_id", "pk"))
+            for student in students:
+                student.pk = pks[student.user_id]
+        # bulk_create skips post_save: do what the student_saved signal would.
+        provision_students(students)
+        in_group = [student for student in students if student.group_id is not None]
+        transaction.on_commit(lambda: [rankings.student_changed(student) for student in in_group])
+        return students
+
+    def report(self, dry_run):
+        total = sum(self.timings.values())
+        created = len(self.created)
+        return {
+            "role": self.role,
+            "dry_run": dry_run,
+            "rows": self.rows,
+            "created": created,
+            "error_count": self.error_count,
+            "errors": self.errors,
+            "timings": {stage: round(seconds, 3) for stage, seconds in self.timings.items()},
+            "users_per_second": round(created / total, 1) if created and total else None,
+        }
+
+
+def provision_users(role, fileobj, filename, dry_run=False, workers=None, chunk_size=500):
+    """Read the roster and, unless `dry_run` or some rows are invalid, create the accounts; returns the report."""
+    result = Provisioning(role, workers, chunk_size).read(fileobj, filename)
+    if not dry_run:
+        result.apply()
+    return result.report(dry_run)
@@ -0,0 +1,147 @@
+"""In-process sorted ranking indexes, kept current from mark writes instead of re-sorting per request."""
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+
+from django.conf import settings
+from django.db.models import Avg
+
+from api.models import Student, StudentMark, GroupMark
+from api.routers import use_replica
+
+SCOPES = ("group", "course", "direction")
+
+# Lookups identifying a scope; a course is a (course number, education level) pair.
+_SCOPE_FILTERS = {
+    "group": ("student__group",),
+    "course": ("student__group__course_number", "student__group__higher_education_level"),
+    "direction": ("mark_group__subject__directions",),
+}
+
+INF = float("inf")
+
+
+class ScopeIndex:
+    """Students of one scope sorted by descending score; ties share the same (competition) rank."""
+
+    def __init__(self, scores):
+        self.scores = dict(scores)
+        self.keys = sorted((-score, pk) for pk, score in self.scores.items())
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, student_pk):
+        return student_pk in self.scores
+
+    def update(self, student_pk, score):
+        old = self.scores.pop(student_pk, None)
+        if old is not None:
+            del self.keys[bisect_left(self.keys, (-old, student_pk))]
+        if score is not None:
+            self.scores[student_pk] = score
+            insort(self.keys, (-score, student_pk))
+
+    def rank_of_score(self, score):
+        return bisect_left(self.keys, (-score, -INF)) + 1
+
+    def position(self, student_pk):
+        score = self.scores.get(student_pk)
+        if score is None:
+            return None
+        below = len(self.keys) - bisect_right(self.keys, (-score, INF))
+        return {
+            "rank": self.rank_of_score(score),
+            "count": len(self.keys),
+            "score": round(score, 2),
+            "percentile": round(100 * below / len(self.keys), 2),
+        }
+
+    def page(self, offset, limit):
+        return [
+            {"student": pk, "rank": self.rank_of_score(-neg_score), "score": round(-neg_score, 2)}
+            for neg_score, pk in self.keys[offset:offset + limit]
+        ]
+
+
+def course_scope(group):
+    """Id of the course scope of a CourseGroup."""
+    return group.course_number, group.higher_education_level
+
+
+def scope_scores(scope, scope_id, students=None):
+    """Average total of every ranked student of the scope, or only of `students`."""
+    lookups = _SCOPE_FILTERS[scope]
+    sms = StudentMark.objects.filter(**dict(zip(lookups, scope_id if len(lookups) > 1 else (scope_id,))),
+                                     total__isnull=False)
+    if students is not None:
+        sms = sms.filter(student__in=students)
+    return dict(sms.values_list("student").annotate(score=Avg("total")).order_by())
+
+
+class RankingIndex:
+    """Lazily built ScopeIndex per (scope, id).
+
+    Writes made in this process are applied incrementally; indexes older than
+    RANKING_INDEX_TTL seconds are rebuilt to pick up writes of other processes.
+    Indexes are shared by all requests, so they are always built from the primary:
+    a lagging replica would miss writes that were already applied incrementally.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._indexes = {}
+
+    @property
+    def ttl(self):
+        return getattr(settings, "RANKING_INDEX_TTL", 300)
+
+    def get(self, scope, scope_id):
+        key = (scope, scope_id)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None or time.monotonic() - index.built_at > self.ttl:
+                with use_replica(False):
+                    index = self._indexes[key] = ScopeIndex(scope_scores(scope, scope_id))
+            return index
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+    def marks_changed(self, marks):
+        with self._lock:
+            built = list(self._indexes.items())
+        if not built:
+            return
+
+        students = {sm.student_id for sm in marks}
+        groups = list(Student.objects.filter(pk__in=students)
+                      .values_list("group", "group__course_number", "group__higher_education_level"))
+        directions = GroupMark.objects.filter(pk__in={sm.mark_group_id for sm in marks}) \
+            .values_list("subject__directions", flat=True)
+        affected = {("group", group) for group, *_ in groups} | {("course", tuple(course)) for _, *course in groups} \
+            | {("direction", direction) for direction in directions}
+
+        for key, index in built:
+            if key not in affected:
+                continue
+            scores = scope_scores(*key, students)
+            with self._lock:
+                for pk in students:
+                    if pk in index or pk in scores:
+                        index.update(pk, scores.get(pk))
+
+    def student_changed(self, student):
+        """Drop the group/course indexes the student may have left or joined."""
+        joined = {("group", student.group_id)}
+        if student.group_id is not None:
+            joined.add(("course", course_scope(student.group)))
+        with self._lock:
+            for key in [key for key, index in self._indexes.items()
+                        if key in joined or (key[0] != "direction" and student.pk in index)]:
+                del self._indexes[key]
+
+
+rankings = RankingIndex()
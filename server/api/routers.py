@@ -0,0 +1,180 @@
+"""Read replica routing.
+
+Reads go to the replica only inside `use_replica()`: report jobs use it directly, views opt
+in with `ReplicaReadsMixin`. A user who has just written is pinned to the primary for
+REPLICA_STICKY_SECONDS so they read their own writes while the replica catches up.
+"""
+import os
+import sqlite3
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.permissions import SAFE_METHODS
+
+_reads_from_replica = ContextVar("reads_from_replica", default=False)
+
+
+def replica_alias():
+    alias = getattr(settings, "REPLICA_DATABASE_ALIAS", "replica")
+    return alias if alias in settings.DATABASES else None
+
+
+def reading_from_replica():
+    return _reads_from_replica.get() and replica_alias() is not None
+
+
+@contextmanager
+def use_replica(enabled=True):
+    token = _reads_from_replica.set(enabled)
+    try:
+        yield
+    finally:
+        _reads_from_replica.reset(token)
+
+
+def _generation_path(alias):
+    return f"{settings.DATABASES[alias]['NAME']}.generation"
+
+
+def bump_replica_version():
+    """Record that the replica holds a new snapshot; sync_replica calls it after every copy.
+
+    The replica file itself is no marker: in WAL mode a copy may land in its -wal file only.
+    """
+    alias = replica_alias()
+    if alias is None:
+        return
+    path = _generation_path(alias)
+    with open(f"{path}.tmp", "w") as marker:
+        marker.write(uuid.uuid4().hex)
+    os.replace(f"{path}.tmp", path)
+
+
+def replica_version():
+    """Token of the replica snapshot, part of cache keys built from replica reads; None if unknown."""
+    alias = replica_alias()
+    if alias is None:
+        return None
+    try:
+        with open(_generation_path(alias)) as marker:
+            return marker.read().strip() or None
+    except OSError:
+        return None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _reads_from_replica.get():
+            return replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a copy of the primary and gets its schema from it.
+        return db != replica_alias()
+
+
+def _pin_key(user_pk):
+    return f"replica:pinned:{user_pk}"
+
+
+def _pins():
+    return caches[getattr(settings, "REPLICA_PIN_CACHE_ALIAS", "replica_pins")]
+
+
+@checks.register()
+def check_pin_cache(app_configs, **kwargs):
+    if replica_alias() is None or not isinstance(_pins(), LocMemCache):
+        return []
+    return [checks.Warning(
+        "Replica pins are kept in a per-process cache: with several workers a writer may read stale data.",
+        hint="Point REPLICA_PIN_CACHE_BACKEND at a cache shared by the workers (file or db).",
+        id="api.W002",
+    )]
+
+
+def pin_to_primary(user):
+    if user is not None and user.is_authenticated:
+        _pins().set(_pin_key(user.pk), True, getattr(settings, "REPLICA_STICKY_SECONDS", 30))
+
+
+def is_pinned(user):
+    return user is not None and user.is_authenticated and _pins().get(_pin_key(user.pk), False)
+
+
+def replica_allowed(user):
+    return replica_alias() is not None and not is_pinned(user)
+
+
+class ReplicaReadsMixin:
+    """Serve safe requests of an APIView from the replica, unless the user wrote recently."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and replica_allowed(request.user):
+            self._replica_token = _reads_from_replica.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, "_replica_token", None)
+        if token is not None:
+            _reads_from_replica.reset(token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReplicaPinMiddleware:
+    """Pins the user of every successful write request to the primary."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def pins(request, response):
+        return request.method not in SAFE_METHODS and response.status_code < 400
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self.pins(request, response):
+            # DRF copies the user it authenticated onto the Django request.
+            pin_to_primary(getattr(request, "user", None))
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self.pins(request, response):
+            # A session user is still lazy here and may need a query.
+            await sync_to_async(pin_to_primary)(getattr(request, "user", None))
+        return response
+
+
+def backup_sqlite(source_path, target_path):
+    """Copy a live SQLite database into `target_path` with the online backup API.
+
+    The copy is a consistent snapshot and is written in place, so connections already
+    open on the target see the new contents on their next transaction.
+    """
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path, timeout=30)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
@@ -0,0 +1,38 @@
+"""Server-side scoring rules, mirroring countMean/countAll of the client transcript."""
+import math
+
+# MarkComponent colour bands for a single attestation/exam mark; totals use doubled bounds.
+MARK_BANDS = (25, 35, 45, 50)
+TOTAL_BANDS = tuple(2 * bound for bound in MARK_BANDS)
+PASS_MARK = MARK_BANDS[0]
+PASS_TOTAL = TOTAL_BANDS[0]
+
+
+def js_round(value):
+    """Math.round from JavaScript: halves are rounded up, not to even."""
+    return math.floor(value + 0.5)
+
+
+def _attestation_mean(att1, att2, att3):
+    if not (att1 and att2 and att3):
+        return None
+    return js_round((att1 + att2 + att3) / 3)
+
+
+def count_mean(reporting_level, att1, att2, att3):
+    if reporting_level == "t":
+        return None
+    return _attestation_mean(att1, att2, att3)
+
+
+def count_total(reporting_level, att1, att2, att3, exam, additional):
+    mean = _attestation_mean(att1, att2, att3)
+    if mean is None:
+        return None
+    if reporting_level == "t":
+        return mean * 2
+    if reporting_level == "d":
+        return (mean + (additional or 0)) * 2
+    if reporting_level == "e":
+        return mean + (exam or 0) + (additional or 0)
+    return None
@@ -0,0 +1,87 @@
+"""Indexed student search over a normalized name/record book column.
+
+On SQLite the column is mirrored into an FTS5 trigram table kept in sync by
+triggers, which answers substring queries of three or more characters from
+the index. Shorter terms fall back to an indexed prefix range on the column.
+"""
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from api.models import Student, normalize_search_text
+
+FTS_TABLE = "api_student_search"
+FTS_MIN_TERM = 3
+
+FTS_SCHEMA = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"search_text, content='api_student', content_rowid='id', tokenize='trigram')",
+)
+FTS_TRIGGERS = (
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON api_student BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON api_student BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF search_text ON api_student BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+    f"INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text); END",
+)
+
+
+def _fts_supported(connection):
+    import sqlite3
+    return connection.vendor == "sqlite" and sqlite3.sqlite_version_info >= (3, 34, 0)
+
+
+def ensure_search_index(using="default"):
+    """Create the FTS table and triggers if missing, e.g. after SQLite rebuilt api_student in a migration."""
+    connection = connections[using]
+    if not _fts_supported(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+                       [f"{FTS_TABLE}_%"])
+        if cursor.fetchone()[0] == len(FTS_TRIGGERS):
+            return
+        for sql in (*FTS_SCHEMA, *FTS_TRIGGERS):
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def drop_search_index(using="default"):
+    connection = connections[using]
+    if not _fts_supported(connection):
+        return
+    with connection.cursor() as cursor:
+        for suffix in ("ai", "ad", "au"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def _word_prefix(term):
+    return Q(search_text__startswith=term) | Q(search_text__contains=f" {term}")
+
+
+def search_students(query, limit=20, queryset=None):
+    terms = normalize_search_text(query).split()
+    students = Student.objects.all() if queryset is None else queryset
+    if not terms:
+        return students.none()
+
+    long_terms = [term for term in terms if len(term) >= FTS_MIN_TERM]
+    short_terms = [term for term in terms if len(term) < FTS_MIN_TERM]
+    if long_terms and _fts_supported(connections[students.db]):
+        match = " AND ".join('"{}"'.format(term.replace('"', '""')) for term in long_terms)
+        students = students.filter(pk__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (match,)))
+    elif long_terms:
+        for term in long_terms:
+            students = students.filter(search_text__contains=term)
+    elif short_terms:
+        # Nothing selective enough for the trigram index: use the column index as a prefix range.
+        first = short_terms.pop(0)
+        students = students.filter(search_text__gte=first, search_text__lt=first + "\U0010ffff")
+
+    for term in short_terms:
+        students = students.filter(_word_prefix(term))
+    return students.order_by("search_text", "pk")[:limit]
@@ -1,7 +1,9 @@
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 
-from api.models import User, Professor, Student, StudentMark, GroupMark, Subject, CourseGroup
+from api.models import User, Professor, Student, StudentMark, GroupMark, Subject, CourseGroup, SemesterSummary, \
+    ArchivedGroupMark, ArchivedStudentMark
+from api.sheets import MARK_FIELDS, save_marks
 
 
 class MyUserCreateSerializer(UserCreateSerializer):
@@ -17,12 +19,12 @@ class MyUserCreateSerializer(UserCreateSerializer):
         return obj.get_role()
 
     def create(self, validated_data):
-        user = User.objects.create(username=validated_data['username'],
-                                   first_name=validated_data['first_name'],
-                                   last_name=validated_data['last_name'],
-                                   patronymic=validated_data['patronymic'],
-                                   email=validated_data['email']
-                                   )
+        user = User(username=validated_data['username'],
+                    first_name=validated_data['first_name'],
+                    last_name=validated_data['last_name'],
+                    patronymic=validated_data['patronymic'],
+                    email=validated_data['email']
+                    )
         user.set_password(validated_data['password'])
         user.save()
         return user
@@ -163,7 +165,113 @@ class StudentMarksSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class CompactGroupMarkSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GroupMark
+        fields = '__all__'
+
+
+class CompactStudentSerializer(serializers.ModelSerializer):
+    user = MyUserSerializer()
+
+    class Meta:
+        model = Student
+        fields = ('pk', 'user', 'year_of_enrollment', 'record_book_number', 'group')
+
+
+class CompactStudentMarksSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StudentMark
+        fields = '__all__'
+
+
+# Archived rows are serialized with the fields, in the order, of the live ones.
+class ArchivedGroupMarkSerializer(GroupMarkSerializer):
+    class Meta:
+        model = ArchivedGroupMark
+        fields = tuple(field.name for field in GroupMark._meta.fields)
+
+
+class ArchivedStudentMarksSerializer(StudentMarksSerializer):
+    mark_group = ArchivedGroupMarkSerializer()
+
+    class Meta:
+        model = ArchivedStudentMark
+        fields = tuple(field.name for field in StudentMark._meta.fields)
+
+
+class CompactArchivedGroupMarkSerializer(CompactGroupMarkSerializer):
+    class Meta:
+        model = ArchivedGroupMark
+        fields = ArchivedGroupMarkSerializer.Meta.fields
+
+
+class CompactArchivedStudentMarksSerializer(CompactStudentMarksSerializer):
+    class Meta:
+        model = ArchivedStudentMark
+        fields = ArchivedStudentMarksSerializer.Meta.fields
+
+
+def _by_pk(serializer_class, objects):
+    objects = list({obj.pk: obj for obj in objects if obj is not None}.values())
+    return {str(obj.pk): data for obj, data in zip(objects, serializer_class(objects, many=True).data)}
+
+
+def sideload_marks(marks):
+    """Marks rows referencing related objects by id, with every referenced object serialized once."""
+    marks = list(marks)
+    mark_groups = [sm.mark_group for sm in marks]
+    students = [sm.student for sm in marks]
+    return {
+        "marks": list(CompactStudentMarksSerializer(marks, many=True).data),
+        "mark_groups": _by_pk(CompactGroupMarkSerializer, mark_groups),
+        "subjects": _by_pk(SubjectSerializer, (gm.subject for gm in mark_groups)),
+        "professors": _by_pk(ProfessorSerializer, (gm.professor for gm in mark_groups)),
+        "groups": _by_pk(CourseGroupSerializer, [gm.group for gm in mark_groups] + [st.group for st in students]),
+        "students": _by_pk(CompactStudentSerializer, students),
+    }
+
+
 class SimpleStudentMarksSerializer(serializers.ModelSerializer):
     class Meta:
         model = StudentMark
         fields = ("id", "att1", "att2", "att3", "additional", "exam",)
+
+
+class SemesterSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SemesterSummary
+        fields = ("id", "student", "semester", "subjects", "passed", "failed", "ungraded", "debts", "average_total", "updated_at")
+
+
+class MarkSheetListSerializer(serializers.ListSerializer):
+    def validate(self, attrs):
+        ids = [row["id"] for row in attrs]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("Каждая строка ведомости должна встречаться один раз.")
+        return attrs
+
+    def update(self, instance, validated_data):
+        marks = {mark.pk: mark for mark in instance}
+        updated = []
+        for row in validated_data:
+            mark = marks[row.pop("id")]
+            for field, value in row.items():
+                setattr(mark, field, value)
+            updated.append(mark)
+        return save_marks(updated)
+
+
+class MarkSheetRowSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField()
+
+    class Meta:
+        model = StudentMark
+        list_serializer_class = MarkSheetListSerializer
+        fields = ("id", "att1", "att2", "att3", "additional", "exam",)
+        extra_kwargs = {field: {"min_value": 0, "max_value": 50} for field in MARK_FIELDS}
+
+    def validate_id(self, value):
+        if value not in self.context["sheet"]:
+            raise serializers.ValidationError("Строка не принадлежит этой ведомости.")
+        return value
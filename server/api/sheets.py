@@ -0,0 +1,87 @@
+from django.db import transaction
+from django.db.models import Q
+from django.dispatch import Signal
+from django.utils import timezone
+
+from api.models import Student, StudentMark, GroupMark
+
+MARK_FIELDS = ("att1", "att2", "att3", "exam", "additional")
+
+# Sent with `marks` (a list of StudentMark) and `deleted` after marks were written,
+# both for single saves and for the bulk paths that bypass post_save.
+marks_changed = Signal()
+
+# Sheet rows that were provisioned but never graded; safe to drop when a student leaves a group.
+EMPTY_MARK = Q(**{field: None for field in MARK_FIELDS})
+
+
+def _create_missing(pairs):
+    """Bulk-create StudentMark rows for the (mark_group_id, student_id) pairs that do not exist yet."""
+    pairs = set(pairs)
+    if not pairs:
+        return []
+    candidates = StudentMark.objects.filter(
+        mark_group__in={gm for gm, _ in pairs},
+        student__in={st for _, st in pairs},
+    )
+    missing = pairs - set(candidates.values_list("mark_group_id", "student_id"))
+    if not missing:
+        return []
+    # A concurrent provisioning may insert the same rows; the unique constraint keeps one.
+    StudentMark.objects.bulk_create(
+        (StudentMark(mark_group_id=gm, student_id=st) for gm, st in sorted(missing)),
+        ignore_conflicts=True,
+    )
+    # Ignored conflicts leave no primary keys on the objects: read the new rows back.
+    created = [sm for sm in candidates.order_by("pk") if (sm.mark_group_id, sm.student_id) in missing]
+    marks_changed.send(sender=StudentMark, marks=created, deleted=False)
+    return created
+
+
+def provision_sheet(group_mark):
+    student_ids = Student.objects.filter(group=group_mark.group_id).values_list("pk", flat=True)
+    _create_missing((group_mark.pk, st) for st in student_ids)
+    StudentMark.objects.filter(EMPTY_MARK, mark_group=group_mark) \
+        .exclude(student__group=group_mark.group_id).delete()
+
+
+def provision_student(student):
+    if student.group_id is not None:
+        gm_ids = GroupMark.objects.filter(group=student.group_id).values_list("pk", flat=True)
+        _create_missing((gm, student.pk) for gm in gm_ids)
+    StudentMark.objects.filter(EMPTY_MARK, student=student) \
+        .exclude(mark_group__group=student.group_id).delete()
+
+
+def provision_students(students):
+    """provision_student() for many new students at once, e.g. after a bulk_create."""
+    students = [student for student in students if student.group_id is not None]
+    sheets = {}
+    for gm, group in GroupMark.objects.filter(group__in={st.group_id for st in students}).values_list("pk", "group"):
+        sheets.setdefault(group, []).append(gm)
+    return _create_missing((gm, student.pk) for student in students for gm in sheets.get(student.group_id, ()))
+
+
+def save_marks(marks, fields=MARK_FIELDS):
+    """Write the mark fields of many StudentMark rows, and their scores, in a single transaction."""
+    marks = list(marks)
+    now = timezone.now()
+    for mark in marks:
+        mark.refresh_scores()
+        mark.updated_at = now
+    with transaction.atomic():
+        StudentMark.objects.bulk_update(marks, (*fields, *StudentMark.SCORE_FIELDS, "updated_at"), batch_size=500)
+        # Inside the transaction: the change log is written atomically with the marks.
+        marks_changed.send(sender=StudentMark, marks=marks, deleted=False)
+    return marks
+
+
+def refresh_sheet_scores(group_mark):
+    """Recompute the scores of a sheet, e.g. after its reporting level changed."""
+    changed = [sm for sm in group_mark.studentmark_set.all() if sm.refresh_scores()]
+    if changed:
+        now = timezone.now()
+        for sm in changed:
+            sm.updated_at = now
+        StudentMark.objects.bulk_update(changed, (*StudentMark.SCORE_FIELDS, "updated_at"), batch_size=500)
+        marks_changed.send(sender=StudentMark, marks=changed, deleted=False)
@@ -0,0 +1,190 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed, post_migrate
+from django.dispatch import receiver
+from django.utils import timezone
+
+from api.authentication import revocations
+from api.cache import transcripts
+from api.changes import record_mark_changes, record_group_mark_change
+from api.events import mark_events, publish
+from api.models import GroupMark, Student, StudentMark, User, Professor, Subject, CourseGroup
+from api.ranking import rankings
+from api.search import ensure_search_index
+from api.sheets import provision_sheet, provision_student, refresh_sheet_scores, marks_changed
+from api.sqlite import configure_connection
+from api.summaries import refresh_summaries
+
+
+@receiver(post_save, sender=GroupMark)
+def group_mark_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        provision_sheet(instance)
+        refresh_sheet_scores(instance)
+
+
+@receiver(post_save, sender=Student)
+def student_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        provision_student(instance)
+        transaction.on_commit(lambda: rankings.student_changed(instance))
+
+
+@receiver(post_save, sender=StudentMark)
+def student_mark_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        marks_changed.send(sender=StudentMark, marks=[instance], deleted=False)
+
+
+@receiver(post_delete, sender=StudentMark)
+def student_mark_deleted(sender, instance, **kwargs):
+    marks_changed.send(sender=StudentMark, marks=[instance], deleted=True)
+
+
+@receiver(marks_changed)
+def update_rankings(sender, marks, **kwargs):
+    transaction.on_commit(lambda: rankings.marks_changed(marks))
+
+
+@receiver(marks_changed)
+def log_mark_changes(sender, marks, deleted=False, **kwargs):
+    record_mark_changes(marks, deleted)
+
+
+@receiver(post_save, sender=GroupMark)
+def log_group_mark_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record_group_mark_change(instance)
+
+
+@receiver(post_delete, sender=GroupMark)
+def log_group_mark_deleted(sender, instance, **kwargs):
+    record_group_mark_change(instance, deleted=True)
+
+
+@receiver(marks_changed)
+def update_semester_summaries(sender, marks, **kwargs):
+    refresh_summaries({sm.student_id for sm in marks})
+
+
+@receiver(post_save, sender=GroupMark)
+def group_mark_summaries(sender, instance, raw=False, created=False, **kwargs):
+    # A sheet moved to another semester changes the summaries of everyone graded on it.
+    if not raw and not created:
+        refresh_summaries(StudentMark.objects.filter(mark_group=instance.pk).values_list("student", flat=True))
+
+
+@receiver(marks_changed)
+def publish_mark_events(sender, marks, deleted=False, **kwargs):
+    events = mark_events(marks, deleted)
+    transaction.on_commit(lambda: publish(events))
+
+
+def _bump_now_and_on_commit(bump, *args):
+    # The immediate bump gives the writer its own changes back; the second one drops
+    # entries that concurrent readers rebuilt from pre-commit data in between.
+    bump(*args)
+    transaction.on_commit(lambda: bump(*args))
+
+
+@receiver(marks_changed)
+def invalidate_mark_transcripts(sender, marks, **kwargs):
+    _bump_now_and_on_commit(transcripts.bump_students, [sm.student_id for sm in marks])
+
+
+@receiver(post_save, sender=Professor)
+@receiver(post_delete, sender=Professor)
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def update_user_role(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    try:
+        user = instance.user
+    except User.DoesNotExist:
+        return
+    user.refresh_role()
+    transaction.on_commit(revocations.invalidate)
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def invalidate_student_transcript(sender, instance, raw=False, **kwargs):
+    _bump_now_and_on_commit(transcripts.bump_students, [instance.pk])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_transcripts(sender, instance, raw=False, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {"last_login", "password"}:
+        return
+    student_pks = list(Student.objects.filter(user=instance.pk).values_list("pk", flat=True))
+    if student_pks:
+        _bump_now_and_on_commit(transcripts.bump_students, student_pks)
+    if Professor.objects.filter(user=instance.pk).exists():
+        _bump_now_and_on_commit(transcripts.bump_all)
+
+
+@receiver(post_save, sender=GroupMark)
+@receiver(post_delete, sender=GroupMark)
+@receiver(post_save, sender=Professor)
+@receiver(post_delete, sender=Professor)
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+@receiver(post_save, sender=CourseGroup)
+@receiver(post_delete, sender=CourseGroup)
+@receiver(m2m_changed, sender=Professor.subjects.through)
+def invalidate_all_transcripts(sender, raw=False, **kwargs):
+    _bump_now_and_on_commit(transcripts.bump_all)
+
+
+@receiver(m2m_changed, sender=Professor.subjects.through)
+def touch_professor_subjects(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    professors = Professor.objects.filter(pk__in=pk_set or ()) if reverse else Professor.objects.filter(pk=instance.pk)
+    professors.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Subject)
+@receiver(pre_delete, sender=Subject)
+def touch_subject_professors(sender, instance, raw=False, **kwargs):
+    # Professors are serialized with their subjects: renaming one changes them too.
+    if not raw:
+        Professor.objects.filter(subjects=instance.pk).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def reload_token_revocations(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {"is_active", "tokens_valid_after"} & set(update_fields):
+        transaction.on_commit(revocations.invalidate)
+
+
+@receiver(post_save, sender=User)
+def refresh_student_search_text(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not {"first_name", "last_name", "patronymic"} & set(update_fields)):
+        return
+    for student in Student.objects.filter(user=instance.pk).only("pk", "record_book_number", "search_text"):
+        search_text = Student.build_search_text(instance, student.record_book_number)
+        if search_text != student.search_text:
+            Student.objects.filter(pk=student.pk).update(search_text=search_text)
+
+
+@receiver(post_save, sender=User)
+def refresh_professor_sort_name(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not {"first_name", "last_name", "patronymic"} & set(update_fields)):
+        return
+    Professor.objects.filter(user=instance.pk).exclude(sort_name=Professor.build_sort_name(instance)) \
+        .update(sort_name=Professor.build_sort_name(instance))
+
+
+@receiver(post_migrate)
+def install_search_index(sender, using="default", **kwargs):
+    if sender.name == "api":
+        ensure_search_index(using)
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    configure_connection(connection)
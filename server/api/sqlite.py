@@ -0,0 +1,66 @@
+"""Connection setup for SQLite: pragmas applied to every new connection and a check reporting them."""
+from django.conf import settings
+from django.core import checks
+from django.db import connections
+
+
+def configured_pragmas():
+    """SQLITE_PRAGMAS, preceded by journal_mode when SQLITE_JOURNAL_MODE is set."""
+    journal_mode = getattr(settings, "SQLITE_JOURNAL_MODE", None)
+    pragmas = {"journal_mode": journal_mode} if journal_mode else {}
+    return {**pragmas, **getattr(settings, "SQLITE_PRAGMAS", {})}
+
+
+def apply_pragmas(cursor, pragmas):
+    """Run `PRAGMA name = value` for each item; works on Django and plain sqlite3 cursors."""
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def effective_pragmas(cursor, names):
+    values = {}
+    for name in names:
+        cursor.execute(f"PRAGMA {name}")
+        row = cursor.fetchone()
+        values[name] = row[0] if row else None
+    return values
+
+
+def configure_connection(connection):
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            apply_pragmas(cursor, configured_pragmas())
+
+
+# PRAGMA queries answer these with numbers.
+ENUM_PRAGMAS = {
+    "synchronous": {"0": "off", "1": "normal", "2": "full", "3": "extra"},
+    "temp_store": {"0": "default", "1": "file", "2": "memory"},
+}
+
+
+def _normalize(name, value):
+    value = str(value).lower()
+    return ENUM_PRAGMAS.get(name, {}).get(value, value)
+
+
+@checks.register(checks.Tags.database)
+def check_sqlite_pragmas(app_configs, databases=None, **kwargs):
+    messages = []
+    for alias in databases or ():
+        connection = connections[alias]
+        if connection.vendor != "sqlite" or connection.is_in_memory_db():
+            continue
+        pragmas = configured_pragmas()
+        with connection.cursor() as cursor:
+            actual = effective_pragmas(cursor, pragmas)
+        report = ", ".join(f"{name}={_normalize(name, value)}" for name, value in actual.items())
+        messages.append(checks.Info(f"SQLite '{alias}': {report}", id="api.I001"))
+        for name, value in pragmas.items():
+            if _normalize(name, actual[name]) != _normalize(name, value):
+                messages.append(checks.Warning(
+                    f"SQLite '{alias}': PRAGMA {name} is {actual[name]}, configured {value}.",
+                    hint="The filesystem or SQLite build may not support it (WAL needs shared memory).",
+                    id="api.W001",
+                ))
+    return messages
@@ -0,0 +1,82 @@
+"""Materialized semester summaries: one SemesterSummary row per student and semester.
+
+Mark writes refresh the rows of the students they touch, in the writer's transaction;
+`rebuild_summaries` recomputes everything in chunks of students. A subject is passed
+with a total of at least PASS_TOTAL, failed with a lower one, and ungraded without a total.
+Debts are the failed subjects plus the ungraded ones of archived sheets: a live sheet without
+a total is still being graded, an archived one belongs to a finished semester.
+"""
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from api.models import SemesterSummary, Student, StudentMark, ArchivedStudentMark
+from api.scoring import PASS_TOTAL
+
+SUMMARY_FIELDS = ("subjects", "passed", "failed", "ungraded", "debts", "average_total", "updated_at")
+# Students per query: keeps parameter lists well under SQLite's limits.
+CHUNK_SIZE = 500
+
+
+def summarize(*marks):
+    """SemesterSummary objects (unsaved) for the rows of the StudentMark/ArchivedStudentMark querysets `marks`."""
+    counts = {}
+    for queryset in marks:
+        archived = queryset.model is ArchivedStudentMark
+        rows = queryset.order_by().values_list("student", "mark_group__semester").annotate(
+            subjects=Count("pk"),
+            passed=Count("pk", filter=Q(total__gte=PASS_TOTAL)),
+            failed=Count("pk", filter=Q(total__lt=PASS_TOTAL)),
+            graded=Count("total"),
+            total_sum=Sum("total"),
+        )
+        for student, semester, subjects, passed, failed, graded, total_sum in rows:
+            ungraded = subjects - graded
+            values = (subjects, passed, failed, ungraded, failed + ungraded if archived else failed, graded, total_sum)
+            previous = counts.get((student, semester), (0,) * len(values))
+            counts[student, semester] = [a + (b or 0) for a, b in zip(previous, values)]
+    now = timezone.now()
+    return [
+        SemesterSummary(student_id=student, semester=semester, subjects=subjects, passed=passed, failed=failed,
+                        ungraded=ungraded, debts=debts,
+                        average_total=round(total_sum / graded, 2) if graded else None, updated_at=now)
+        for (student, semester), (subjects, passed, failed, ungraded, debts, graded, total_sum) in counts.items()
+    ]
+
+
+def refresh_summaries(student_pks):
+    """Recompute the summaries of these students: per CHUNK_SIZE students, an aggregate query per table,
+    one upsert and one cleanup."""
+    student_pks = sorted(set(student_pks) - {None})
+    summaries = []
+    with transaction.atomic():
+        for i in range(0, len(student_pks), CHUNK_SIZE):
+            summaries += _refresh_chunk(student_pks[i:i + CHUNK_SIZE])
+    return summaries
+
+
+def _refresh_chunk(student_pks):
+    summaries = summarize(StudentMark.objects.filter(student__in=student_pks),
+                          ArchivedStudentMark.objects.filter(student__in=student_pks))
+    SemesterSummary.objects.bulk_create(summaries, update_conflicts=True, unique_fields=("student", "semester"),
+                                        update_fields=SUMMARY_FIELDS, batch_size=CHUNK_SIZE)
+    current = {(summary.student_id, summary.semester) for summary in summaries}
+    stale = [pk for pk, student, semester in SemesterSummary.objects.filter(student__in=student_pks)
+             .values_list("pk", "student", "semester") if (student, semester) not in current]
+    if stale:
+        SemesterSummary.objects.filter(pk__in=stale).delete()
+    return summaries
+
+
+def rebuild_summaries(chunk_size=500):
+    """Recompute every summary, `chunk_size` students per transaction; returns (students, summary rows)."""
+    students = summaries = 0
+    last_pk = 0
+    while True:
+        chunk = list(Student.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:chunk_size])
+        if not chunk:
+            break
+        summaries += len(refresh_summaries(chunk))
+        students += len(chunk)
+        last_pk = chunk[-1]
+    return students, summaries
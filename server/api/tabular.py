@@ -0,0 +1,81 @@
+"""Streaming readers for CSV and XLSX files: one row at a time, whatever the file size."""
+import codecs
+import csv
+import os
+
+SAMPLE_SIZE = 64 * 1024
+
+
+class TabularError(ValueError):
+    pass
+
+
+def _csv_encoding(sample):
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut by the end of the sample is still UTF-8.
+        if e.start < len(sample) - 3:
+            return "cp1251"
+    return "utf-8-sig"
+
+
+def iter_csv(fileobj):
+    sample = fileobj.read(SAMPLE_SIZE)
+    fileobj.seek(0)
+    encoding = _csv_encoding(sample)
+    text = sample.decode(encoding, errors="ignore")
+    try:
+        dialect = csv.Sniffer().sniff(text.split("\n", 1)[0] or ",", delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    # The StreamReader decodes incrementally and yields lines with their newlines, as csv expects.
+    reader = csv.reader(codecs.getreader(encoding)(fileobj), dialect)
+    while True:
+        # Only the sample was checked: a bad byte or a broken row may come at any point.
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except UnicodeDecodeError:
+            raise TabularError(f"Строка {reader.line_num + 1}: символы не в кодировке {encoding.split('-sig')[0]}.")
+        except csv.Error as e:
+            raise TabularError(f"Строка {reader.line_num}: не удалось разобрать CSV ({e}).")
+        # Python before 3.11 rejects NUL characters itself; keep the same behaviour everywhere.
+        if any("\0" in cell for cell in row):
+            raise TabularError(f"Строка {reader.line_num}: недопустимый символ NUL.")
+        yield [cell.strip() or None for cell in row]
+
+
+def iter_xlsx(fileobj):
+    try:
+        import openpyxl
+    except ImportError:
+        raise TabularError("Для чтения XLSX нужен пакет openpyxl.")
+    try:
+        workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    except Exception as e:
+        raise TabularError(f"Не удалось прочитать XLSX: {e}")
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield [cell.strip() or None if isinstance(cell, str) else cell for cell in row]
+    finally:
+        workbook.close()
+
+
+READERS = {".csv": iter_csv, ".xlsx": iter_xlsx}
+
+
+def iter_rows(fileobj, filename):
+    """Yield (line number, {header: value}) for the data rows of a CSV or XLSX file; empty cells are None."""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in READERS:
+        raise TabularError("Поддерживаются файлы CSV и XLSX.")
+    rows = READERS[extension](fileobj)
+    header = next(rows, None)
+    if header is None:
+        raise TabularError("Файл пуст.")
+    header = [str(cell).strip().casefold() if cell is not None else "" for cell in header]
+    for line, row in enumerate(rows, start=2):
+        if any(cell is not None for cell in row):
+            yield line, dict(zip(header, row))
@@ -1,3 +1,1817 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import tracemalloc
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+from asgiref.sync import async_to_sync, iscoroutinefunction
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, is_password_usable
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import request_started
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.db.models import Avg, F
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api import async_views, views
+from api.imports import import_marks
+from api.models import User, Student, Professor, Subject, CourseGroup, GroupMark, StudentMark, Direction, \
+    MarkChange, SemesterSummary, ArchivedGroupMark, ArchivedStudentMark
+from api.authentication import StatelessJWTAuthentication, ClaimsTokenObtainPairSerializer, revocations
+from api.cache import transcripts
+from api.archive import archive_sheets, current_semester
+from api.changes import compact_changes
+from api.conditional import transcript_state, sheet_state, professor_groups_state
+from api.events import MAX_PENDING, aevent_stream, check_live_updates, get_broker, publish, student_channel
+from api.fastpath import FastJSONRenderer, row_mapper, serialize_rows
+from api.ranking import rankings
+from api.permissions import IsProfessor
+from api.provisioning import hash_passwords
+from api.routers import ReplicaPinMiddleware, ReplicaRouter, use_replica, backup_sqlite, is_pinned, \
+    bump_replica_version, check_pin_cache
+from api.scoring import PASS_TOTAL
+from api.search import search_students
+from api.serializers import StudentMarksSerializer, MyUserSerializer
+from api.sheets import provision_sheet, save_marks
+from api.sqlite import apply_pragmas, configured_pragmas, effective_pragmas
+from api.tabular import SAMPLE_SIZE, iter_rows
+
+
+class MarksDataMixin:
+    """Builds a faculty of professors, groups, students and filled-in mark sheets."""
+
+    def make_user(self, username, **extra):
+        return User.objects.create_user(username=username, email=f"{username}@example.com",
+                                        password=None, first_name="Имя", last_name="Фамилия",
+                                        patronymic="Отчество", **extra)
+
+    def make_professor(self, username, subjects=()):
+        professor = Professor.objects.create(user=self.make_user(username))
+        professor.subjects.set(subjects)
+        return professor
+
+    def make_group(self, group_number, course_number=1):
+        return CourseGroup.objects.create(course_number=course_number, group_number=group_number,
+                                          higher_education_level="b")
+
+    def make_student(self, username, group):
+        return Student.objects.create(user=self.make_user(username), group=group,
+                                      year_of_enrollment="2023", record_book_number=username)
+
+    def make_sheet(self, professor, subject, group, semester=1, reporting_level="e"):
+        gm = GroupMark.objects.create(subject=subject, professor=professor, group=group,
+                                      semester=semester, reporting_level=reporting_level)
+        marks = list(gm.studentmark_set.all())
+        for sm in marks:
+            sm.att1, sm.att2, sm.att3, sm.exam, sm.additional = 30, 35, 40, 30, 5
+        save_marks(marks)
+        return gm
+
+    def make_faculty(self, subjects_count, students_count, prefix="s"):
+        subjects = [Subject.objects.create(name=f"{prefix} предмет {i}") for i in range(subjects_count)]
+        professor = self.make_professor(f"{prefix}prof", subjects)
+        group = self.make_group(f"{prefix}-1")
+        students = [self.make_student(f"{prefix}stud{i}", group) for i in range(students_count)]
+        sheets = [self.make_sheet(professor, subject, group, semester=i % 8 + 1)
+                  for i, subject in enumerate(subjects)]
+        return professor, group, students, sheets
+
+
+class MarksQueryBudgetTests(MarksDataMixin, TestCase):
+    """The marks endpoints must issue the same number of queries however much data they return."""
+
+    def count_queries(self, user, url):
+        client = APIClient()
+        client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(ctx.captured_queries), response.json()
+
+    def assertConstantQueries(self, make_request, max_queries):
+        small, small_data = make_request("a", subjects_count=1, students_count=1)
+        large, large_data = make_request("b", subjects_count=12, students_count=15)
+        self.assertGreater(len(large_data), len(small_data))
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, max_queries)
+
+    def test_student_marks_view(self):
+        def make_request(prefix, subjects_count, students_count):
+            _, _, students, _ = self.make_faculty(subjects_count, students_count, prefix)
+            return self.count_queries(students[0].user, reverse("student_marks", args=[students[0].pk]))
+
+        self.assertConstantQueries(make_request, max_queries=3)
+
+    def test_professor_mark_groups(self):
+        def make_request(prefix, subjects_count, students_count):
+            professor, _, _, _ = self.make_faculty(subjects_count, students_count, prefix)
+            return self.count_queries(professor.user, reverse("professor_markgroups"))
+
+        self.assertConstantQueries(make_request, max_queries=4)
+
+    def test_group_marks_view(self):
+        def make_request(prefix, subjects_count, students_count):
+            professor, _, _, sheets = self.make_faculty(subjects_count, students_count, prefix)
+            return self.count_queries(professor.user, reverse("professor_markgroups", args=[sheets[0].pk]))
+
+        self.assertConstantQueries(make_request, max_queries=4)
+
+    def test_group_marks_view_never_writes(self):
+        professor, _, _, sheets = self.make_faculty(1, 5)
+        with CaptureQueriesContext(connection) as ctx:
+            self.count_queries(professor.user, reverse("professor_markgroups", args=[sheets[0].pk]))
+        self.assertTrue(all(q["sql"].startswith("SELECT") for q in ctx.captured_queries))
+
+    def test_student_marks_role_resolution(self):
+        _, _, students, _ = self.make_faculty(2, 1)
+        _, data = self.count_queries(students[0].user, reverse("student_marks", args=[students[0].pk]))
+        self.assertEqual(data[0]["student"]["user"]["role"], "student")
+        self.assertEqual(data[0]["mark_group"]["professor"]["user"]["role"], "professor")
+
+
+class MarkSheetProvisioningTests(MarksDataMixin, TestCase):
+    def setUp(self):
+        self.subject = Subject.objects.create(name="Предмет")
+        self.professor = self.make_professor("prof", [self.subject])
+        self.group = self.make_group("1")
+        self.other_group = self.make_group("2")
+
+    def sheet_students(self, gm):
+        return set(gm.studentmark_set.values_list("student", flat=True))
+
+    def test_group_mark_creation_provisions_rows(self):
+        students = [self.make_student(f"stud{i}", self.group) for i in range(3)]
+        gm = GroupMark.objects.create(subject=self.subject, professor=self.professor, group=self.group,
+                                      semester=1, reporting_level="e")
+        self.assertEqual(self.sheet_students(gm), {s.pk for s in students})
+
+    def test_student_joining_and_leaving_group(self):
+        gm = GroupMark.objects.create(subject=self.subject, professor=self.professor, group=self.group,
+                                      semester=1, reporting_level="e")
+        graded = self.make_student("graded", self.group)
+        ungraded = self.make_student("ungraded", self.group)
+        self.assertEqual(self.sheet_students(gm), {graded.pk, ungraded.pk})
+        StudentMark.objects.filter(student=graded).update(att1=40)
+
+        for student in (graded, ungraded):
+            student.group = self.other_group
+            student.save()
+        # Graded rows are kept for the transcript, never-graded rows are dropped.
+        self.assertEqual(self.sheet_students(gm), {graded.pk})
+
+        ungraded.group = self.group
+        ungraded.save()
+        ungraded.save()
+        self.assertEqual(gm.studentmark_set.filter(student=ungraded).count(), 1)
+
+
+class MarkSheetSaveTests(MarksDataMixin, TestCase):
+    def setUp(self):
+        self.professor, _, self.students, sheets = self.make_faculty(1, 3)
+        self.gm = sheets[0]
+        self.rows = list(self.gm.studentmark_set.order_by("pk"))
+        self.client = APIClient()
+        self.client.force_authenticate(self.professor.user)
+        self.url = reverse("professor_marksheet", args=[self.gm.pk])
+
+    def test_saves_whole_sheet(self):
+        payload = [{"id": sm.pk, "att1": 10 + i, "att2": 20, "att3": 30, "exam": None, "additional": 0}
+                   for i, sm in enumerate(self.rows)]
+        response = self.client.put(self.url, payload, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(list(self.gm.studentmark_set.order_by("pk").values_list("att1", "exam")),
+                         [(10, None), (11, None), (12, None)])
+
+    def test_reports_errors_per_row(self):
+        other = self.make_sheet(self.professor, Subject.objects.create(name="Другой"), self.students[0].group)
+        payload = [
+            {"id": self.rows[0].pk, "att1": 20},
+            {"id": self.rows[1].pk, "att1": 51},
+            {"id": other.studentmark_set.first().pk, "att1": 20},
+        ]
+        response = self.client.put(self.url, payload, format="json")
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()
+        self.assertEqual(errors[0], {})
+        self.assertIn("att1", errors[1])
+        self.assertIn("id", errors[2])
+        self.assertEqual(StudentMark.objects.get(pk=self.rows[0].pk).att1, 30)
+
+    def test_foreign_sheet_not_found(self):
+        stranger = self.make_professor("stranger")
+        self.client.force_authenticate(stranger.user)
+        response = self.client.put(self.url, [], format="json")
+        self.assertEqual(response.status_code, 404)
+
+
+class ScoringTests(MarksDataMixin, TestCase):
+    def test_scoring_rules(self):
+        from api.scoring import count_mean, count_total
+        self.assertEqual(count_mean("e", 30, 35, 41), 35)
+        self.assertEqual(count_mean("e", 30, 30, 31), 30)
+        self.assertEqual(count_mean("e", 30, 30, 32), 31)  # 30.67, halves and above round up
+        self.assertIsNone(count_mean("t", 30, 35, 40))
+        self.assertIsNone(count_total("e", 30, None, 40, 20, 5))
+        self.assertEqual(count_total("t", 30, 35, 40, 20, 5), 70)
+        self.assertEqual(count_total("d", 30, 35, 40, None, 5), 80)
+        self.assertEqual(count_total("e", 30, 35, 40, 20, None), 55)
+
+    def test_scores_follow_every_write(self):
+        professor, _, _, sheets = self.make_faculty(1, 2)
+        gm = sheets[0]
+        first, second = gm.studentmark_set.order_by("pk")
+        self.assertEqual((first.mean, first.total), (35, 70))
+
+        first.exam = 10
+        first.save(update_fields=["exam"])
+        self.assertEqual(StudentMark.objects.get(pk=first.pk).total, 50)
+
+        client = APIClient()
+        client.force_authenticate(professor.user)
+        client.put(reverse("professor_marksheet", args=[gm.pk]), [{"id": second.pk, "att1": 10, "exam": 0}], format="json")
+        self.assertEqual(StudentMark.objects.get(pk=second.pk).total, 33)
+        self.assertEqual(list(StudentMark.objects.failing()), [StudentMark.objects.get(pk=second.pk)])
+
+        gm.reporting_level = "t"
+        gm.save()
+        self.assertEqual(StudentMark.objects.get(pk=first.pk).total, 70)
+        self.assertEqual(StudentMark.objects.get(pk=first.pk).mean, None)
+
+
+class AnalyticsTests(MarksDataMixin, TestCase):
+    def test_grouped_stats_match_numpy(self):
+        import numpy as np
+        from api.analytics import grouped_stats
+        from api.scoring import MARK_BANDS
+
+        rng = np.random.default_rng(0)
+        values = rng.integers(0, 51, 500).astype(float)
+        values[::7] = np.nan
+        groups = rng.integers(0, 4, 500)
+        stats = grouped_stats(groups, 5, values, MARK_BANDS)
+        for g in range(4):
+            column = values[(groups == g) & ~np.isnan(values)]
+            self.assertEqual(stats["count"][g], len(column))
+            self.assertAlmostEqual(stats["mean"][g], column.mean())
+            self.assertAlmostEqual(stats["std"][g], column.std())
+            self.assertAlmostEqual(stats["median"][g], np.median(column))
+            self.assertAlmostEqual(stats["p10"][g], np.percentile(column, 10))
+            self.assertAlmostEqual(stats["p90"][g], np.percentile(column, 90))
+            self.assertEqual(stats["histogram"][g].tolist(), np.histogram(column, (0, 25, 35, 45, 51))[0].tolist())
+        self.assertEqual(stats["count"][4], 0)
+
+    def test_endpoints(self):
+        professor, _, _, sheets = self.make_faculty(3, 4)
+        admin = self.make_user("dean", is_staff=True)
+        client = APIClient()
+
+        client.force_authenticate(professor.user)
+        data = client.get(reverse("markgroup_analytics", args=[sheets[0].pk])).json()
+        self.assertEqual(data["count"], 4)
+        self.assertEqual(data["columns"]["att1"]["median"], 30)
+        self.assertEqual(data["columns"]["total"]["histogram"], {"0-50": 0, "50-70": 0, "70-90": 4, "90-100": 0})
+        self.assertEqual(client.get(reverse("faculty_analytics")).status_code, 403)
+        client.force_authenticate(self.make_professor("other").user)
+        self.assertEqual(client.get(reverse("markgroup_analytics", args=[sheets[0].pk])).status_code, 404)
+
+        client.force_authenticate(admin)
+        self.assertEqual(client.get(reverse("markgroup_analytics", args=[sheets[0].pk])).json()["count"], 4)
+        data = client.get(reverse("faculty_analytics"), {"semester": sheets[1].semester}).json()
+        self.assertEqual([(row["subject"], row["direction"], row["count"]) for row in data],
+                         [(sheets[1].subject_id, None, 4)])
+
+
+class RankingTests(MarksDataMixin, TestCase):
+    def setUp(self):
+        rankings.clear()
+        self.addCleanup(rankings.clear)
+        self.professor, self.group, self.students, self.sheets = self.make_faculty(2, 4)
+        for i, sm in enumerate(StudentMark.objects.filter(student__in=self.students).order_by("student")):
+            sm.att1 = 20 + 5 * (i // 2)
+            sm.save()
+
+    def test_ranking_table_and_percentile(self):
+        index = rankings.get("group", self.group.pk)
+        self.assertEqual([row["student"] for row in index.page(0, 10)], [s.pk for s in reversed(self.students)])
+        self.assertEqual(index.position(self.students[0].pk)["percentile"], 0)
+        self.assertEqual(index.position(self.students[3].pk),
+                         {"rank": 1, "count": 4, "score": 72.0, "percentile": 75.0})
+
+        client = APIClient()
+        client.force_authenticate(self.professor.user)
+        data = client.get(reverse("ranking", args=["course", 1]), {"limit": 2, "level": "b"}).json()
+        self.assertEqual(data["count"], 4)
+        self.assertEqual([row["rank"] for row in data["results"]], [1, 2])
+        self.assertEqual(client.get(reverse("ranking", args=["nope", 1])).status_code, 404)
+        self.assertEqual(client.get(reverse("ranking", args=["course", 1])).status_code, 400)
+
+    def test_course_is_scoped_by_level(self):
+        masters = CourseGroup.objects.create(course_number=1, group_number="m-1", higher_education_level="m")
+        student = self.make_student("master", masters)
+        sheet = self.make_sheet(self.professor, self.sheets[0].subject, masters)
+        bachelors, course = rankings.get("course", (1, "b")), rankings.get("course", (1, "m"))
+        with self.captureOnCommitCallbacks(execute=True):
+            save_marks([StudentMark(pk=sm.pk, mark_group=sheet, student=student, att1=50, att2=50, att3=50,
+                                    exam=50, additional=0) for sm in sheet.studentmark_set.all()])
+        # Updated incrementally, each level on its own.
+        self.assertIs(rankings.get("course", (1, "m")), course)
+        self.assertEqual(len(bachelors), 4)
+        self.assertEqual(course.position(student.pk)["count"], 1)
+
+        client = APIClient()
+        client.force_authenticate(self.students[3].user)
+        self.assertEqual(client.get(reverse("student_ranking", args=[self.students[3].pk])).json()["course"]["rank"], 1)
+
+    def test_index_is_updated_incrementally(self):
+        index = rankings.get("group", self.group.pk)
+        last = self.students[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            save_marks([StudentMark(pk=sm.pk, mark_group=sm.mark_group, student=last, att1=50, att2=50, att3=50,
+                                    exam=50, additional=0)
+                        for sm in StudentMark.objects.filter(student=last).select_related("mark_group")])
+        self.assertIs(rankings.get("group", self.group.pk), index)
+        self.assertEqual(index.position(last.pk)["rank"], 1)
+        self.assertEqual(index.position(self.students[3].pk)["rank"], 2)
+
+        client = APIClient()
+        client.force_authenticate(last.user)
+        data = client.get(reverse("student_ranking", args=[last.pk])).json()
+        self.assertEqual(data["group"]["rank"], 1)
+        self.assertEqual(data["course"]["percentile"], 75.0)
+
+
+class TranscriptCacheTests(MarksDataMixin, TestCase):
+    def setUp(self):
+        self.professor, _, self.students, self.sheets = self.make_faculty(2, 2)
+        self.student = self.students[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.student.user)
+        self.url = reverse("student_marks", args=[self.student.pk])
+
+    def get(self):
+        response = self.client.get(self.url)
+        return response["X-Cache"], response.json()
+
+    def test_evicted_version_never_revives_old_entries(self):
+        self.assertEqual(self.get()[0], "MISS")
+        sm = StudentMark.objects.filter(student=self.student).first()
+        sm.att1 = 50
+        sm.save()
+        # The cache culls the version keys like any other entry.
+        transcripts.cache.delete_many([f"transcript:version:{self.student.pk}", "transcript:version:all"])
+        cache_status, data = self.get()
+        self.assertEqual(cache_status, "MISS")
+        self.assertIn(50, [row["att1"] for row in data])
+        self.assertEqual(self.get()[0], "HIT")
+
+    def test_hits_until_a_related_write(self):
+        self.assertEqual(self.get()[0], "MISS")
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get()[0], "HIT")
+
+        sm = StudentMark.objects.filter(student=self.student).first()
+        sm.att1 = 50
+        sm.save()
+        cache_status, data = self.get()
+        self.assertEqual(cache_status, "MISS")
+        self.assertIn(50, [row["att1"] for row in data])
+
+        self.student.user.first_name = "Новое"
+        self.student.user.save()
+        cache_status, data = self.get()
+        self.assertEqual((cache_status, data[0]["student"]["user"]["first_name"]), ("MISS", "Новое"))
+
+        self.professor.user.last_name = "Профессор"
+        self.professor.user.save()
+        cache_status, data = self.get()
+        self.assertEqual((cache_status, data[0]["mark_group"]["professor"]["user"]["last_name"]),
+                         ("MISS", "Профессор"))
+
+    def test_other_students_writes_keep_entry(self):
+        self.get()
+        sm = StudentMark.objects.filter(student=self.students[1]).first()
+        sm.att1 = 10
+        sm.save()
+        self.assertEqual(self.get()[0], "HIT")
+        stats = transcripts.stats()
+        self.assertGreaterEqual(stats["hits"], 1)
+        self.assertGreaterEqual(stats["misses"], 1)
+
+
+class ConditionalGetTests(MarksDataMixin, TestCase):
+    def setUp(self):
+        self.professor, _, self.students, self.sheets = self.make_faculty(2, 2)
+        self.client = APIClient()
+
+    def assertRevalidates(self, user, url, change):
+        self.client.force_authenticate(user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def save_mark(self, sm, value=11):
+        sm.att1 = value
+        sm.save()
+
+    def test_student_marks(self):
+        student = self.students[0]
+        self.assertRevalidates(student.user, reverse("student_marks", args=[student.pk]),
+                               lambda: self.save_mark(StudentMark.objects.filter(student=student).first()))
+
+    def test_group_marks(self):
+        gm = self.sheets[0]
+        url = reverse("professor_markgroups", args=[gm.pk])
+        self.assertRevalidates(self.professor.user, url, lambda: save_marks([gm.studentmark_set.first()]))
+
+    def test_subject_and_group_renames(self):
+        student, gm = self.students[0], self.sheets[0]
+
+        def rename_subject():
+            gm.subject.name = "Новое название"
+            gm.subject.save()
+
+        def rename_group():
+            gm.group.group_number = "99"
+            gm.group.save()
+
+        for change in (rename_subject, rename_group):
+            self.assertRevalidates(student.user, reverse("student_marks", args=[student.pk]), change)
+            self.assertRevalidates(self.professor.user, reverse("professor_markgroups", args=[gm.pk]), change)
+
+    def test_professor_mark_groups(self):
+        def change():
+            gm = self.sheets[1]
+            gm.semester = 8
+            gm.save()
+        self.assertRevalidates(self.professor.user, reverse("professor_markgroups"), change)
+
+    def test_current_user(self):
+        student = self.students[0]
+
+        def change():
+            student.record_book_number = "42"
+            student.save()
+        self.assertRevalidates(student.user, reverse("current_user"), change)
+
+        def rename_group():
+            student.group.group_number = "99"
+            student.group.save()
+        self.assertRevalidates(student.user, reverse("current_user"), rename_group)
+
+
+class StudentSearchTests(MarksDataMixin, TestCase):
+    def setUp(self):
+        group = self.make_group("1")
+        names = [("Иванов", "Пётр"), ("Петров", "Иван"), ("Сидорова", "Алёна"), ("Ильина", "Мария")]
+        self.students = {}
+        for i, (last_name, first_name) in enumerate(names):
+            student = self.make_student(f"st{i}", group)
+            student.user.last_name, student.user.first_name = last_name, first_name
+            student.user.save()
+            self.students[last_name] = student
+        self.client = APIClient()
+        self.client.force_authenticate(self.make_professor("prof").user)
+
+    def search(self, q, **params):
+        response = self.client.get(reverse("students-search"), {"q": q, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [row["user"]["last_name"] for row in response.json()]
+
+    def test_substring_prefix_and_record_book(self):
+        self.assertEqual(self.search("иван"), ["Иванов", "Петров"])
+        self.assertEqual(self.search("ИВАНОВ ПЕТР"), ["Иванов"])
+        self.assertEqual(self.search("алена"), ["Сидорова"])
+        self.assertEqual(self.search("и"), ["Иванов", "Ильина"])
+        self.assertEqual(self.search("ил м"), ["Ильина"])
+        self.assertEqual(self.search("st2"), ["Сидорова"])
+        self.assertEqual(self.search("ов", limit=1), [])
+        self.assertEqual(self.search(""), [])
+
+    def test_index_follows_renames_and_deletes(self):
+        student = self.students["Сидорова"]
+        student.user.last_name = "Кузнецова"
+        student.user.save()
+        self.assertEqual(self.search("кузн"), ["Кузнецова"])
+        self.assertEqual(self.search("сидор"), [])
+        student.delete()
+        self.assertEqual(self.search("кузн"), [])
+
+    def test_students_cannot_search(self):
+        self.client.force_authenticate(self.students["Иванов"].user)
+        self.assertEqual(self.client.get(reverse("students-search"), {"q": "иван"}).status_code, 403)
+
+
+class KeysetPaginationTests(MarksDataMixin, TestCase):
+    def setUp(self):
+        group = self.make_group("1")
+        self.students = []
+        for i in range(7):
+            student = self.make_student(f"st{i}", group)
+            student.user.last_name = "АБВ"[i % 3]
+            student.user.save()
+            self.students.append(student)
+        self.client = APIClient()
+        self.client.force_authenticate(self.make_user("admin", is_staff=True))
+
+    def collect(self, **params):
+        pages, url = [], reverse("students-list")
+        while url:
+            response = self.client.get(url, params if not pages else None)
+            self.assertEqual(response.status_code, 200, response.content)
+            data = response.json()
+            pages.append([(row["user"]["last_name"], row["pk"]) for row in data["results"]])
+            url = data["next"]
+        return pages
+
+    def test_pk_order(self):
+        pages = self.collect(page_size=3)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual([pk for page in pages for _, pk in page], [s.pk for s in self.students])
+
+    def test_sort_key_with_ties(self):
+        rows = [row for page in self.collect(page_size=2, ordering="-name") for row in page]
+        self.assertEqual(rows, sorted(((s.user.last_name, s.pk) for s in self.students), reverse=True))
+
+    def test_sort_keys_are_indexed(self):
+        for i, last_name in enumerate(("Б", "А", "Ё")):
+            professor = self.make_professor(f"prof{i}")
+            professor.user.last_name = last_name
+            professor.user.save()
+        names = self.client.get(reverse("professors-list"), {"ordering": "name"}).json()["results"]
+        self.assertEqual([row["user"]["last_name"] for row in names], ["А", "Б", "Ё"])
+        professor.user.last_name = "Аа"
+        professor.user.save()
+        self.assertEqual(Professor.objects.get(pk=professor.pk).sort_name, "аа имя отчество")
+        for url, ordering in ((reverse("students-list"), "record_book_number"), (reverse("students-list"), "-name"),
+                              (reverse("professors-list"), "name")):
+            with self.subTest(ordering):
+                first = self.client.get(url, {"page_size": 2, "ordering": ordering})
+                with CaptureQueriesContext(connection) as ctx:
+                    self.client.get(first.json()["next"])
+                sql = next(query["sql"] for query in ctx.captured_queries if "ORDER BY" in query["sql"])
+                with connection.cursor() as cursor:
+                    plan = "\n".join(row[-1] for row in cursor.execute(f"EXPLAIN QUERY PLAN {sql}"))
+                self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_deep_page_costs_the_same(self):
+        first = self.client.get(reverse("students-list"), {"page_size": 2})
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(first.json()["next"])
+        with CaptureQueriesContext(connection) as first_ctx:
+            self.client.get(reverse("students-list"), {"page_size": 2})
+        self.assertEqual(len(ctx.captured_queries), len(first_ctx.captured_queries))
+        self.assertNotIn("OFFSET", ctx.captured_queries[-1]["sql"])
+
+
+class CompactMarksPayloadTests(MarksDataMixin, TestCase):
+    def setUp(self):
+        self.professor, self.group, self.students, self.sheets = self.make_faculty(10, 12)
+        self.client = APIClient()
+
+    def test_transcript_sideloads_each_object_once(self):
+        student = self.students[0]
+        self.client.force_authenticate(student.user)
+        url = reverse("student_marks", args=[student.pk])
+        full = self.client.get(url)
+        compact = self.client.get(url, {"compact": 1})
+        data = compact.json()
+
+        self.assertEqual(len(data["marks"]), 10)
+        self.assertEqual(list(data["students"]), [str(student.pk)])
+        self.assertEqual(list(data["professors"]), [str(self.professor.pk)])
+        self.assertEqual(list(data["groups"]), [str(self.group.pk)])
+        self.assertEqual(len(data["subjects"]), 10)
+        self.assertLess(len(compact.content) * 2, len(full.content))
+
+        # Every nested object of the full payload is reachable through the lookup tables.
+        for row, full_row in zip(data["marks"], full.json()):
+            mark_group = data["mark_groups"][str(row["mark_group"])]
+            self.assertEqual(data["subjects"][str(mark_group["subject"])], full_row["mark_group"]["subject"])
+            self.assertEqual(data["professors"][str(mark_group["professor"])], full_row["mark_group"]["professor"])
+            self.assertEqual(data["students"][str(row["student"])]["user"], full_row["student"]["user"])
+            self.assertEqual(row["total"], full_row["total"])
+
+    def test_sheet_compact_payload(self):
+        self.client.force_authenticate(self.professor.user)
+        url = reverse("professor_markgroups", args=[self.sheets[0].pk])
+        with CaptureQueriesContext(connection) as full_ctx:
+            full = self.client.get(url)
+        with CaptureQueriesContext(connection) as compact_ctx:
+            data = self.client.get(url, {"compact": "true"}).json()
+        self.assertEqual(len(compact_ctx.captured_queries), len(full_ctx.captured_queries))
+        self.assertEqual([row["id"] for row in data["marks"]], [row["id"] for row in full.json()])
+        self.assertEqual(len(data["students"]), 12)
+        self.assertEqual(len(data["mark_groups"]), 1)
+
+
+class FastSerializationTests(MarksDataMixin, TestCase):
+    def setUp(self):
+        self.professor, self.group, self.students, self.sheets = self.make_faculty(3, 4)
+        # Uneven data: empty marks, a professor without subjects, a student who left the group
+        # with a graded row, a superuser, and names JSON has to escape.
+        StudentMark.objects.filter(student=self.students[1]).update(att2=None, exam=None, total=None)
+        self.professor.user.last_name = 'О\'Коннор "Ёж" \u2028\\'
+        self.professor.user.save()
+        lonely = self.make_professor("lonely")
+        self.make_sheet(lonely, Subject.objects.first(), self.group, semester=2, reporting_level="t")
+        self.students[2].group = None
+        self.students[2].save()
+        self.students[3].user.is_superuser = True
+        self.students[3].user.save()
+
+    def assertSameBytes(self, marks):
+        expected = JSONRenderer().render(StudentMarksSerializer(marks.with_related(), many=True).data)
+        fast = serialize_rows(StudentMarksSerializer, marks)
+        self.assertEqual(FastJSONRenderer().render(fast), expected)
+        self.assertEqual(JSONRenderer().render(fast), expected)
+
+    def test_byte_identical_to_serializers(self):
+        for student in self.students:
+            self.assertSameBytes(StudentMark.objects.filter(student=student).order_by("-mark_group__semester"))
+        for gm in GroupMark.objects.all():
+            self.assertSameBytes(StudentMark.objects.filter(mark_group=gm).order_by("student"))
+        self.assertSameBytes(StudentMark.objects.none())
+
+    def test_endpoints_unchanged(self):
+        client = APIClient()
+        client.force_authenticate(self.professor.user)
+        urls = [reverse("student_marks", args=[st.pk]) for st in self.students]
+        urls += [reverse("professor_markgroups", args=[gm.pk]) for gm in self.sheets]
+        for url in urls:
+            transcripts.bump_all()
+            fast = client.get(url)
+            transcripts.bump_all()
+            with override_settings(FAST_MARKS_SERIALIZATION=False):
+                slow = client.get(url)
+            self.assertEqual(fast.status_code, 200)
+            self.assertEqual(fast.content, slow.content)
+
+
+class UserRoleTests(MarksDataMixin, TestCase):
+    def assertRole(self, user, role):
+        self.assertEqual(user.get_role(), role)
+        self.assertEqual(User.objects.get(pk=user.pk).role, role)
+
+    def test_role_follows_profiles(self):
+        user = self.make_user("user")
+        self.assertRole(user, "not set")
+        student = Student.objects.create(user=user, year_of_enrollment="2023")
+        self.assertRole(user, "student")
+        student.delete()
+        self.assertRole(user, "not set")
+        Professor.objects.create(user=user)
+        self.assertRole(user, "professor")
+
+        admin = self.make_user("admin")
+        admin.is_superuser = True
+        admin.save(update_fields=["is_superuser"])
+        self.assertRole(admin, "admin")
+        admin.is_superuser = False
+        admin.save()
+        self.assertRole(admin, "not set")
+
+    def test_stale_instance_keeps_role(self):
+        user = self.make_user("user")
+        stale = User.objects.get(pk=user.pk)
+        Student.objects.create(user=user, year_of_enrollment="2023")
+        stale.first_name = "Другое"
+        stale.save()
+        self.assertRole(stale, "student")
+
+    def test_checks_read_role_without_queries(self):
+        professor = self.make_professor("prof")
+        request = type("Request", (), {"user": User.objects.get(pk=professor.user.pk)})()
+        with self.assertNumQueries(0):
+            self.assertTrue(IsProfessor().has_permission(request, None))
+            self.assertEqual(MyUserSerializer(request.user).data["role"], "professor")
+
+
+@mock.patch("rest_framework.views.APIView.authentication_classes", [StatelessJWTAuthentication])
+class StatelessJWTTests(MarksDataMixin, TestCase):
+    def setUp(self):
+        self.professor, _, self.students, self.sheets = self.make_faculty(2, 2)
+        self.client = APIClient()
+        revocations.invalidate()
+        self.addCleanup(revocations.invalidate)
+
+    def authenticate(self, user):
+        token = ClaimsTokenObtainPairSerializer.get_token(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+        return token
+
+    def test_claims(self):
+        access = self.authenticate(self.students[0].user).access_token
+        self.assertEqual((access["role"], access["student_pk"], access["professor_pk"]),
+                         ("student", self.students[0].pk, None))
+        response = self.client.get(reverse("current_user"))
+        self.assertEqual(response.json()["pk"], self.students[0].pk)
+
+    def test_requests_do_not_load_the_user(self):
+        self.authenticate(self.professor.user)
+        url = reverse("professor_markgroups")
+        etag = self.client.get(url)["ETag"]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # Only the ETag aggregate: neither the user nor the revocation set is loaded.
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_deactivated_user_is_rejected(self):
+        user = self.students[0].user
+        self.authenticate(user)
+        url = reverse("student_marks", args=[self.students[0].pk])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.is_active = False
+            user.save()
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+    def test_role_change_revokes_tokens(self):
+        student = self.make_student("transferred", None)
+        self.authenticate(student.user)
+        with mock.patch("django.utils.timezone.now", return_value=timezone.now() + timedelta(seconds=5)), \
+                self.captureOnCommitCallbacks(execute=True):
+            student.delete()
+        response = self.client.get(reverse("student_marks", args=[self.students[0].pk]))
+        self.assertEqual(response.status_code, 401)
+
+        refresh = ClaimsTokenObtainPairSerializer.get_token(student.user)
+        self.assertEqual(self.client.post(reverse("token_refresh"), {"refresh": str(refresh)}).status_code, 401)
+
+    def test_refresh_reissues_claims(self):
+        user = self.make_user("newcomer")
+        refresh = ClaimsTokenObtainPairSerializer.get_token(user)
+        Professor.objects.create(user=user)
+        User.objects.filter(pk=user.pk).update(tokens_valid_after=None)
+        access = self.client.post(reverse("token_refresh"), {"refresh": str(refresh)}).json()["access"]
+        self.assertEqual(AccessToken(access)["role"], "professor")
+
+
+class SQLiteConcurrencyTests(SimpleTestCase):
+    """A writer holding the database lock, seen from a second connection, with and without WAL."""
+    databases = {"default"}
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "db.sqlite3")
+        self.wal = {"journal_mode": "wal", **settings.SQLITE_PRAGMAS}
+
+    def connect(self, pragmas=None, timeout=0):
+        conn = sqlite3.connect(self.path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.addCleanup(conn.close)
+        apply_pragmas(conn.cursor(), pragmas or {})
+        return conn
+
+    def hold_write_lock(self, pragmas):
+        writer = self.connect(pragmas)
+        writer.execute("CREATE TABLE IF NOT EXISTS marks (value INTEGER)")
+        writer.execute("INSERT INTO marks VALUES (1)")
+        writer.execute("BEGIN EXCLUSIVE")
+        writer.execute("INSERT INTO marks VALUES (2)")
+        return writer
+
+    def test_rollback_journal_blocks_readers(self):
+        self.hold_write_lock({"journal_mode": "delete"})
+        with self.assertRaisesMessage(sqlite3.OperationalError, "database is locked"):
+            self.connect().execute("SELECT count(*) FROM marks").fetchone()
+
+    def test_wal_readers_are_not_blocked(self):
+        writer = self.hold_write_lock(self.wal)
+        reader = self.connect(self.wal)
+        # The reader sees the last committed state while the write transaction is open.
+        self.assertEqual(reader.execute("SELECT count(*) FROM marks").fetchone(), (1,))
+        writer.execute("COMMIT")
+        self.assertEqual(reader.execute("SELECT count(*) FROM marks").fetchone(), (2,))
+
+    def test_busy_timeout_waits_for_the_writer(self):
+        writer = self.hold_write_lock(self.wal)
+        other = self.connect(self.wal)
+        threading.Timer(0.2, writer.execute, ["COMMIT"]).start()
+        other.execute("INSERT INTO marks VALUES (3)")
+        self.assertEqual(other.execute("SELECT count(*) FROM marks").fetchone(), (3,))
+
+    def test_django_connection_uses_profile(self):
+        with connection.cursor() as cursor:
+            pragmas = effective_pragmas(cursor, ["busy_timeout", "synchronous", "temp_store"])
+        self.assertEqual(pragmas, {"busy_timeout": 5000, "synchronous": 1, "temp_store": 2})
+
+    def test_journal_mode_only_when_deployed(self):
+        # journal_mode persists in the database file: a checkout's database keeps its mode.
+        with override_settings(SQLITE_JOURNAL_MODE=None):
+            self.assertNotIn("journal_mode", configured_pragmas())
+        with override_settings(SQLITE_JOURNAL_MODE="wal"):
+            self.assertEqual(next(iter(configured_pragmas().items())), ("journal_mode", "wal"))
+
+        sqlite3.connect(self.path).close()
+        dev = DatabaseWrapper({**connection.settings_dict, "NAME": self.path}, alias="dev")
+        self.addCleanup(dev.close)
+        with override_settings(SQLITE_JOURNAL_MODE=None), dev.cursor() as cursor:
+            self.assertEqual(effective_pragmas(cursor, ["journal_mode", "busy_timeout"]),
+                             {"journal_mode": "delete", "busy_timeout": 5000})
+
+
+@override_settings(REPLICA_DATABASE_ALIAS="default")
+class ReplicaRoutingTests(MarksDataMixin, TestCase):
+    """The test database stands in for the replica alias, so routing decisions are recorded, not data."""
+
+    def setUp(self):
+        self.professor, self.group, self.students, self.sheets = self.make_faculty(2, 3)
+        caches[settings.REPLICA_PIN_CACHE_ALIAS].clear()
+        rankings.clear()
+        self.addCleanup(rankings.clear)
+        self.decisions = []
+        db_for_read = ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            alias = db_for_read(router, model, **hints)
+            self.decisions.append(alias)
+            return alias
+
+        patcher = mock.patch.object(ReplicaRouter, "db_for_read", record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, user, url):
+        client = APIClient()
+        client.force_authenticate(user)
+        self.decisions.clear()
+        self.assertEqual(client.get(url).status_code, 200)
+        return set(self.decisions)
+
+    def test_use_replica(self):
+        self.assertIsNone(ReplicaRouter().db_for_read(StudentMark))
+        with use_replica():
+            self.assertEqual(ReplicaRouter().db_for_read(StudentMark), "default")
+        self.assertIsNone(ReplicaRouter().db_for_read(StudentMark))
+
+    def test_read_views_use_replica(self):
+        student = self.students[0]
+        self.assertEqual(self.get(student.user, reverse("student_marks", args=[student.pk])), {"default"})
+        # The shared ranking index is built on the primary, the page around it on the replica.
+        url = reverse("ranking", args=["group", self.group.pk])
+        self.assertEqual(self.get(self.professor.user, url), {None, "default"})
+        self.assertEqual(self.get(self.professor.user, url), {"default"})
+        # Endpoints without the mixin stay on the primary.
+        self.assertEqual(self.get(self.professor.user, reverse("professor_markgroups")), {None})
+
+    def test_writer_reads_own_writes(self):
+        other = self.make_professor("other")
+        client = APIClient()
+        client.force_authenticate(self.professor.user)
+        row = self.sheets[0].studentmark_set.first()
+        client.put(reverse("professor_marksheet", args=[self.sheets[0].pk]), [{"id": row.pk, "att1": 1}],
+                   format="json")
+
+        url = reverse("ranking", args=["group", self.group.pk])
+        self.assertEqual(self.get(self.professor.user, url), {None})
+        self.assertEqual(self.get(other.user, url), {"default"})
+
+    def test_replica_transcripts_follow_sync_generations(self):
+        student = self.students[0]
+        client = APIClient()
+        client.force_authenticate(student.user)
+        url = reverse("student_marks", args=[student.pk])
+        # Without a generation marker replica data is never cached.
+        self.assertEqual(client.get(url)["X-Cache"], "BYPASS")
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with mock.patch("api.routers._generation_path", lambda alias: os.path.join(directory.name, "generation")):
+            bump_replica_version()
+            self.assertEqual([client.get(url)["X-Cache"] for _ in range(2)], ["MISS", "HIT"])
+            bump_replica_version()
+            self.assertEqual(client.get(url)["X-Cache"], "MISS")
+
+    def test_pins_need_a_shared_cache(self):
+        self.assertEqual(check_pin_cache(None), [])
+        with override_settings(REPLICA_PIN_CACHE_ALIAS="default"):
+            self.assertEqual([message.id for message in check_pin_cache(None)], ["api.W002"])
+
+    def test_pin_middleware_runs_async(self):
+        async def get_response(request):
+            return HttpResponse(status=201)
+
+        middleware = ReplicaPinMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = APIRequestFactory().post("/")
+        request.user = self.professor.user
+        response = async_to_sync(middleware)(request)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(is_pinned(self.professor.user))
+
+
+class SQLiteBackupTests(SimpleTestCase):
+    def test_backup_refreshes_open_replica_connections(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        primary, replica = (os.path.join(directory.name, name) for name in ("primary.sqlite3", "replica.sqlite3"))
+        writer = sqlite3.connect(primary, isolation_level=None)
+        self.addCleanup(writer.close)
+        apply_pragmas(writer.cursor(), {"journal_mode": "wal", **settings.SQLITE_PRAGMAS})
+        writer.execute("CREATE TABLE marks (value INTEGER)")
+        writer.execute("INSERT INTO marks VALUES (1)")
+
+        backup_sqlite(primary, replica)
+        reader = sqlite3.connect(replica, isolation_level=None)
+        self.addCleanup(reader.close)
+        self.assertEqual(reader.execute("SELECT count(*) FROM marks").fetchone(), (1,))
+
+        writer.execute("INSERT INTO marks VALUES (2)")
+        backup_sqlite(primary, replica)
+        self.assertEqual(reader.execute("SELECT count(*) FROM marks").fetchone(), (2,))
+
+
+class QueryPlanTests(MarksDataMixin, TestCase):
+    """EXPLAIN QUERY PLAN of the hot marks queries: the large tables are only ever searched through an index."""
+    hot_tables = ("api_studentmark", "api_groupmark", "api_student", "api_user",
+                  "api_archivedstudentmark", "api_archivedgroupmark")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.professor, cls.group, cls.students, cls.sheets = cls().make_faculty(3, 5)
+
+    def assertIndexed(self, query):
+        """`query` is a queryset or SQL captured from running code."""
+        if isinstance(query, str):
+            with connection.cursor() as cursor:
+                plan = "\n".join(row[-1] for row in cursor.execute(f"EXPLAIN QUERY PLAN {query}"))
+        else:
+            plan = query.explain()
+        for line in plan.splitlines():
+            scanned = line.split("SCAN ", 1)[1].split()[0] if "SCAN " in line else None
+            self.assertNotIn(scanned, self.hot_tables, f"full scan of {scanned}:\n{plan}")
+
+    def hot_querysets(self):
+        student, gm = self.students[0], self.sheets[0]
+        user = self.professor.user
+        transcript = StudentMark.objects.filter(student=student.pk).order_by("-mark_group__semester")
+        sheet = StudentMark.objects.filter(mark_group=gm.pk, student__group=F("mark_group__group")).order_by("student")
+        groups = GroupMark.objects.filter(professor__user=user.pk)
+        return {
+            "transcript": transcript.values_list(*row_mapper(StudentMarksSerializer).lookups),
+            "sheet": sheet.values_list(*row_mapper(StudentMarksSerializer).lookups),
+            "sheet rows": StudentMark.objects.filter(mark_group=gm.pk, student=student.pk),
+            "professor groups": groups.with_related(),
+            "group sheets": GroupMark.objects.filter(group=self.group.pk, semester=1),
+            "subject sheets": GroupMark.objects.filter(subject=gm.subject_id, semester=1),
+            "student provisioning": GroupMark.objects.filter(group=self.group.pk).values_list("pk"),
+            "group ranking": StudentMark.objects.filter(student__group=self.group.pk, total__isnull=False)
+            .values_list("student").annotate(score=Avg("total")).order_by(),
+        }
+
+    def test_hot_queries_use_indexes(self):
+        for name, queryset in self.hot_querysets().items():
+            with self.subTest(name):
+                self.assertIndexed(queryset)
+
+    def test_validator_queries_use_indexes(self):
+        request = APIRequestFactory().get("/")
+        request.user = self.professor.user
+        states = {
+            "transcript state": lambda: transcript_state(request, self.students[0].pk),
+            "sheet state": lambda: sheet_state(request, self.sheets[0].pk),
+            "professor groups state": lambda: professor_groups_state(request),
+        }
+        for name, state in states.items():
+            with self.subTest(name):
+                with CaptureQueriesContext(connection) as ctx:
+                    state()
+                self.assertEqual(len(ctx.captured_queries), 1)
+                self.assertIndexed(ctx.captured_queries[0]["sql"])
+
+    def test_sheet_rows_are_unique(self):
+        row = self.sheets[0].studentmark_set.first()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            StudentMark.objects.create(mark_group=row.mark_group, student=row.student)
+        provision_sheet(self.sheets[0])
+        self.assertEqual(self.sheets[0].studentmark_set.count(), len(self.students))
+
+
+class MarkImportTests(MarksDataMixin, TestCase):
+    def setUp(self):
+        self.professor, self.group, self.students, self.sheets = self.make_faculty(1, 3)
+        self.numbered = self.make_student("1001", self.group)
+        self.gm = self.sheets[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.professor.user)
+        self.url = reverse("professor_markimport", args=[self.gm.pk])
+
+    def upload(self, content, name="marks.csv", **params):
+        query = "?dry_run=1" if params.get("dry_run") else ""
+        return self.client.post(self.url + query, {"file": SimpleUploadedFile(name, content)}, format="multipart")
+
+    def marks(self):
+        return dict(self.gm.studentmark_set.values_list("student__record_book_number", "att1"))
+
+    def test_dry_run_then_import(self):
+        content = "﻿Номер зачетной книжки;Аттестация 1;Экзамен\nsstud0;10;\nsstud1;31;30\n".encode()
+        before = self.marks()
+        report = self.upload(content, dry_run=True).json()
+        self.assertEqual((report["rows"], report["changed"], report["applied"]), (2, 2, False))
+        self.assertEqual(report["changes"][0]["changes"], {"att1": [30, 10], "exam": [30, None]})
+        self.assertEqual(self.marks(), before)
+
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(response.json()["applied"])
+        row = self.gm.studentmark_set.get(student=self.students[0])
+        self.assertEqual((row.att1, row.att2, row.exam, row.total), (10, 35, None, 33))
+
+    def test_errors_reject_the_file(self):
+        content = ("record_book_number,att1,att2\n"
+                   "sstud0,10,\n"
+                   "nobody,10,10\n"
+                   "sstud1,60,10\n"
+                   "sstud0,11,11\n").encode()
+        before = self.marks()
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 400)
+        report = response.json()
+        self.assertEqual([error["line"] for error in report["errors"]], [3, 4, 5])
+        self.assertIn("att1", report["errors"][1]["errors"])
+        self.assertFalse(report["applied"])
+        self.assertEqual(self.marks(), before)
+
+    def test_xlsx_and_cp1251(self):
+        workbook = openpyxl.Workbook()
+        workbook.active.append(["record_book_number", "att2"])
+        workbook.active.append([1001, 7])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        self.assertEqual(self.upload(buffer.getvalue(), name="marks.xlsx").status_code, 200)
+        self.assertEqual(self.gm.studentmark_set.get(student=self.numbered).att2, 7)
+
+        self.assertEqual(self.upload("Зачётная книжка;Экзамен\n1001;12\n".encode("cp1251")).status_code, 200)
+        self.assertEqual(self.gm.studentmark_set.get(student=self.numbered).exam, 12)
+
+    def test_malformed_csv_is_rejected(self):
+        before = self.marks()
+        padding = "".join(f"sstud0,{i % 50}\n" for i in range(8000)).encode()
+        self.assertGreater(len(padding), SAMPLE_SIZE)
+        for content, message in ((b"record_book_number,att1\nsstud0,1\x000\n", "NUL"),
+                                 (b"record_book_number,att1\n" + padding + b"sstud1,\xff\xfe\n", "utf-8"),
+                                 (b'record_book_number,att1\nsstud0,"' + b"1" * 200_000 + b'"\n', "CSV")):
+            with self.subTest(message):
+                response = self.upload(content)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(message, response.json()["file"][0])
+        self.assertEqual(self.marks(), before)
+
+    def test_other_professors_sheet(self):
+        self.client.force_authenticate(self.make_professor("other").user)
+        self.assertEqual(self.upload(b"record_book_number\n").status_code, 404)
+
+    def test_rows_are_streamed(self):
+        with tempfile.TemporaryFile() as fileobj:
+            for i in range(100_000):
+                fileobj.write(f"R{i:06d},{i % 50},{i % 40}\n".encode())
+            size = fileobj.tell()
+            fileobj.seek(0)
+            tracemalloc.start()
+            try:
+                rows = sum(1 for _ in iter_rows(fileobj, "big.csv"))
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        self.assertEqual(rows, 99_999)
+        self.assertGreater(size, 1024 * 1024)
+        self.assertLess(peak, 512 * 1024)
+
+
+class MarksExportTests(MarksDataMixin, TestCase):
+    def setUp(self):
+        self.professor, self.group, self.students, self.sheets = self.make_faculty(3, 4)
+        self.direction = Direction.objects.create(name="Направление")
+        self.direction.subjects.set([gm.subject for gm in self.sheets[:2]])
+        self.client = APIClient()
+
+    def export(self, user, url, **params):
+        self.client.force_authenticate(user)
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode("utf-8-sig"))))
+
+    def test_sheet_round_trips_through_import(self):
+        rows = self.export(self.professor.user, reverse("professor_markexport", args=[self.sheets[0].pk]))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[1][:2], [self.students[0].record_book_number, "Фамилия"])
+        self.assertEqual(rows[1][-7:], ["30", "35", "40", "30", "5", "35", "70"])
+
+        rows[1][8] = "12"
+        content = io.StringIO()
+        csv.writer(content).writerows(rows)
+        report = import_marks(self.sheets[0], io.BytesIO(content.getvalue().encode()), "sheet.csv")
+        self.assertEqual((report["error_count"], report["changed"], report["applied"]), (0, 1, True))
+
+    def test_transcript_and_direction(self):
+        student = self.students[1]
+        rows = self.export(student.user, reverse("student_marks_export", args=[student.pk]))
+        self.assertEqual([row[6] for row in rows[1:]], ["1", "2", "3"])
+
+        admin = self.make_user("admin", is_staff=True)
+        rows = self.export(admin, reverse("marks_export"), direction=self.direction.pk)
+        self.assertEqual(len(rows), 1 + 2 * 4)
+        rows = self.export(admin, reverse("marks_export"), direction=self.direction.pk, semester=2)
+        self.assertEqual({row[5] for row in rows[1:]}, {self.sheets[1].subject.name})
+
+    def test_streams_through_asgi_handler(self):
+        admin = self.make_user("admin", is_staff=True)
+        url = reverse("marks_export")
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": url, "raw_path": url.encode(), "query_string": f"direction={self.direction.pk}".encode(),
+            "root_path": "", "headers": [(b"host", b"testserver"),
+                                         (b"authorization", f"Bearer {AccessToken.for_user(admin)}".encode())],
+            "client": ("127.0.0.1", 0), "server": ("testserver", 80),
+        }
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        # Like the test client: keep the test transaction's connection open.
+        request_started.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+        with mock.patch("api.exports.CHUNK_SIZE", 3):
+            async_to_sync(ASGIHandler())(scope, receive, send)
+        self.assertEqual(messages[0]["status"], 200)
+        bodies = [message["body"] for message in messages[1:] if message.get("body")]
+        # The header, then rows in chunks as they are read: not one buffered body.
+        self.assertEqual(len(bodies), 4)
+        rows = list(csv.reader(io.StringIO(b"".join(bodies).decode("utf-8-sig"))))
+        self.assertEqual(len(rows), 1 + 2 * 4)
+
+    def test_other_professor_cannot_export_sheet(self):
+        self.client.force_authenticate(self.make_professor("other").user)
+        self.assertEqual(self.client.get(reverse("professor_markexport", args=[self.sheets[0].pk])).status_code, 404)
+
+    def export_peak(self, params):
+        response = self.client.get(reverse("marks_export"), params)
+        chunks = iter(response.streaming_content)
+        with self.assertNumQueries(0):
+            self.assertTrue(next(chunks).decode().startswith("\ufeffНомер зачетной книжки"))
+        size = lines = 0
+        tracemalloc.start()
+        try:
+            for chunk in chunks:
+                size += len(chunk)
+                lines += chunk.count(b"\n")
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return lines, size, peak
+
+    def test_streams_with_flat_memory(self):
+        users = User.objects.bulk_create(User(username=f"bulk{i}", email=f"bulk{i}@example.com")
+                                         for i in range(200))
+        students = Student.objects.bulk_create(Student(user=user, group=self.group, year_of_enrollment="2023",
+                                                       record_book_number=f"B{i:05d}")
+                                               for i, user in enumerate(users))
+        subject = Subject.objects.first()
+        gms = GroupMark.objects.bulk_create(GroupMark(subject=subject, professor=self.professor, group=self.group,
+                                                      semester=1 if i < 20 else 2, reporting_level="e")
+                                            for i in range(100))
+        StudentMark.objects.bulk_create((StudentMark(mark_group=gm, student=st, att1=30, total=60)
+                                         for gm in gms for st in students), batch_size=5000)
+        self.direction.subjects.add(subject)
+        self.client.force_authenticate(self.make_user("admin", is_staff=True))
+
+        self.export_peak({"direction": self.direction.pk, "semester": 1})  # warm up caches and imports
+        small_lines, _, small_peak = self.export_peak({"direction": self.direction.pk, "semester": 1})
+        lines, _, peak = self.export_peak({"direction": self.direction.pk})
+        self.assertGreaterEqual(small_lines, 4_000)
+        self.assertGreaterEqual(lines, 20_000)
+        # Five times the rows, about the same peak: memory does not grow with the export.
+        self.assertLess(peak, small_peak * 1.5)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class UserProvisioningTests(MarksDataMixin, TestCase):
+    def setUp(self):
+        self.professor, self.group, self.students, self.sheets = self.make_faculty(2, 1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.make_user("admin", is_staff=True))
+
+    def upload(self, basename, content, name="roster.csv", dry_run=False):
+        url = reverse(f"{basename}-provision") + ("?dry_run=1" if dry_run else "")
+        return self.client.post(url, {"file": SimpleUploadedFile(name, content)}, format="multipart")
+
+    def test_hashes_passwords_in_parallel(self):
+        hashes = hash_passwords(["first", "second", "third"], workers=2)
+        self.assertEqual(len(hashes), 3)
+        self.assertTrue(check_password("second", hashes[1]))
+        self.assertFalse(is_password_usable(hash_passwords([None], workers=2)[0]))
+
+    def test_creates_students_with_sheets(self):
+        content = ("Логин;Email;Пароль;Фамилия;Имя;Отчество;Номер зачетной книжки;Год поступления;Группа\n"
+                   "new0;new0@example.com;vernal-otter-0;Ёлкин;Иван;Петрович;R0;2024;s-1\n"
+                   "new1;new1@example.com;vernal-otter-1;Петров;Пётр;;R1;2024;s-1\n"
+                   "new2;new2@example.com;;Сидоров;Семён;;R2;2024;\n").encode()
+        with self.assertNumQueries(3):
+            self.assertEqual(self.upload("students", content, dry_run=True).status_code, 200)
+        self.assertFalse(User.objects.filter(username__startswith="new").exists())
+
+        with mock.patch("api.provisioning.ProcessPoolExecutor") as pool:
+            response = self.upload("students", content)
+        pool.assert_not_called()
+        self.assertEqual(response.status_code, 201, response.content)
+        report = response.json()
+        self.assertEqual((report["rows"], report["created"], report["error_count"]), (3, 3, 0))
+        self.assertEqual(set(report["timings"]), {"validate", "hash", "insert"})
+        self.assertGreater(report["users_per_second"], 0)
+
+        student = Student.objects.select_related("user").get(user__username="new0")
+        self.assertEqual((student.user.role, student.group, student.record_book_number), ("student", self.group, "R0"))
+        self.assertTrue(student.user.check_password("vernal-otter-0"))
+        self.assertEqual(student.search_text, "елкин иван петрович r0")
+        self.assertEqual(StudentMark.objects.filter(student=student).count(), len(self.sheets))
+        self.assertFalse(User.objects.get(username="new2").has_usable_password())
+        self.assertEqual([st.user.username for st in search_students("елкин")], ["new0"])
+
+    def test_creates_professors(self):
+        content = b"username,email,password,last_name,first_name\nprof0,prof0@example.com,vernal-otter,Smith,John\n"
+        self.assertEqual(self.upload("professors", content).status_code, 201)
+        professor = Professor.objects.select_related("user").get(user__username="prof0")
+        self.assertEqual(professor.user.role, "professor")
+
+    def test_errors_reject_the_roster(self):
+        content = ("username,email,last_name,first_name,year_of_enrollment,group\n"
+                   "ok0,ok0@example.com,A,B,2024,s-1\n"
+                   "sstud0,fresh@example.com,A,B,2024,s-1\n"
+                   "ok1,ok0@example.com,A,B,2024,s-1\n"
+                   "ok2,ok2@example.com,A,B,24,s-1\n"
+                   "ok3,ok3@example.com,A,B,2024,nope\n").encode()
+        response = self.upload("students", content)
+        self.assertEqual(response.status_code, 400)
+        report = response.json()
+        self.assertEqual([error["line"] for error in report["errors"]], [5, 3, 4, 6])
+        self.assertEqual(report["created"], 0)
+        self.assertFalse(User.objects.filter(username__startswith="ok").exists())
+
+    def test_password_validators(self):
+        content = ("username,email,password,last_name,first_name\n"
+                   "prof0,prof0@example.com,vernal-otter,Smith,John\n"
+                   "prof1,prof1@example.com,short,Smith,John\n"
+                   "prof2,prof2@example.com,password,Smith,John\n"
+                   "johnsmith,prof3@example.com,johnsmith,Smith,John\n"
+                   "prof4,prof4@example.com,,Smith,John\n").encode()
+        response = self.upload("professors", content)
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()["errors"]
+        self.assertEqual([(error["line"], list(error["errors"])) for error in errors],
+                         [(3, ["password"]), (4, ["password"]), (5, ["password"])])
+        self.assertFalse(User.objects.filter(username__startswith="prof").exists())
+
+    def test_group_number_shared_by_courses(self):
+        senior = self.make_group(self.group.group_number, course_number=3)
+        content = ("username,email,last_name,first_name,year_of_enrollment,group\n"
+                   "ok0,ok0@example.com,A,B,2024,s-1\n").encode()
+        response = self.upload("students", content)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("укажите курс", response.json()["errors"][0]["errors"]["group"][0])
+
+        content = ("username,email,last_name,first_name,year_of_enrollment,group,курс,ступень\n"
+                   "ok0,ok0@example.com,A,B,2024,s-1,3,бакалавриат\n"
+                   "ok1,ok1@example.com,A,B,2024,s-1,1,b\n"
+                   "ok2,ok2@example.com,A,B,2024,s-1,1,магистратура\n"
+                   "ok3,ok3@example.com,A,B,2024,s-1,1,нет\n").encode()
+        report = self.upload("students", content, dry_run=True).json()
+        self.assertEqual([(error["line"], list(error["errors"])) for error in report["errors"]],
+                         [(5, ["level"]), (4, ["group"])])
+        self.assertEqual(self.upload("students", content.rsplit(b"\n", 3)[0] + b"\n").status_code, 201)
+        self.assertEqual(Student.objects.get(user__username="ok0").group, senior)
+        self.assertEqual(Student.objects.get(user__username="ok1").group, self.group)
+
+    def test_admins_only(self):
+        self.client.force_authenticate(self.professor.user)
+        self.assertEqual(self.upload("students", b"username\n").status_code, 403)
+
+
+class AsyncReadViewsTests(MarksDataMixin, TestCase):
+    def setUp(self):
+        self.professor, _, self.students, self.sheets = self.make_faculty(3, 3)
+        self.admin = self.make_user("admin", is_superuser=True, is_staff=True)
+        self.factory = APIRequestFactory()
+
+    def call(self, view_class, user, path="/", headers=None, **kwargs):
+        headers = dict(headers or {})
+        if user is not None:
+            headers["HTTP_AUTHORIZATION"] = f"Bearer {AccessToken.for_user(user)}"
+        view = view_class.as_view()
+        request = self.factory.get(path, **headers)
+        if asyncio.iscoroutinefunction(view):
+            response = async_to_sync(view)(request, **kwargs)
+        else:
+            response = view(request, **kwargs)
+        return response.render() if hasattr(response, "render") else response
+
+    def assertSameResponse(self, name, user, path="/", **kwargs):
+        sync_response = self.call(getattr(views, name), user, path, **kwargs)
+        async_response = self.call(getattr(async_views, name), user, path, **kwargs)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        if sync_response.status_code == 200:
+            self.assertEqual(json.loads(async_response.content), json.loads(sync_response.content))
+        return async_response
+
+    def test_same_data_as_sync_views(self):
+        student = self.students[0]
+        self.assertSameResponse("StudentMarksView", student.user, stud_id=student.pk)
+        self.assertSameResponse("StudentMarksView", student.user, "/?compact=1", stud_id=student.pk)
+        self.assertSameResponse("ProfessorMarkGroups", self.professor.user)
+        self.assertSameResponse("GroupMarksView", self.professor.user, mark_group_id=self.sheets[0].pk)
+        self.assertSameResponse("GroupMarksView", self.professor.user, mark_group_id=10 ** 6)
+        for user in (student.user, self.professor.user, self.admin):
+            self.assertSameResponse("CurrentUserView", user)
+
+    def test_auth_and_permissions(self):
+        self.assertSameResponse("ProfessorMarkGroups", None)
+        self.assertSameResponse("ProfessorMarkGroups", self.students[0].user)
+        response = self.call(async_views.GroupMarksView, None, headers={"HTTP_AUTHORIZATION": "Bearer nope"},
+                             mark_group_id=self.sheets[0].pk)
+        self.assertEqual(response.status_code, 401)
+
+    def test_conditional_and_cache(self):
+        student = self.students[0]
+        first = self.call(async_views.StudentMarksView, student.user, stud_id=student.pk)
+        self.assertEqual(first["X-Cache"], "MISS")
+        self.assertEqual(self.call(async_views.StudentMarksView, student.user, stud_id=student.pk)["X-Cache"], "HIT")
+        response = self.call(async_views.StudentMarksView, student.user, headers={"HTTP_IF_NONE_MATCH": first["ETag"]},
+                             stud_id=student.pk)
+        self.assertEqual(response.status_code, 304)
+
+    def test_writes_still_work(self):
+        row = self.sheets[0].studentmark_set.first()
+        request = self.factory.put("/", {"att1": 11, "att2": 12}, format="json")
+        force_authenticate(request, self.professor.user)
+        response = async_to_sync(async_views.GroupMarksView.as_view())(request, mark_group_id=row.pk)
+        self.assertEqual(response.status_code, 201)
+        row.refresh_from_db()
+        self.assertEqual((row.att1, row.att2), (11, 12))
+
+
+@override_settings(MARK_EVENTS_HEARTBEAT=0.05, MARK_EVENTS_LIVE="1")
+class MarkEventsTests(MarksDataMixin, TestCase):
+    def setUp(self):
+        self.professor, _, self.students, self.sheets = self.make_faculty(2, 2)
+        self.client = APIClient()
+
+    def stream_token(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.post(reverse("mark_events_token"))
+        self.client.force_authenticate(None)
+        self.assertEqual(response.status_code, 201)
+        return response.json()["token"]
+
+    def open_stream(self, url, user):
+        response = self.client.get(url, {"stream_token": self.stream_token(user)}, HTTP_ACCEPT="text/event-stream")
+        self.assertEqual(response.status_code, 200, getattr(response, "content", b""))
+        self.assertEqual(response["Content-Type"], "text/event-stream; charset=utf-8")
+        if hasattr(response.streaming_content, "__aiter__"):
+            response.close()
+            self.skipTest("async streams need one event loop throughout; see test_async_stream_and_overflow")
+        chunks = iter(response.streaming_content)
+        self.addCleanup(response.close)
+        self.assertTrue(next(chunks).decode().startswith("retry:"))
+        return chunks
+
+    def save_mark(self, sm, att1):
+        with self.captureOnCommitCallbacks(execute=True):
+            sm.att1 = att1
+            sm.save()
+
+    def test_student_stream(self):
+        student = self.students[0]
+        chunks = self.open_stream(reverse("student_mark_events", args=[student.pk]), student.user)
+        self.assertEqual(next(chunks), b": keepalive\n\n")
+
+        sm = self.sheets[0].studentmark_set.get(student=student)
+        self.save_mark(self.sheets[0].studentmark_set.get(student=self.students[1]), 1)
+        self.save_mark(sm, 10)
+        event, data = next(chunks).decode().splitlines()[:2]
+        sm.refresh_from_db()
+        self.assertEqual(event, "event: mark")
+        self.assertEqual(json.loads(data.removeprefix("data: ")),
+                         {"id": sm.pk, "mark_group": self.sheets[0].pk, "total": sm.total, "deleted": False})
+
+    def test_sheet_stream_gets_one_event_per_save(self):
+        gm = self.sheets[1]
+        chunks = self.open_stream(reverse("markgroup_events", args=[gm.pk]), self.professor.user)
+        marks = list(gm.studentmark_set.order_by("pk"))
+        with self.captureOnCommitCallbacks(execute=True):
+            save_marks(marks)
+        lines = next(chunks).decode().splitlines()
+        self.assertEqual(lines[0], "event: sheet")
+        self.assertEqual(json.loads(lines[1].removeprefix("data: "))["marks"], [sm.pk for sm in marks])
+
+    def test_permissions(self):
+        url = reverse("markgroup_events", args=[self.sheets[0].pk])
+        self.assertEqual(self.client.get(url, HTTP_ACCEPT="text/event-stream").status_code, 401)
+        other = self.make_professor("other").user
+        response = self.client.get(url, {"stream_token": self.stream_token(other)}, HTTP_ACCEPT="text/event-stream")
+        self.assertEqual(response.status_code, 404)
+
+        url = reverse("student_mark_events", args=[self.students[0].pk])
+        response = self.client.get(url, {"stream_token": self.stream_token(self.students[1].user)},
+                                   HTTP_ACCEPT="text/event-stream")
+        self.assertEqual(response.status_code, 403)
+        # Access tokens are long-lived and must not travel in URLs.
+        response = self.client.get(url, {"stream_token": str(AccessToken.for_user(self.students[0].user))},
+                                   HTTP_ACCEPT="text/event-stream")
+        self.assertEqual(response.status_code, 401)
+
+    def test_clients_poll_without_live_updates(self):
+        self.client.force_authenticate(self.students[0].user)
+        url = reverse("mark_events_token")
+        with override_settings(MARK_EVENTS_LIVE="auto", MARK_POLL_INTERVAL=30):
+            self.assertEqual(self.client.get(url).json(), {"live": False, "poll_interval": 30})
+            self.assertEqual(self.client.post(url).status_code, 404)
+            with override_settings(ASYNC_READ_VIEWS=True):
+                # LocalBroker cannot reach the streams of other server processes.
+                self.assertFalse(self.client.get(url).json()["live"])
+                with mock.patch("api.events.get_broker", return_value=object()):
+                    self.assertTrue(self.client.get(url).json()["live"])
+        self.assertTrue(self.client.get(url).json()["live"])
+
+    def test_live_updates_check(self):
+        with override_settings(ASYNC_READ_VIEWS=False):
+            self.assertEqual({m.id for m in check_live_updates(None)}, {"api.W003", "api.W004"})
+        with override_settings(MARK_EVENTS_LIVE="auto"):
+            self.assertEqual(check_live_updates(None), [])
+
+    @override_settings(MARK_EVENTS_MAX_AGE=0.2)
+    def test_stream_ends_after_max_age(self):
+        student = self.students[0]
+        chunks = self.open_stream(reverse("student_mark_events", args=[student.pk]), student.user)
+        self.assertTrue(set(chunks) <= {b": keepalive\n\n"})
+        self.assertNotIn(student_channel(student.pk), get_broker()._subscribers)
+
+    def test_async_stream_and_overflow(self):
+        broker = get_broker()
+        channel = student_channel(self.students[0].pk)
+
+        async def consume():
+            stream = aevent_stream([channel])
+            self.assertTrue((await stream.__anext__()).startswith("retry:"))
+            await asyncio.sleep(0)
+            # Published from another thread, like a request that saved marks.
+            thread = threading.Thread(target=publish, args=([(channel, {"event": "mark", "data": {"id": 1}})],))
+            thread.start()
+            thread.join()
+            first = await stream.__anext__()
+            for i in range(MAX_PENDING + 5):
+                broker.publish(channel, {"event": "mark", "data": {"id": i}})
+            await asyncio.sleep(0.01)
+            second = await stream.__anext__()
+            await stream.aclose()
+            return first, second
+
+        first, second = async_to_sync(consume)()
+        self.assertEqual(first, 'event: mark\ndata: {"id": 1}\n\n')
+        self.assertEqual(second, "event: resync\ndata: {}\n\n")
+        self.assertNotIn(channel, broker._subscribers)
+
+    def test_async_view(self):
+        student = self.students[0]
+        request = APIRequestFactory().get("/", {"stream_token": self.stream_token(student.user)},
+                                          HTTP_ACCEPT="text/event-stream")
+
+        async def consume():
+            response = await async_views.StudentMarkEventsView.as_view()(request, stud_id=student.pk)
+            chunks = response.streaming_content
+            preamble = await chunks.__anext__()
+            publish([(student_channel(student.pk), {"event": "mark", "data": {"id": 7}})])
+            event = await chunks.__anext__()
+            await chunks.aclose()
+            return response.status_code, preamble, event
+
+        status_code, preamble, event = async_to_sync(consume)()
+        self.assertEqual(status_code, 200)
+        self.assertTrue(preamble.startswith(b"retry:"))
+        self.assertEqual(event, b'event: mark\ndata: {"id": 7}\n\n')
+
+
+class MarkChangesTests(MarksDataMixin, TestCase):
+    def setUp(self):
+        self.professor, _, self.students, self.sheets = self.make_faculty(2, 3)
+        self.admin = self.make_user("admin", is_staff=True)
+        self.client = APIClient()
+
+    def feed(self, user, since=0, limit=1000):
+        self.client.force_authenticate(user)
+        response = self.client.get(reverse("mark_changes"), {"since": since, "limit": limit})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def sync(self, user, since=0, limit=1000):
+        rows, deleted = {}, set()
+        while True:
+            page = self.feed(user, since, limit)
+            for row in page["student_marks"]:
+                rows[row["id"]] = row
+            deleted.update(page["deleted"]["student_marks"])
+            since = page["cursor"]
+            if not page["has_more"]:
+                return rows, deleted, since
+
+    def test_feed_returns_only_changes(self):
+        rows, _, cursor = self.sync(self.admin, limit=4)
+        self.assertEqual(set(rows), set(StudentMark.objects.values_list("pk", flat=True)))
+
+        sm = self.sheets[0].studentmark_set.first()
+        sm.exam = 12
+        sm.save()
+        sm.exam = 13
+        sm.save()
+        with self.assertNumQueries(2):
+            page = self.feed(self.admin, cursor)
+        self.assertEqual([(row["id"], row["exam"]) for row in page["student_marks"]], [(sm.pk, 13)])
+        self.assertEqual(page["group_marks"], [])
+        self.assertGreater(page["cursor"], cursor)
+        self.assertEqual(self.feed(self.admin, page["cursor"])["student_marks"], [])
+
+    def test_deletes_and_new_rows(self):
+        _, _, cursor = self.sync(self.admin)
+        gm = self.sheets[1]
+        gm_pk, mark_ids = gm.pk, set(gm.studentmark_set.values_list("pk", flat=True))
+        gm.delete()
+        newcomer = self.make_student("newcomer", self.students[0].group)
+        page = self.feed(self.admin, cursor)
+        self.assertEqual(set(page["deleted"]["student_marks"]), mark_ids)
+        self.assertEqual(page["deleted"]["group_marks"], [gm_pk])
+        self.assertEqual([row["student"] for row in page["student_marks"]], [newcomer.pk])
+
+    def test_scoped_to_the_reader(self):
+        student = self.students[0]
+        rows, _, _ = self.sync(student.user)
+        self.assertEqual({row["student"] for row in rows.values()}, {student.pk})
+        self.assertEqual(len(self.feed(student.user)["group_marks"]), len(self.sheets))
+
+        other = self.make_professor("other")
+        self.assertEqual(self.feed(other.user)["student_marks"], [])
+        self.assertEqual(len(self.sync(self.professor.user)[0]), StudentMark.objects.count())
+
+    def test_deleted_sheet_stays_visible_to_its_readers(self):
+        student = self.students[0]
+        gm = self.sheets[0]
+        gm_pk, mark_ids = gm.pk, set(gm.studentmark_set.values_list("pk", flat=True))
+        professor_cursor = self.sync(self.professor.user)[2]
+        student_cursor = self.sync(student.user)[2]
+        student_mark = gm.studentmark_set.get(student=student).pk
+        gm.delete()
+
+        page = self.feed(self.professor.user, professor_cursor)
+        self.assertEqual(set(page["deleted"]["student_marks"]), mark_ids)
+        self.assertEqual(page["deleted"]["group_marks"], [gm_pk])
+        page = self.feed(student.user, student_cursor)
+        self.assertEqual(page["deleted"], {"student_marks": [student_mark], "group_marks": [gm_pk]})
+
+    def test_compaction_keeps_latest_entry_per_row(self):
+        sm = self.sheets[0].studentmark_set.first()
+        for exam in (1, 2, 3):
+            sm.exam = exam
+            sm.save()
+        MarkChange.objects.update(created_at=timezone.now() - timedelta(days=60))
+        before, _, _ = self.sync(self.admin)
+
+        removed = compact_changes(timedelta(days=30))
+        self.assertGreater(removed, 0)
+        self.assertEqual(MarkChange.objects.filter(kind="student_mark", object_id=sm.pk).count(), 1)
+        after, _, _ = self.sync(self.admin)
+        self.assertEqual(after, before)
+        self.assertEqual(after[sm.pk]["exam"], 3)
+
+    def test_invalid_cursor(self):
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get(reverse("mark_changes"), {"since": "x"}).status_code, 400)
+
+
+class SemesterSummaryTests(MarksDataMixin, TestCase):
+    def setUp(self):
+        self.professor, self.group, self.students, self.sheets = self.make_faculty(3, 2)
+        self.admin = self.make_user("admin", is_staff=True)
+        self.client = APIClient()
+
+    def expected(self):
+        rows = {}
+        for sm in StudentMark.objects.select_related("mark_group"):
+            row = rows.setdefault((sm.student_id, sm.mark_group.semester), {"totals": [], "passed": 0, "failed": 0})
+            row["totals"].append(sm.total)
+            if sm.total is not None:
+                row["passed" if sm.total >= PASS_TOTAL else "failed"] += 1
+        return {key: (len(row["totals"]), row["passed"], row["failed"], row["totals"].count(None), row["failed"])
+                for key, row in rows.items()}
+
+    def actual(self):
+        return {(summary.student_id, summary.semester):
+                (summary.subjects, summary.passed, summary.failed, summary.ungraded, summary.debts)
+                for summary in SemesterSummary.objects.all()}
+
+    def test_follows_mark_writes(self):
+        self.assertEqual(self.actual(), self.expected())
+        student = self.students[0]
+        sm = StudentMark.objects.get(student=student, mark_group=self.sheets[0])
+        sm.att1 = sm.att2 = sm.att3 = sm.exam = 10
+        sm.save()
+        summary = SemesterSummary.objects.get(student=student, semester=self.sheets[0].semester)
+        self.assertEqual((summary.passed, summary.failed, summary.debts), (0, 1, 1))
+        self.assertEqual(summary.average_total, sm.total)
+
+        marks = list(StudentMark.objects.filter(mark_group=self.sheets[1]))
+        for mark in marks:
+            mark.exam = None
+        save_marks(marks)
+        self.assertEqual(self.actual(), self.expected())
+
+    def test_sheet_moved_and_removed(self):
+        gm = self.sheets[2]
+        gm.semester = self.sheets[0].semester
+        gm.save()
+        self.assertEqual(self.actual(), self.expected())
+        self.assertEqual(SemesterSummary.objects.get(student=self.students[0], semester=gm.semester).subjects, 2)
+
+        gm.delete()
+        self.assertEqual(self.actual(), self.expected())
+
+    def test_large_sheet(self):
+        group = self.make_group("big")
+        users = User.objects.bulk_create(User(username=f"big{i}", email=f"big{i}@example.com") for i in range(1100))
+        Student.objects.bulk_create(Student(user=user, group=group, year_of_enrollment="2023",
+                                            record_book_number=user.username) for user in users)
+        gm = GroupMark.objects.create(subject=self.sheets[0].subject, professor=self.professor, group=group,
+                                      semester=5, reporting_level="e")
+        self.assertEqual(SemesterSummary.objects.filter(semester=5).count(), 1100)
+        gm.semester = 6
+        gm.save()
+        self.assertFalse(SemesterSummary.objects.filter(semester=5).exists())
+        self.assertEqual(SemesterSummary.objects.filter(semester=6, ungraded=1, debts=0).count(), 1100)
+
+    def test_ungraded_marks_are_debts_once_archived(self):
+        student = self.students[0]
+        sm = StudentMark.objects.get(student=student, mark_group=self.sheets[0])
+        sm.att1 = sm.att2 = sm.att3 = sm.exam = sm.additional = None
+        sm.save()
+        summary = SemesterSummary.objects.get(student=student, semester=self.sheets[0].semester)
+        self.assertEqual((summary.passed, summary.failed, summary.ungraded, summary.debts), (0, 0, 1, 0))
+
+        archive_sheets([self.sheets[0].pk])
+        summary.refresh_from_db()
+        self.assertEqual((summary.passed, summary.failed, summary.ungraded, summary.debts), (0, 0, 1, 1))
+        before = self.actual()
+        SemesterSummary.objects.all().delete()
+        call_command("rebuild_semester_summaries", stdout=io.StringIO())
+        self.assertEqual(self.actual(), before)
+
+    def test_rebuild_matches_incremental(self):
+        before = self.actual()
+        SemesterSummary.objects.all().delete()
+        out = io.StringIO()
+        call_command("rebuild_semester_summaries", chunk_size=1, stdout=out)
+        self.assertEqual(self.actual(), before)
+        self.assertIn(f"{len(before)} summaries of 2 students", out.getvalue())
+
+    def test_endpoints(self):
+        student = self.students[0]
+        self.client.force_authenticate(student.user)
+        response = self.client.get(reverse("student_semester_summary", args=[student.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["semester"] for row in response.json()], sorted(gm.semester for gm in self.sheets))
+        self.assertEqual(self.client.get(reverse("semester_summaries")).status_code, 403)
+
+        sm = StudentMark.objects.get(student=student, mark_group=self.sheets[0])
+        sm.exam = None
+        sm.save()
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse("semester_summaries"), {"has_debts": 1, "group": self.group.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row["student"], row["semester"]) for row in response.json()["results"]],
+                         [(student.pk, self.sheets[0].semester)])
+        response = self.client.get(reverse("semester_summaries"), {"semester": self.sheets[1].semester})
+        self.assertEqual(len(response.json()["results"]), 2)
+        self.assertEqual(self.client.get(reverse("semester_summaries"), {"semester": "x"}).status_code, 400)
+
+
+class MarkArchiveTests(MarksDataMixin, TestCase):
+    def setUp(self):
+        self.professor, self.group, self.students, self.sheets = self.make_faculty(3, 2)
+        # A second-year group: semesters 1 and 2 are over.
+        self.group.course_number = 2
+        self.group.save()
+        self.admin = self.make_user("admin", is_staff=True)
+        self.client = APIClient()
+
+    def transcript(self, student, **params):
+        transcripts.bump_all()
+        self.client.force_authenticate(student.user)
+        response = self.client.get(reverse("student_marks", args=[student.pk]), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def export(self, student):
+        self.client.force_authenticate(student.user)
+        response = self.client.get(reverse("student_marks_export", args=[student.pk]))
+        return b"".join(response.streaming_content) if not response.is_async else None
+
+    def archive(self, *args):
+        out = io.StringIO()
+        call_command("archive_marks", "--through-semester", "2", *args, stdout=out)
+        return out.getvalue()
+
+    def test_transcripts_read_the_archive(self):
+        student = self.students[0]
+        before = [self.transcript(student), self.transcript(student, compact=1)]
+        with override_settings(FAST_MARKS_SERIALIZATION=False):
+            before.append(self.transcript(student))
+        export = self.export(student)
+        summaries = list(SemesterSummary.objects.order_by("pk").values_list("semester", "subjects", "average_total"))
+
+        self.assertIn("2 sheets and 4 marks archived", self.archive())
+        self.assertEqual(list(GroupMark.objects.values_list("pk", flat=True)), [self.sheets[2].pk])
+        self.assertEqual(ArchivedStudentMark.objects.count(), 4)
+
+        after = [self.transcript(student), self.transcript(student, compact=1)]
+        with override_settings(FAST_MARKS_SERIALIZATION=False):
+            after.append(self.transcript(student))
+        self.assertEqual(after, before)
+        self.assertEqual([row["mark_group"]["semester"] for row in after[0]], [3, 2, 1])
+        self.assertEqual(self.export(student), export)
+        self.assertEqual(list(SemesterSummary.objects.order_by("pk")
+                              .values_list("semester", "subjects", "average_total")), summaries)
+
+    def test_archived_sheets_are_frozen(self):
+        self.archive("--group", str(self.group.pk))
+        self.client.force_authenticate(self.professor.user)
+        self.assertEqual([gm["id"] for gm in self.client.get(reverse("professor_markgroups")).json()],
+                         [self.sheets[2].pk])
+        response = self.client.put(reverse("professor_marksheet", args=[self.sheets[0].pk]), [], format="json")
+        self.assertEqual(response.status_code, 404)
+
+    def test_change_feed_follows_moved_rows(self):
+        self.client.force_authenticate(self.admin)
+        cursor = self.client.get(reverse("mark_changes"), {"limit": 5000}).json()["cursor"]
+        self.archive()
+        page = self.client.get(reverse("mark_changes"), {"since": cursor}).json()
+        archived = set(ArchivedStudentMark.objects.values_list("pk", flat=True))
+        self.assertEqual({row["id"] for row in page["student_marks"]}, archived)
+        self.assertEqual({row["id"] for row in page["group_marks"]}, {self.sheets[0].pk, self.sheets[1].pk})
+        self.assertEqual(page["deleted"], {"student_marks": [], "group_marks": []})
+
+        self.client.force_authenticate(self.students[0].user)
+        page = self.client.get(reverse("mark_changes"), {"since": cursor}).json()
+        self.assertEqual(len(page["student_marks"]), 2)
+        self.assertEqual(len(page["group_marks"]), 2)
+
+    def test_current_semesters_stay_live(self):
+        self.assertEqual([current_semester(self.group, date(2025, month, 1)) for month in (1, 2, 8, 9)], [3, 4, 4, 3])
+        freshmen = self.make_group("f-1")
+        self.make_student("fstud", freshmen)
+        sheets = [self.make_sheet(self.professor, self.sheets[i].subject, freshmen, semester=i + 1) for i in range(2)]
+
+        self.archive()
+        self.assertEqual(set(GroupMark.objects.values_list("pk", flat=True)),
+                         {self.sheets[2].pk, *(gm.pk for gm in sheets)})
+        with self.assertRaisesMessage(CommandError, f"Groups {freshmen.pk} have not finished semester 2"):
+            self.archive("--group", str(freshmen.pk))
+
+    def test_dry_run_and_restore(self):
+        self.assertIn("2 sheets and 4 marks would be archived", self.archive("--dry-run"))
+        self.assertEqual(ArchivedGroupMark.objects.count(), 0)
+        marks = set(StudentMark.objects.values_list("pk", "mark_group", "student", "total"))
+        self.archive()
+        self.assertIn("2 sheets and 4 marks restored", self.archive("--restore", "--chunk-size", "1"))
+        self.assertEqual(set(StudentMark.objects.values_list("pk", "mark_group", "student", "total")), marks)
+        self.assertFalse(ArchivedStudentMark.objects.exists())
@@ -1,9 +1,17 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework import routers
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView, TokenVerifyView
 
 from api.views import ProfessorViewSet, StudentViewSet, CurrentUserView, StudentMarksView, ProfessorMarkGroups, \
-    GroupMarksView
+    GroupMarksView, GroupMarkSheetView, GroupMarkAnalyticsView, FacultyAnalyticsView, RankingView, StudentRankingView, \
+    TranscriptCacheStatsView, GroupMarkImportView, GroupMarkExportView, StudentMarksExportView, MarksExportView, \
+    StudentMarkEventsView, GroupMarkEventsView, MarkChangesView, StudentSemesterSummaryView, SemesterSummaryListView, \
+    MarkEventsTokenView
+
+if settings.ASYNC_READ_VIEWS:
+    from api.async_views import StudentMarksView, ProfessorMarkGroups, GroupMarksView, CurrentUserView, \
+        StudentMarkEventsView, GroupMarkEventsView
 
 auth_router = routers.SimpleRouter()
 auth_router.register('auth/users/professors', ProfessorViewSet, basename="professors")
@@ -21,8 +29,24 @@ common_user_urlpatterns = [
 
 marks_user_urlpatterns = [
     path('marks/<int:stud_id>', StudentMarksView.as_view(), name='student_marks'),
+    path('marks/<int:stud_id>/export', StudentMarksExportView.as_view(), name='student_marks_export'),
+    path('marks/<int:stud_id>/events', StudentMarkEventsView.as_view(), name='student_mark_events'),
+    path('marks/<int:stud_id>/summary', StudentSemesterSummaryView.as_view(), name='student_semester_summary'),
+    path('marks/changes', MarkChangesView.as_view(), name='mark_changes'),
+    path('marks/events/token', MarkEventsTokenView.as_view(), name='mark_events_token'),
+    path('marks/summary', SemesterSummaryListView.as_view(), name='semester_summaries'),
+    path('marks/export', MarksExportView.as_view(), name='marks_export'),
     path('marks/professor', ProfessorMarkGroups.as_view(), name='professor_markgroups'),
-    path('marks/professor/<int:mark_group_id>', GroupMarksView.as_view(), name='professor_markgroups')
+    path('marks/professor/<int:mark_group_id>', GroupMarksView.as_view(), name='professor_markgroups'),
+    path('marks/professor/<int:mark_group_id>/sheet', GroupMarkSheetView.as_view(), name='professor_marksheet'),
+    path('marks/professor/<int:mark_group_id>/export', GroupMarkExportView.as_view(), name='professor_markexport'),
+    path('marks/professor/<int:mark_group_id>/events', GroupMarkEventsView.as_view(), name='markgroup_events'),
+    path('marks/professor/<int:mark_group_id>/import', GroupMarkImportView.as_view(), name='professor_markimport'),
+    path('marks/professor/<int:mark_group_id>/analytics', GroupMarkAnalyticsView.as_view(), name='markgroup_analytics'),
+    path('marks/analytics', FacultyAnalyticsView.as_view(), name='faculty_analytics'),
+    path('marks/cache/stats', TranscriptCacheStatsView.as_view(), name='transcript_cache_stats'),
+    path('marks/ranking/student/<int:stud_id>', StudentRankingView.as_view(), name='student_ranking'),
+    path('marks/ranking/<str:scope>/<int:scope_id>', RankingView.as_view(), name='ranking'),
 ]
 
 urlpatterns = []
@@ -1,24 +1,110 @@
+from django.conf import settings as django_settings
 from django.contrib.auth.tokens import default_token_generator
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django.shortcuts import render
 from djoser.conf import settings
 from djoser.permissions import CurrentUserOrAdmin
 from drf_spectacular.utils import extend_schema
 from rest_framework import status
-from rest_framework.exceptions import NotFound
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework.generics import ListAPIView
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.renderers import BrowsableAPIRenderer, BaseRenderer, JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
-from api.models import Student, Professor, StudentMark, GroupMark
+from api.analytics import sheet_statistics, faculty_statistics
+from api.cache import transcripts
+from api.authentication import query_token_authentication, stream_token_for
+from api.changes import visible_changes, changes_since, MAX_LIMIT
+from api.conditional import conditional, transcript_state, professor_groups_state, sheet_state, current_user_state
+from api.events import event_stream, live_updates, student_channel, mark_group_channel
+from api.exports import csv_response, is_asgi
+from api.fastpath import FastJSONRenderer, serialize_rows
+from api.imports import import_marks
+from api.models import User, Student, Professor, StudentMark, GroupMark, Subject, Direction, SemesterSummary, \
+    ArchivedStudentMark, CourseGroup
+from api.pagination import KeysetPagination
 from api.permissions import IsProfessor
+from api.provisioning import provision_users
+from api.ranking import rankings, course_scope, SCOPES
+from api.routers import ReplicaReadsMixin, reading_from_replica, replica_version, replica_allowed
+from api.search import search_students
+from api.tabular import TabularError
 from api.serializers import StudentSerializer, StudentCreateSerializer, ProfessorSerializer, ProfessorCreateSerializer, \
-    MyUserSerializer, StudentMarksSerializer, GroupMarkSerializer, SimpleStudentMarksSerializer
+    MyUserSerializer, StudentMarksSerializer, GroupMarkSerializer, SimpleStudentMarksSerializer, MarkSheetRowSerializer, \
+    SemesterSummarySerializer, ArchivedStudentMarksSerializer, sideload_marks
+
+
+def wants_compact(request):
+    return request.query_params.get("compact") in ("1", "true")
+
+
+def serialize_marks(request, marks):
+    """Serialize a plain StudentMark queryset in the format the request asked for."""
+    if wants_compact(request):
+        return sideload_marks(marks.with_related())
+    if getattr(django_settings, "FAST_MARKS_SERIALIZATION", True):
+        return serialize_rows(StudentMarksSerializer, marks)
+    return list(StudentMarksSerializer(marks.with_related(), many=True).data)
+
+
+def transcript_marks(stud_id):
+    """The live and the archived marks of a student, newest semester first."""
+    return (StudentMark.objects.filter(student=stud_id).order_by("-mark_group__semester"),
+            ArchivedStudentMark.objects.filter(student=stud_id).order_by("-mark_group__semester"))
+
+
+def transcript_variant(request):
+    """Transcript cache variant of the request; None when its data cannot be cached."""
+    variant = "compact" if wants_compact(request) else "full"
+    if not reading_from_replica():
+        return variant
+    # Replica data may predate the last version bump; tie it to the replica snapshot.
+    version = replica_version()
+    return None if version is None else f"{variant}:replica:{version}"
+
+
+def serialize_transcript(request, stud_id):
+    """serialize_marks() for the transcript of a student, archived semesters included."""
+    marks, archived = transcript_marks(stud_id)
+    if wants_compact(request):
+        rows = [*marks.with_related(), *archived.with_related()]
+        return sideload_marks(sorted(rows, key=lambda sm: -sm.mark_group.semester))
+    if getattr(django_settings, "FAST_MARKS_SERIALIZATION", True):
+        return serialize_rows(StudentMarksSerializer, marks, [archived])
+    rows = [*StudentMarksSerializer(marks.with_related(), many=True).data,
+            *ArchivedStudentMarksSerializer(archived.with_related(), many=True).data]
+    return sorted(rows, key=lambda row: -row["mark_group"]["semester"])
+
+
+def provision_response(request, role):
+    upload = request.FILES.get("file")
+    if upload is None:
+        return Response({"file": ["Файл не передан."]}, status=status.HTTP_400_BAD_REQUEST)
+
+    dry_run = request.query_params.get("dry_run") in ("1", "true")
+    try:
+        # No process pool inside a request: forking a threaded server worker is unsafe, and a pool per
+        # upload costs more than it saves. Large rosters go through the provision_users command.
+        report = provision_users(role, upload, upload.name, dry_run=dry_run, workers=1)
+    except TabularError as e:
+        return Response({"file": [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+    if report["error_count"] and not dry_run:
+        return Response(report, status=status.HTTP_400_BAD_REQUEST)
+    return Response(report, status=status.HTTP_201_CREATED if report["created"] else status.HTTP_200_OK)
 
 
 class ProfessorViewSet(ModelViewSet):
     serializer_class = ProfessorSerializer
-    queryset = Professor.objects.all()
+    queryset = Professor.objects.select_related("user").prefetch_related("subjects")
+    pagination_class = KeysetPagination
+    keyset_ordering_fields = {"name": "sort_name"}
     token_generator = default_token_generator
     lookup_field = settings.USER_ID_FIELD
     permission_classes = [IsAdminUser, ]
@@ -44,7 +130,7 @@ class ProfessorViewSet(ModelViewSet):
         user = self.request.user
         queryset = super().get_queryset()
         if settings.HIDE_USERS and self.action == "list" and not user.is_staff and user.get_role() == "professor":
-            queryset = queryset.filter(pk=user.professor.pk)
+            queryset = queryset.filter(user=user.pk)
         return queryset
 
     def get_permissions(self):
@@ -52,10 +138,20 @@ class ProfessorViewSet(ModelViewSet):
             self.permission_classes = [CurrentUserOrAdmin, ]
         return super().get_permissions()
 
+    @extend_schema(request={"multipart/form-data": {
+        "type": "object",
+        "properties": {"file": {"type": "string", "format": "binary"}},
+    }})
+    @action(detail=False, methods=["post"], parser_classes=[MultiPartParser])
+    def provision(self, request, *args, **kwargs):
+        return provision_response(request, "professor")
+
 
 class StudentViewSet(ModelViewSet):
     serializer_class = StudentSerializer
-    queryset = Student.objects.all()
+    queryset = Student.objects.select_related("user", "group")
+    pagination_class = KeysetPagination
+    keyset_ordering_fields = {"name": "search_text", "record_book_number": "record_book_number"}
     token_generator = default_token_generator
     lookup_field = settings.USER_ID_FIELD
     permission_classes = [IsAdminUser, ]
@@ -85,29 +181,51 @@ class StudentViewSet(ModelViewSet):
         user = self.request.user
         queryset = super().get_queryset()
         if settings.HIDE_USERS and self.action == "list" and not user.is_staff and user.get_role() == "student":
-            queryset = queryset.filter(pk=user.student.pk)
+            queryset = queryset.filter(user=user.pk)
         return queryset
 
     def get_permissions(self):
         if self.action in ("retrieve", "update", "partial_update", "list"):
             self.permission_classes = [CurrentUserOrAdmin, ]
+        elif self.action == "search":
+            self.permission_classes = [IsProfessor | IsAdminUser, ]
         return super().get_permissions()
 
+    @extend_schema(responses={status.HTTP_200_OK: StudentSerializer(many=True)})
+    @action(detail=False, methods=["get"])
+    def search(self, request, *args, **kwargs):
+        try:
+            limit = min(max(int(request.query_params.get("limit", 20)), 1), 100)
+        except ValueError:
+            return Response({"limit": ["Ожидается целое число."]}, status=status.HTTP_400_BAD_REQUEST)
+        students = search_students(request.query_params.get("q", ""), limit,
+                                   Student.objects.select_related("user", "group"))
+        return Response(StudentSerializer(students, many=True).data, status=status.HTTP_200_OK)
+
+    @extend_schema(request={"multipart/form-data": {
+        "type": "object",
+        "properties": {"file": {"type": "string", "format": "binary"}},
+    }})
+    @action(detail=False, methods=["post"], parser_classes=[MultiPartParser])
+    def provision(self, request, *args, **kwargs):
+        return provision_response(request, "student")
+
 
 class CurrentUserView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional(current_user_state)
     def get(self, request, *args, **kwargs):
         user = request.user
         serializer = None
         if user.get_role() == "student":
-            s = user.student
+            s = get_object_or_404(Student.objects.select_related("user", "group"), user=user.pk)
             serializer = StudentSerializer(s)
         elif user.get_role() == "professor":
-            p = user.professor
+            p = get_object_or_404(Professor.objects.select_related("user").prefetch_related("subjects"), user=user.pk)
             serializer = ProfessorSerializer(p)
         elif user.get_role() == "admin":
-            serializer = MyUserSerializer(user)
+            serializer = MyUserSerializer(get_object_or_404(User, pk=user.pk))
             serializer = type("TmpUser", (object,), {
                 "data": {
                     "id": -1,
@@ -118,23 +236,188 @@ class CurrentUserView(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class StudentMarksView(APIView):
+class StudentMarksView(ReplicaReadsMixin, APIView):
     permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
     @extend_schema(request=None, responses={
         status.HTTP_200_OK: StudentMarksSerializer(many=True)
     })
+    @conditional(transcript_state)
     def get(self, request, stud_id, *args, **kwargs):
-        try:
-            student_marks = StudentMark.objects.filter(student=stud_id).order_by("-mark_group__semester")
-        except Student.DoesNotExist:
-            student_marks = None
+        variant = transcript_variant(request)
+        if variant is None:
+            data, cache_status = serialize_transcript(request, stud_id), "BYPASS"
+        else:
+            key = transcripts.key(stud_id, variant=variant)
+            data = transcripts.get(key)
+            cache_status = "HIT"
+            if data is None:
+                cache_status = "MISS"
+                data = serialize_transcript(request, stud_id)
+                transcripts.set(key, data)
+
+        response = Response(data, status=status.HTTP_200_OK)
+        response["X-Cache"] = cache_status
+        return response
+
+
+class StudentSemesterSummaryView(ReplicaReadsMixin, APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(request=None, responses={
+        status.HTTP_200_OK: SemesterSummarySerializer(many=True)
+    })
+    def get(self, request, stud_id, *args, **kwargs):
+        summaries = SemesterSummary.objects.filter(student=stud_id).order_by("semester")
+        return Response(SemesterSummarySerializer(summaries, many=True).data, status=status.HTTP_200_OK)
 
-        if not student_marks:
-            Response({}, status=status.HTTP_404_NOT_FOUND)
 
-        stud_marks = StudentMarksSerializer(student_marks, many=True)
-        return Response(stud_marks.data, status=status.HTTP_200_OK)
+class SemesterSummaryListView(ReplicaReadsMixin, ListAPIView):
+    """Semester summaries across students, e.g. ?semester=3&has_debts=1 for the dean's debtors list."""
+    permission_classes = [IsAdminUser]
+    serializer_class = SemesterSummarySerializer
+    pagination_class = KeysetPagination
+    keyset_ordering_fields = {"semester": "semester", "debts": "debts"}
+
+    def get_queryset(self):
+        summaries = SemesterSummary.objects.all()
+        params = self.request.query_params
+        for param, lookup in (("semester", "semester"), ("group", "student__group")):
+            value = params.get(param)
+            if value is not None:
+                if not value.isdigit():
+                    raise ValidationError({param: ["Ожидается целое число."]})
+                summaries = summaries.filter(**{lookup: int(value)})
+        has_debts = params.get("has_debts")
+        if has_debts in ("1", "true"):
+            summaries = summaries.filter(debts__gt=0)
+        elif has_debts in ("0", "false"):
+            summaries = summaries.filter(debts=0)
+        return summaries
+
+
+class StudentMarksExportView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, stud_id, *args, **kwargs):
+        marks = StudentMark.objects.filter(student=stud_id) \
+            .order_by("mark_group__semester", "mark_group__subject__name", "pk")
+        return csv_response(marks, f"transcript-{stud_id}.csv", replica_allowed(request.user),
+                            archived=ArchivedStudentMark.objects.filter(student=stud_id),
+                            asynchronous=is_asgi(request))
+
+
+class MarksExportView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        direction, semester = request.query_params.get("direction"), request.query_params.get("semester")
+        if direction is None or not direction.isdigit():
+            return Response({"direction": ["Ожидается целое число."]}, status=status.HTTP_400_BAD_REQUEST)
+        filters = {"mark_group__subject__directions": int(direction)}
+        if semester is not None:
+            if not semester.isdigit():
+                return Response({"semester": ["Ожидается целое число."]}, status=status.HTTP_400_BAD_REQUEST)
+            filters["mark_group__semester"] = int(semester)
+        marks = StudentMark.objects.filter(**filters).order_by(
+            "mark_group__semester", "mark_group__subject__name", "student__group__group_number",
+            "student__search_text", "pk")
+        filename = f"direction-{direction}" + (f"-semester-{semester}" if semester else "") + ".csv"
+        return csv_response(marks, filename, replica_allowed(request.user),
+                            archived=ArchivedStudentMark.objects.filter(**filters), asynchronous=is_asgi(request))
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets EventSource requests (Accept: text/event-stream) through content negotiation; errors stay JSON."""
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return JSONRenderer().render(data)
+
+
+def event_stream_response(stream):
+    response = StreamingHttpResponse(stream, content_type="text/event-stream; charset=utf-8")
+    response["Cache-Control"] = "no-cache"
+    # Keep nginx from buffering the stream.
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+class MarkEventsView(APIView):
+    """Server-sent events for the channels returned by `channels()`; the token may come in ?stream_token=."""
+    authentication_classes = [query_token_authentication(), *APIView.authentication_classes]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def channels(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        return event_stream_response(event_stream(self.channels(request, *args, **kwargs)))
+
+
+class StudentMarkEventsView(MarkEventsView):
+    permission_classes = [IsAuthenticated]
+
+    def channels(self, request, stud_id, *args, **kwargs):
+        student = get_object_or_404(Student, pk=stud_id)
+        user = request.user
+        if not (user.is_staff or user.get_role() == "professor" or student.user_id == user.pk):
+            raise PermissionDenied()
+        return [student_channel(student.pk)]
+
+
+class GroupMarkEventsView(MarkEventsView):
+    permission_classes = [IsProfessor | IsAdminUser]
+
+    def channels(self, request, mark_group_id, *args, **kwargs):
+        gms = GroupMark.objects.all()
+        if not request.user.is_staff:
+            gms = gms.filter(professor__user=request.user.pk)
+        gm = get_object_or_404(gms, pk=mark_group_id)
+        return [mark_group_channel(gm.pk)]
+
+
+class MarkEventsTokenView(APIView):
+    """A short-lived token for ?stream_token= of the event streams, which EventSource cannot authenticate.
+
+    GET tells clients whether to open streams at all or to poll instead.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        return Response({"live": live_updates(), "poll_interval": getattr(django_settings, "MARK_POLL_INTERVAL", 60)},
+                        status=status.HTTP_200_OK)
+
+    def post(self, request, *args, **kwargs):
+        if not live_updates():
+            raise NotFound("Обновления в реальном времени отключены.")
+        token = stream_token_for(request)
+        return Response({"token": str(token), "expires_in": int(token.lifetime.total_seconds())},
+                        status=status.HTTP_201_CREATED)
+
+
+class MarkChangesView(ReplicaReadsMixin, APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request, *args, **kwargs):
+        params = {"since": request.query_params.get("since", "0"), "limit": request.query_params.get("limit", "1000")}
+        for name, value in params.items():
+            if not value.isdigit():
+                return Response({name: ["Ожидается целое число."]}, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(max(int(params["limit"]), 1), MAX_LIMIT)
+        data = changes_since(visible_changes(request.user), int(params["since"]), limit)
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class TranscriptCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(transcripts.stats(), status=status.HTTP_200_OK)
 
 
 class ProfessorMarkGroups(APIView):
@@ -143,37 +426,31 @@ class ProfessorMarkGroups(APIView):
     @extend_schema(request=None, responses={
         status.HTTP_200_OK: GroupMarkSerializer(many=True)
     })
+    @conditional(professor_groups_state)
     def get(self, request, *args, **kwargs):
-        gms = GroupMark.objects.filter(professor=request.user.professor)
+        gms = GroupMark.objects.filter(professor__user=request.user.pk).with_related()
         serializer = GroupMarkSerializer(gms, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
 class GroupMarksView(APIView):
     permission_classes = [IsProfessor]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
     @extend_schema(request=None, responses={
         status.HTTP_200_OK: StudentMarksSerializer(many=True)
     })
+    @conditional(sheet_state)
     def get(self, request, mark_group_id, *args, **kwargs):
+        sms = StudentMark.objects.filter(mark_group=mark_group_id, student__group=F("mark_group__group")) \
+            .order_by("student")
+        data = serialize_marks(request, sms)
 
-        try:
-            gm = GroupMark.objects.get(pk=mark_group_id)
-        except GroupMark.DoesNotExist:
-            gm = None
+        rows = data["marks"] if wants_compact(request) else data
+        if not rows and not GroupMark.objects.filter(pk=mark_group_id).exists():
+            return Response({}, status=status.HTTP_404_NOT_FOUND)
 
-        if not gm:
-            Response({}, status=status.HTTP_404_NOT_FOUND)
-
-        group_students = gm.group.student_group.all()
-
-        sms = []
-        for student in group_students:
-            res = StudentMark.objects.get_or_create(mark_group=gm, student=student)
-            sms.append(res[0])
-
-        serializer = StudentMarksSerializer(sms, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(data, status=status.HTTP_200_OK)
 
     @extend_schema(request=SimpleStudentMarksSerializer,
                    responses={
@@ -198,3 +475,152 @@ class GroupMarksView(APIView):
         serializer = StudentMarksSerializer(instance)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+
+
+class GroupMarkSheetView(APIView):
+    permission_classes = [IsProfessor]
+
+    @extend_schema(request=MarkSheetRowSerializer(many=True),
+                   responses={
+                       status.HTTP_200_OK: SimpleStudentMarksSerializer(many=True)
+                   })
+    def put(self, request, mark_group_id, *args, **kwargs):
+        gm = get_object_or_404(GroupMark, pk=mark_group_id, professor__user=request.user.pk)
+        sheet = {sm.pk: sm for sm in gm.studentmark_set.all()}
+
+        serializer = MarkSheetRowSerializer(list(sheet.values()), data=request.data, many=True,
+                                            context={"sheet": sheet})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        sms = serializer.save()
+
+        return Response(SimpleStudentMarksSerializer(sms, many=True).data, status=status.HTTP_200_OK)
+
+
+class GroupMarkExportView(APIView):
+    permission_classes = [IsProfessor | IsAdminUser]
+
+    def get(self, request, mark_group_id, *args, **kwargs):
+        gms = GroupMark.objects.all()
+        if not request.user.is_staff:
+            gms = gms.filter(professor__user=request.user.pk)
+        gm = get_object_or_404(gms, pk=mark_group_id)
+        marks = StudentMark.objects.filter(mark_group=gm, student__group=F("mark_group__group")) \
+            .order_by("student__search_text", "student")
+        return csv_response(marks, f"sheet-{gm.pk}.csv", replica_allowed(request.user),
+                            asynchronous=is_asgi(request))
+
+
+class GroupMarkImportView(APIView):
+    permission_classes = [IsProfessor]
+    parser_classes = [MultiPartParser]
+
+    @extend_schema(request={"multipart/form-data": {
+        "type": "object",
+        "properties": {"file": {"type": "string", "format": "binary"}},
+    }})
+    def post(self, request, mark_group_id, *args, **kwargs):
+        gm = get_object_or_404(GroupMark, pk=mark_group_id, professor__user=request.user.pk)
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response({"file": ["Файл не передан."]}, status=status.HTTP_400_BAD_REQUEST)
+
+        dry_run = request.query_params.get("dry_run") in ("1", "true")
+        try:
+            report = import_marks(gm, upload, upload.name, dry_run=dry_run)
+        except TabularError as e:
+            return Response({"file": [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+        if report["error_count"] and not dry_run:
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_200_OK)
+
+
+class GroupMarkAnalyticsView(ReplicaReadsMixin, APIView):
+    permission_classes = [IsProfessor | IsAdminUser]
+
+    def get(self, request, mark_group_id, *args, **kwargs):
+        gms = GroupMark.objects.all()
+        if not request.user.is_staff:
+            gms = gms.filter(professor__user=request.user.pk)
+        gm = get_object_or_404(gms, pk=mark_group_id)
+        sms = StudentMark.objects.filter(mark_group=gm, student__group=gm.group_id)
+        return Response({"mark_group": gm.pk, **sheet_statistics(sms)}, status=status.HTTP_200_OK)
+
+
+class FacultyAnalyticsView(ReplicaReadsMixin, APIView):
+    permission_classes = [IsAdminUser]
+    filters = {
+        "subject": "mark_group__subject",
+        "direction": "mark_group__subject__directions",
+        "semester": "mark_group__semester",
+    }
+
+    def get(self, request, *args, **kwargs):
+        sms = StudentMark.objects.all()
+        for param, lookup in self.filters.items():
+            value = request.query_params.get(param)
+            if value is not None:
+                if not value.isdigit():
+                    return Response({param: ["Ожидается целое число."]}, status=status.HTTP_400_BAD_REQUEST)
+                sms = sms.filter(**{lookup: int(value)})
+
+        stats = faculty_statistics(sms)
+        subjects = Subject.objects.in_bulk({row["subject"] for row in stats})
+        directions = Direction.objects.in_bulk({row["direction"] for row in stats} - {None})
+        for row in stats:
+            row["subject_name"] = subjects[row["subject"]].name
+            row["direction_name"] = directions[row["direction"]].name if row["direction"] else None
+        return Response(stats, status=status.HTTP_200_OK)
+
+
+class RankingView(ReplicaReadsMixin, APIView):
+    permission_classes = [IsProfessor | IsAdminUser]
+    student_fields = ("pk", "record_book_number", "user__last_name", "user__first_name", "user__patronymic",
+                      "group__group_number")
+
+    def get(self, request, scope, scope_id, *args, **kwargs):
+        if scope not in SCOPES:
+            raise NotFound()
+        try:
+            offset = max(int(request.query_params.get("offset", 0)), 0)
+            limit = min(max(int(request.query_params.get("limit", 50)), 1), 500)
+        except ValueError:
+            return Response({"detail": "offset и limit должны быть целыми числами."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        key, extra = scope_id, {}
+        if scope == "course":
+            # Course numbers repeat across education levels.
+            levels = dict(CourseGroup.EDUCATION_LEVELS)
+            level = request.query_params.get("level")
+            if level not in levels:
+                return Response({"level": [f"Укажите ступень: {', '.join(levels)}."]},
+                                status=status.HTTP_400_BAD_REQUEST)
+            key, extra = (scope_id, level), {"level": level}
+
+        index = rankings.get(scope, key)
+        rows = index.page(offset, limit)
+        students = {st["pk"]: st for st in Student.objects.filter(pk__in=[row["student"] for row in rows])
+                    .values(*self.student_fields)}
+        for row in rows:
+            row["student"] = students.get(row["student"], {"pk": row["student"]})
+        return Response({"scope": scope, "id": scope_id, **extra, "count": len(index), "results": rows},
+                        status=status.HTTP_200_OK)
+
+
+class StudentRankingView(ReplicaReadsMixin, APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, stud_id, *args, **kwargs):
+        student = get_object_or_404(Student.objects.select_related("group"), pk=stud_id)
+        res = {"group": None, "course": None, "directions": []}
+        if student.group_id is not None:
+            res["group"] = rankings.get("group", student.group_id).position(student.pk)
+            res["course"] = rankings.get("course", course_scope(student.group)).position(student.pk)
+        directions = StudentMark.objects.filter(student=student, total__isnull=False) \
+            .exclude(mark_group__subject__directions=None) \
+            .values_list("mark_group__subject__directions", "mark_group__subject__directions__name") \
+            .distinct().order_by("mark_group__subject__directions")
+        for direction, name in directions:
+            position = rankings.get("direction", direction).position(student.pk)
+            res["directions"].append({"direction": direction, "name": name, **(position or {})})
+        return Response(res, status=status.HTTP_200_OK)
@@ -56,6 +56,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "api.routers.ReplicaPinMiddleware",
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -80,6 +81,9 @@ WSGI_APPLICATION = "config.wsgi.application"
 
 HIDE_USERS = True
 
+# Seconds after which an in-process ranking index is rebuilt to pick up writes of other workers.
+RANKING_INDEX_TTL = int(os.getenv("RANKING_INDEX_TTL", 300))
+
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
@@ -87,9 +91,93 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Keep connections (and their page cache and memory map) between requests.
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", 600)),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "timeout": 5,
+        },
+    }
+}
+
+# Optional read replica for reports and analytics (api/routers.py). For a local replica point
+# REPLICA_DATABASE at a second file and refresh it with `manage.py sync_replica --interval 10`.
+REPLICA_DATABASE_ALIAS = "replica"
+if os.getenv("REPLICA_DATABASE"):
+    DATABASES[REPLICA_DATABASE_ALIAS] = {
+        **DATABASES["default"],
+        "NAME": os.getenv("REPLICA_DATABASE"),
+        "TEST": {"MIRROR": "default"},
     }
+DATABASE_ROUTERS = ["api.routers.ReplicaRouter"]
+# After a write the user reads from the primary for this long; keep it above the sync interval.
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", 30))
+# Pins must be seen by every worker; REPLICA_PIN_CACHE_BACKEND picks the cache below.
+REPLICA_PIN_CACHE_ALIAS = "replica_pins"
+
+# Applied to every new SQLite connection (api/sqlite.py); synchronous=NORMAL is durable across
+# application crashes in WAL mode. `manage.py check --database default` reports the effective values.
+SQLITE_PRAGMAS = {
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "normal"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000)),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_KIB", 64 * 1024)),
+    "temp_store": "memory",
+}
+# The journal mode is stored in the database file, so it is left alone unless the deployment sets
+# SQLITE_JOURNAL_MODE=wal (readers then never wait for the writer). Unset, commands run against the
+# development database do not rewrite it.
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE")
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# TRANSCRIPT_CACHE_BACKEND: "locmem" (per process), "file" (shared by the workers of one host)
+# or "db", a shared cache stand-in stored in the database (run `manage.py createcachetable`).
+
+TRANSCRIPT_CACHE_BACKENDS = {
+    "locmem": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "transcripts",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+    "file": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv("TRANSCRIPT_CACHE_LOCATION", BASE_DIR / "cache" / "transcripts"),
+    },
+    "db": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "transcript_cache",
+    },
+}
+
+# REPLICA_PIN_CACHE_BACKEND: "file" (shared by the workers of one host), "db" (shared by all hosts,
+# run `manage.py createcachetable`) or "locmem" (a single worker only).
+REPLICA_PIN_CACHE_BACKENDS = {
+    "locmem": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "replica-pins",
+    },
+    "file": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv("REPLICA_PIN_CACHE_LOCATION", BASE_DIR / "cache" / "replica-pins"),
+    },
+    "db": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "replica_pin_cache",
+    },
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "transcripts": TRANSCRIPT_CACHE_BACKENDS[os.getenv("TRANSCRIPT_CACHE_BACKEND", "locmem")],
+    "replica_pins": REPLICA_PIN_CACHE_BACKENDS[os.getenv("REPLICA_PIN_CACHE_BACKEND", "file")],
+}
+
+TRANSCRIPT_CACHE_ALIAS = "transcripts"
+TRANSCRIPT_CACHE_TIMEOUT = int(os.getenv("TRANSCRIPT_CACHE_TIMEOUT", 24 * 60 * 60))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -133,21 +221,57 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "api.User"
 
+# Build request.user from access token claims instead of loading the User row on every request.
+STATELESS_JWT = os.getenv("STATELESS_JWT", "0") == "1"
+# Seconds between reloads of the revoked/deactivated users set used in stateless mode.
+TOKEN_REVOCATION_REFRESH = int(os.getenv("TOKEN_REVOCATION_REFRESH", 30))
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'api.authentication.StatelessJWTAuthentication' if STATELESS_JWT else
         'rest_framework_simplejwt.authentication.JWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ]
 }
 
+# Default page size of the keyset-paginated list endpoints (?page_size= overrides it, up to 500).
+KEYSET_PAGE_SIZE = int(os.getenv("KEYSET_PAGE_SIZE", 50))
+
+# Build full-format marks responses from value rows instead of nested model serializers.
+FAST_MARKS_SERIALIZATION = os.getenv("FAST_MARKS_SERIALIZATION", "1") == "1"
+
+# Serve the read-heavy endpoints with the async views of api.async_views (set by config/asgi.py).
+ASYNC_READ_VIEWS = os.getenv("ASYNC_READ_VIEWS", "0") == "1"
+
+# Pub/sub behind the mark event streams; LocalBroker only reaches streams of the same process,
+# so a deployment with several processes needs a broker they share (see api/events.py).
+MARK_EVENTS_BROKER = os.getenv("MARK_EVENTS_BROKER", "api.events.LocalBroker")
+# Whether clients are told to open event streams rather than poll. "auto": only when served by ASGI
+# with a broker other than LocalBroker; "1" also suits a single ASGI process with LocalBroker.
+MARK_EVENTS_LIVE = os.getenv("MARK_EVENTS_LIVE", "auto")
+# Seconds between polls of clients without event streams; polls are conditional requests.
+MARK_POLL_INTERVAL = int(os.getenv("MARK_POLL_INTERVAL", 60))
+# Seconds between keepalive comments on an idle event stream.
+MARK_EVENTS_HEARTBEAT = int(os.getenv("MARK_EVENTS_HEARTBEAT", 15))
+# Seconds after which an event stream ends and the browser reconnects; bounds streams of departed clients.
+MARK_EVENTS_MAX_AGE = int(os.getenv("MARK_EVENTS_MAX_AGE", 300))
+# Lifetime of the tokens that open event streams (they travel in URLs).
+MARK_EVENTS_TOKEN_LIFETIME = timedelta(seconds=int(os.getenv("MARK_EVENTS_TOKEN_LIFETIME", 60)))
+
+# Processes used to hash passwords during bulk user provisioning (0: one per CPU).
+PROVISIONING_WORKERS = int(os.getenv("PROVISIONING_WORKERS", 0))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=366),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=10000),
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_OBTAIN_SERIALIZER': 'api.authentication.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'api.authentication.ClaimsTokenRefreshSerializer',
+    'TOKEN_USER_CLASS': 'api.authentication.ClaimsUser',
 }
 
 SPECTACULAR_SETTINGS = {